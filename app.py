@@ -1,30 +1,44 @@
 # -*- coding: utf-8 -*-
+import time
+_T_IMPORT = time.perf_counter()
 import streamlit as st
 import pandas as pd
-import json
 import os
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import yfinance as yf
-import twstock
-import gspread
-import requests
-import re
-import urllib3
-# ✅ 修正 1: 補上 date import，避免 is_active() 噴錯
-from datetime import datetime, date
-from google.oauth2.service_account import Credentials
+import hashlib
+import hmac
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
 from zoneinfo import ZoneInfo
-from requests.exceptions import SSLError
-
-# 忽略 SSL 警告
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from urllib.parse import urlparse
+import ohlcv_store
+import period_parser
+import disposition_index
+from snapshot_store import STORE, SnapshotUnavailable
+import metrics
+import ticker_index
+import yahoo_scheduler
+import lazy_deps
+import search_index
+import shared_cache
+import history_store
+import chart_builder
+import change_feed
+import disposition_engine
+import disposition_ingest
+import quote_feed
+# yfinance / twstock / gspread / google-auth / plotly / requests 改由 lazy_deps 在用到時才載入
+lazy_deps.record("app (eager imports)", (time.perf_counter() - _T_IMPORT) * 1000)
+metrics.register_gauge("import_ms", lazy_deps.import_times)
 
 # =================設定區=================
 DATA_CACHE_DIR = "stock_cache_warning_v2"
 GSHEET_URL = "https://docs.google.com/spreadsheets/d/1VNgYMxxHoJQPqtntcnPxENOQ2Mbn-wv1kkPoG91l1G8/edit?usp=drive_link"
 GSHEET_NAME = "台股注意股資料庫_V33"
 GSHEET_WORKSHEET = "近30日熱門統計"
+PAGE_SIZE = 20  # 預警名單每頁檔數
+SEARCH_OTHERS_LIMIT = 30  # 搜尋時名單外的股票最多列幾檔
+MOVERS_LIMIT = 30  # 風險變化頁最多列幾檔
+SEARCH_TYPES = ('股票', 'ETF', '創新板', '特別股', 'ETN', '臺灣存託憑證(TDR)')  # 不含權證
 # ========================================
 
 st.set_page_config(page_title="處置股監控中心 Pro", layout="wide", page_icon="🚨")
@@ -51,143 +65,470 @@ st.markdown("""
 # ==========================================
 # 2. 資料讀取 (雲端適配版)
 # ==========================================
-@st.cache_data(ttl=30) 
-def fetch_data_from_sheet():
+@st.cache_resource(show_spinner=False)
+def get_worksheet():
+    """授權後的 worksheet 長駐重用，不用每次重讀憑證、重新 open_by_url；找不到憑證回傳 None"""
+    gspread = lazy_deps.load('gspread')
+    gc = None
+    # 優先檢查 Streamlit Cloud 的 Secrets (本地沒有 secrets.toml 時 st.secrets 會直接丟例外)
     try:
-        gc = None
-        # 優先檢查 Streamlit Cloud 的 Secrets
-        if "gcp_service_account" in st.secrets:
-            creds_dict = st.secrets["gcp_service_account"]
-            creds = Credentials.from_service_account_info(
-                creds_dict,
-                scopes=['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-            )
-            gc = gspread.authorize(creds)
-        else:
-            # 本地端檔案讀取模式
-            json_key_path = "service_key.json"
-            if not os.path.exists(json_key_path):
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-                json_key_path = os.path.join(current_dir, "service_key.json")
-            
-            if os.path.exists(json_key_path):
-                gc = gspread.service_account(filename=json_key_path)
+        has_secret = "gcp_service_account" in st.secrets
+    except Exception:
+        has_secret = False
+    if has_secret:
+        creds_dict = st.secrets["gcp_service_account"]
+        Credentials = lazy_deps.load('google.oauth2.service_account').Credentials
+        creds = Credentials.from_service_account_info(
+            creds_dict,
+            scopes=['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+        )
+        gc = gspread.authorize(creds)
+    else:
+        # 本地端檔案讀取模式
+        json_key_path = "service_key.json"
+        if not os.path.exists(json_key_path):
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            json_key_path = os.path.join(current_dir, "service_key.json")
+        
+        if os.path.exists(json_key_path):
+            gc = gspread.service_account(filename=json_key_path)
+
+    if not gc: return None
+    sh = gc.open_by_url(GSHEET_URL)
+    return sh.worksheet(GSHEET_WORKSHEET)
+
+SHEET_CELL_STAMP_MAX_AGE = 300  # 只拿得到「最近一次日期」那格當戳記時，最多相信多久就整張重抓比對
 
-        if not gc:
-            st.error("⚠️ 找不到憑證 (請在 Streamlit Cloud 設定 Secrets 或檢查 service_key.json)")
-            return pd.DataFrame()
+@st.cache_resource(show_spinner=False)
+def _sheet_state():
+    """跨 session 共用：上次完整下載時的版本戳記、內容雜湊與結果"""
+    return {'stamp': None, 'header': None, 'df': None, 'digest': None, 'checked': 0.0}
+
+def _sheet_stamp(ws, header):
+    """
+    便宜的變更檢查：先用 Drive 的 modifiedTime，
+    拿不到 (權限/配額) 再退回讀「最近一次日期」那一格 (cell: 開頭，只看得到那一格的改動，
+    所以最多只相信 SHEET_CELL_STAMP_MAX_AGE 秒)。回傳 None 代表無法判斷。
+    """
+    try:
+        return ws.spreadsheet.get_lastUpdateTime()
+    except Exception:
+        pass
+    if header and '最近一次日期' in header:
+        try:
+            a1 = lazy_deps.load('gspread').utils.rowcol_to_a1(2, header.index('最近一次日期') + 1)
+            return f"cell:{ws.acell(a1).value}"
+        except Exception:
+            pass
+    return None
+
+@metrics.timed("sheet_load")
+def _load_sheet():
+    """
+    快照層的 loader (可能在背景執行緒跑，不能用 st.*)。
+    失敗直接丟例外，讓快照層保留上一份成功的資料。
+    """
+    try:
+        ws = get_worksheet()
+        if ws is None:
+            get_worksheet.clear()
+            raise RuntimeError("⚠️ 找不到憑證 (請在 Streamlit Cloud 設定 Secrets 或檢查 service_key.json)")
+
+        # ✅ 資料沒變就直接回上次結果，不做 get_all_values() 整張下載
+        state = _sheet_state()
+        stamp = _sheet_stamp(ws, state['header'])
+        trusted = not (stamp or "").startswith("cell:") or time.monotonic() - state['checked'] < SHEET_CELL_STAMP_MAX_AGE
+        if stamp is not None and stamp == state['stamp'] and state['df'] is not None and trusted:
+            metrics.inc("cache_requests", cache="sheet_stamp", result="hit")
+            return state['df']
+        metrics.inc("cache_requests", cache="sheet_stamp", result="miss")
 
-        sh = gc.open_by_url(GSHEET_URL)
-        ws = sh.worksheet(GSHEET_WORKSHEET) 
         data = ws.get_all_values()
+        # 整張內容沒變 (戳記不可靠或只是被碰過) 就沿用上一份，不重算、快照也不換
+        digest = hashlib.blake2b(repr(data).encode(), digest_size=16).hexdigest()
+        if digest == state['digest'] and state['df'] is not None:
+            metrics.inc("cache_requests", cache="sheet_digest", result="hit")
+            state.update(stamp=stamp, checked=time.monotonic())
+            return state['df']
         
         if len(data) < 2: return pd.DataFrame()
         
         df = pd.DataFrame(data[1:], columns=data[0])
         df = df[df['代號'].astype(str).str.strip() != '']
+        # 跟著 Sheet 快取一起記住，每次資料更新只算一次
+        df = normalize_risk_df(df)
+        record_history(df)
+        df = add_predictions(df)
+        if stamp is None and state['header'] is None:
+            # 第一次載入才知道表頭，補拿一次戳記，下次才比得起來
+            stamp = _sheet_stamp(ws, list(data[0]))
+        state.update(stamp=stamp, header=list(data[0]), df=df, digest=digest, checked=time.monotonic())
         return df
 
+    except Exception:
+        # 授權過期之類的錯誤：丟掉長駐的 client，下次重新授權
+        get_worksheet.clear()
+        raise
+
+@st.cache_resource(show_spinner=False)
+def get_history_store():
+    """注意股統計歷史 (代號, 日期)，跨 session 共用一條 SQLite"""
+    return history_store.HistoryStore(os.path.join(DATA_CACHE_DIR, "history.sqlite"))
+
+def record_history(df):
+    """每次整張重抓後寫入歷史；寫不進去不影響 Sheet 載入"""
+    try:
+        metrics.inc("history_rows", n=get_history_store().append(df))
     except Exception as e:
+        metrics.inc("history_errors", kind=type(e).__name__)
+
+def add_predictions(df):
+    """
+    App 內自己推算最快處置天數與風險等級 (disposition_engine)，和 Sheet 後端的結果並列。
+    歷史紀錄滿 30 個營業日就用每日紀錄精確算，否則用 Sheet 的次數。
+    """
+    if df.empty: return df
+    try:
+        flags = get_history_store().flags()
+    except Exception:
+        flags = {}
+    days, risk = disposition_engine.predict(df, flags)
+    return df.assign(推算天數=days, 推算風險=risk)
+
+def engine_check():
+    """目前 Sheet 快照裡，App 推算與 Sheet 後端一致的檔數"""
+    return disposition_engine.cross_check(STORE.peek_many('sheet', [None]).get(None, pd.DataFrame()))
+
+@metrics.timed("fetch_data_from_sheet")
+def fetch_data_from_sheet():
+    """Sheet 快照 (跨 session 共用，請勿原地修改)；從沒成功過才回傳空表"""
+    try:
+        return STORE.get('sheet')
+    except SnapshotUnavailable as e:
         st.error(f"❌ 連接 Google Sheet 錯誤: {e}")
         return pd.DataFrame()
 
+FLOAT_COLS = ['目前價', '警戒價', '成交值(億)', '週轉率(%)', 'PE', 'PB', '當沖佔比(%)']
+INT_COLS = {'目前量': 'int32', '警戒量': 'int32', '近10日注意次數': 'int16', '近30日注意次數': 'int16', '連續天數': 'int16'}
+RISK_SCORE = {'高': 3, '中': 2, '低': 1}
+RISK_LEVELS = pd.CategoricalDtype(['低', '中', '高'], ordered=True)
+
+def _to_number(s):
+    """整欄去千分位逗號後轉數字，轉不了的變 NaN"""
+    return pd.to_numeric(s.astype(str).str.replace(',', '', regex=False).str.strip(), errors='coerce')
+
+def normalize_risk_df(df):
+    """
+    Sheet 讀進來後一次做完 (整欄向量化)，結果是精簡的型別化表，所有 session 共用同一份：
+    - 價/比率 float32，量 int32，次數/天數 int16 (轉不了補 0；天數補 99)
+    - 風險等級、市場轉 category，最近一次日期轉 datetime，代號去空白
+    - 剩 2 天以內強制升級「高」風險
+    - 算好 is_accumulated 與 sort_score，並依 sort_score 排好
+    - 同一代號出現多列只留最緊急的一列 (卡片的元件 key、K 線快照都以代號為 key)
+    """
+    if df.empty: return df
+    df = df.copy()
+    if '代號' in df.columns: df['代號'] = df['代號'].astype(str).str.strip()
+    missing = pd.Series(0, index=df.index)
+    for col in FLOAT_COLS:
+        df[col] = (_to_number(df[col]) if col in df.columns else missing).fillna(0.0).astype('float32')
+    for col, dtype in INT_COLS.items():
+        df[col] = (_to_number(df[col]) if col in df.columns else missing).fillna(0).astype(dtype)
+    days_raw = df['最快處置天數'] if '最快處置天數' in df.columns else pd.Series(99, index=df.index)
+    df['最快處置天數'] = _to_number(days_raw).fillna(99).astype('int16')
+    for col, default in [('風險等級', '低'), ('觸發條件', ''), ('處置觸發原因', '')]:
+        if col not in df.columns: df[col] = default
+    if '最近一次日期' in df.columns:
+        df['最近一次日期'] = pd.to_datetime(df['最近一次日期'], errors='coerce')
+
+    est_days = df['最快處置天數']
+    # ✅ [前端修正]：強制把剩 2 天以內的股票升級為「高風險(紅燈)」
+    df.loc[est_days <= 2, '風險等級'] = '高'
+
+    reason = df['處置觸發原因'].astype(str)
+    df['is_accumulated'] = (
+        reason.str.contains('10日|30日|次', regex=True) |
+        ((est_days <= 1) & ((df['近10日注意次數'] >= 5) | (df['近30日注意次數'] >= 11) | (df['連續天數'] >= 2)))
+    )
+
+    # ✅ 優化排序：天數越少越前面 (權重最大)，其次是風險等級
+    # 1. 天數 (越小分越高): (100 - days) * 100000 -> 權重最大，確保剩1天的排在剩2天的前面
+    # 2. 風險 (越高分越高): risk_score * 1000
+    risk_score = df['風險等級'].map(RISK_SCORE).fillna(0).astype('int32')
+    df['sort_score'] = (100 - est_days.astype('int32')) * 100000 + risk_score * 1000
+    # 不在清單內的等級 (空白等) 當「低」，category 才不會多出雜值
+    df['風險等級'] = df['風險等級'].where(df['風險等級'].isin(RISK_LEVELS.categories), '低').astype(RISK_LEVELS)
+    if '市場' in df.columns: df['市場'] = df['市場'].astype('category')
+    df = df.sort_values('sort_score', ascending=False, kind='stable')
+    if '代號' in df.columns: df = df.drop_duplicates('代號')
+    return df.reset_index(drop=True)
+
+def page_records(df):
+    """
+    只把要畫的那一頁轉成 dict：float32 還原成原本的十進位數字 (避免 123.44999694)，
+    日期轉回字串，卡片顯示跟型別化之前一樣
+    """
+    page = df.copy()
+    for col in page.columns:
+        if page[col].dtype == 'float32':
+            page[col] = page[col].astype(str).astype('float64')
+    if '最近一次日期' in page.columns and pd.api.types.is_datetime64_any_dtype(page['最近一次日期']):
+        page['最近一次日期'] = page['最近一次日期'].dt.strftime('%Y-%m-%d')
+    return page.to_dict('records')
+
 # ==========================================
 # 3. 畫圖功能 (Yahoo 原版)
 # ==========================================
-def get_yahoo_ticker_code(stock_id):
-    clean_id = str(stock_id).strip()
-    suffix = ".TW" 
-    if clean_id in twstock.codes:
-        if twstock.codes[clean_id].market == '上櫃': suffix = '.TWO'
-    return f"{clean_id}{suffix}"
+CHART_PERIOD = "3mo"             # 卡片預抓 (整段抓) 的長度
+CHART_HISTORY_PERIOD = "3y"      # 選 1 年/3 年時補抓的長度
+CHART_WINDOWS = {'3 個月': 3, '1 年': 12, '3 年': 36}   # 區間 → 月數
+CHART_DEFAULT_WINDOW = '3 個月'
+CHART_FIG_CACHE_SIZE = 256       # 快取幾張建好的圖
+YAHOO_BATCH_SIZE = 40  # 單次 yf.download 的代號上限，避免 URL 過長被擋
+YAHOO_RATE_PER_SEC = 2.0  # 每秒可發出的 yf.download 次數 (token bucket)
+YAHOO_BURST = 4
+
+@st.cache_resource(show_spinner=False)
+def get_ticker_index():
+    """代號 → Yahoo 代碼索引：跨 session 共用；twstock 清單第一次查代號時才載入"""
+    return ticker_index.TickerIndex(os.path.join(DATA_CACHE_DIR, "ticker_index.json"),
+                                    lambda: lazy_deps.load('twstock').codes)
+
+@st.cache_resource(show_spinner=False)
+def get_yahoo_scheduler():
+    """整個 process 共用一個排程器，所有 session 的 Yahoo 請求一起限速"""
+    sched = yahoo_scheduler.YahooScheduler(lambda *a, **k: lazy_deps.load('yfinance').download(*a, **k),
+                                           rate=YAHOO_RATE_PER_SEC, burst=YAHOO_BURST)
+    metrics.register_gauge("yahoo_scheduler", sched.stats)
+    return sched
+
+def _finalize_chart_df(df):
+    """整理 Yahoo 回傳：去時區、只留 OHLCV"""
+    df = df.dropna(how='all')
+    if df.empty: return pd.DataFrame()
+    df = df.reset_index()
+    if df['Date'].dt.tz is not None:
+        df['Date'] = df['Date'].dt.tz_localize(None)
+    df.set_index('Date', inplace=True)
+    return df[ohlcv_store.BAR_COLS]
+
+def _download_batch(symbols, start=None, period=CHART_PERIOD):
+    """
+    經排程器 (限速 / 退避 / 同檔合併) 分批 yf.download，回傳 ({symbol: df}, failed)。
+    沒資料的不會出現在 dict 裡；failed 是連線錯誤/限流而沒拿到的 (不能當成 Yahoo 沒資料)
+    """
+    out, failed = {}, []
+    span = {'start': start} if start is not None else {'period': period}
+    sched = get_yahoo_scheduler()
+    for i in range(0, len(symbols), YAHOO_BATCH_SIZE):
+        chunk = symbols[i:i + YAHOO_BATCH_SIZE]
+        t0 = time.perf_counter()
+        try:
+            got, chunk_failed = sched.fetch(chunk, **span)
+        except Exception as e:
+            kind = "timeout" if "timed out" in str(e).lower() else "error"
+            metrics.inc("upstream_errors", source="yahoo", kind=kind)
+            failed += chunk
+            continue
+        finally:
+            if metrics.enabled(): metrics.observe("yahoo_download", (time.perf_counter() - t0) * 1000)
+        metrics.inc("upstream_requests", source="yahoo", status="ok")
+        failed += chunk_failed
+        metrics.inc("upstream_errors", source="yahoo", kind="partial", n=len(chunk_failed))
+        metrics.inc("upstream_empty", source="yahoo", n=len(chunk) - len(got) - len(chunk_failed))
+        for sym, sub in got.items():
+            sub = _finalize_chart_df(sub)
+            if not sub.empty: out[sym] = sub
+    return out, failed
+
+def _chart_window(df):
+    """本地保留完整歷史，卡片快照只取預設區間"""
+    return chart_builder.window(df, CHART_WINDOWS[CHART_DEFAULT_WINDOW])
+
+def _load_chart_batch(stock_ids):
+    """
+    整批預抓 K 線 (先看 DATA_CACHE_DIR 本地快取)：
+    - 快取夠新：直接用，不連 Yahoo
+    - 有快取但過期：只從最後一根開始補抓，依起始日分組整批抓
+    - 沒快取：整段抓，抓不到的再整批換另一個後綴 (.TW ↔ .TWO) 補抓一次
+    - yf 明說查無資料 (查無價格/已下市) 的代碼才進冷卻期 (TickerIndex)，期間內不再問 Yahoo；
+      連線錯誤/限流/沒有任何訊息的空結果都算失敗 (排程器的 failed)，不進冷卻期，下次照樣重抓
+    回傳 {代號: df}
+    """
+    idx = get_ticker_index()
+    ids = list(dict.fromkeys(str(s).strip() for s in stock_ids if str(s).strip()))
+    sym_map = {}
+    alt_map = {}
+    cached = {}
+    for sid in ids:
+        cands = idx.candidates(sid)
+        if not cands: continue  # 兩個後綴都在冷卻期
+        sym = cands[0]
+        sym_map[sid] = sym
+        if len(cands) > 1: alt_map[sid] = cands[1]
+        cached[sym] = ohlcv_store.load_bars(DATA_CACHE_DIR, sym)
+
+    stale = [sym for sym in dict.fromkeys(sym_map.values())
+             if not ohlcv_store.is_fresh(DATA_CACHE_DIR, sym, cached[sym])]
+    metrics.inc("cache_requests", n=len(cached) - len(stale), cache="ohlcv_disk", result="hit")
+    metrics.inc("cache_requests", n=len(stale), cache="ohlcv_disk", result="miss")
+    missing = [sym for sym in stale if cached[sym].empty]
+    by_start = {}
+    for sym in stale:
+        if not cached[sym].empty:
+            by_start.setdefault(cached[sym].index[-1].strftime('%Y-%m-%d'), []).append(sym)
+
+    fresh, failed = _download_batch(missing)
+    failed = set(failed)
+    for start, syms in by_start.items():
+        got, _ = _download_batch(syms, start=start)
+        fresh.update(got)
+
+    # 只有「確定沒資料」的才換後綴，連線失敗的等下次
+    retry = {sid: alt_map[sid] for sid, sym in sym_map.items()
+             if sym in missing and sym not in fresh and sym not in failed and sid in alt_map}
+    got_retry, retry_failed = _download_batch(list(retry.values())) if retry else ({}, [])
+    failed.update(retry_failed)
+    for sid, sym in retry.items():
+        if sym in got_retry:
+            sym_map[sid] = sym
+            cached[sym] = pd.DataFrame()
+            fresh[sym] = got_retry[sym]
+            stale.append(sym)
+
+    # 只有 yf 明說查無資料的才算沒這檔 (補抓沒有新 K 棒是正常的；failed 不算)
+    idx.record_empty([sym for sym in missing if sym not in fresh and sym not in failed] +
+                     [sym for sym in retry.values() if sym not in got_retry and sym not in failed])
+    idx.record_success([sym for sym in missing if sym in fresh] + list(got_retry))
+
+    for sym in stale:
+        if sym not in fresh and cached[sym].empty: continue
+        cached[sym] = ohlcv_store.merge_bars(cached[sym], fresh.get(sym, pd.DataFrame()))
+        try:
+            ohlcv_store.save_bars(DATA_CACHE_DIR, sym, cached[sym])
+        except Exception:
+            pass  # 寫檔失敗 (唯讀環境) 不影響畫圖
+
+    return {sid: _chart_window(cached[sym]) for sid, sym in sym_map.items() if not cached[sym].empty}
 
+def prefetch_chart_data(stock_ids):
+    """K 線快照：有的直接回，沒有的整批抓 (_load_chart_batch)，過期的背景補抓"""
+    ids = [str(s).strip() for s in stock_ids if str(s).strip()]
+    return STORE.get_many('chart', ids)
+
+def _load_history_batch(stock_ids):
+    """
+    1 年/3 年 K 線：本地快取不到 CHART_HISTORY_PERIOD 長的整批補抓一次整段，回傳完整歷史 {代號: df}。
+    (剛上市、本來就沒那麼長的，每 CHART_TTL 最多再問一次)
+    """
+    idx = get_ticker_index()
+    sym_map = {sid: idx.symbol(sid) for sid in stock_ids}
+    bars = {sym: ohlcv_store.load_bars(DATA_CACHE_DIR, sym) for sym in set(sym_map.values())}
+    years = pd.DateOffset(years=int(CHART_HISTORY_PERIOD[:-1]))
+    # 頭尾差兩週內都算夠長 (假日、Yahoo 起始日誤差)
+    short = [sym for sym, df in bars.items()
+             if df.empty or df.index[0] > df.index[-1] - years + pd.Timedelta(days=14)]
+    if short:
+        fresh, _ = _download_batch(short, period=CHART_HISTORY_PERIOD)
+        for sym, df in fresh.items():
+            bars[sym] = ohlcv_store.merge_bars(pd.DataFrame(), df)   # 整段到今天，均線全部重算
+            try:
+                ohlcv_store.save_bars(DATA_CACHE_DIR, sym, bars[sym])
+            except Exception:
+                pass
+    return {sid: bars[sym] for sid, sym in sym_map.items() if not bars[sym].empty}
+
+def local_chart_history(stock_id, df):
+    """不連網拿最長的本地日 K：history 快照 → 本地快取檔 → 手上的 df"""
+    sid = str(stock_id).strip()
+    held = STORE.peek_many('history', [sid]).get(sid)
+    if held is None or held.empty or held.index[-1] < df.index[-1]:
+        held = ohlcv_store.load_bars(DATA_CACHE_DIR, get_ticker_index().symbol(sid))
+    return held if not held.empty and held.index[-1] >= df.index[-1] and len(held) > len(df) else df
+
+def fetch_chart_history(stock_id):
+    sid = str(stock_id).strip()
+    fetch_chart_data(sid)   # 先確定代號後綴、近期 K 棒是新的
+    return STORE.get_many('history', [sid]).get(sid, pd.DataFrame())
+
+@metrics.timed("fetch_chart_data")
 def fetch_chart_data(stock_id):
-    ticker_code = get_yahoo_ticker_code(stock_id)
-    try:
-        ticker = yf.Ticker(ticker_code)
-        df = ticker.history(period="3mo")
-        
-        if df.empty and ".TW" in ticker_code: 
-             ticker = yf.Ticker(ticker_code.replace(".TW", ".TWO"))
-             df = ticker.history(period="3mo")
-        
-        if not df.empty:
-            df = df.reset_index()
-            if df['Date'].dt.tz is not None:
-                df['Date'] = df['Date'].dt.tz_localize(None)
-            df.set_index('Date', inplace=True)
-            for m in [5, 10, 20, 60]: df[f'MA{m}'] = df['Close'].rolling(m).mean()
-            return df
-    except: pass
-    return pd.DataFrame()
-
-def plot_stock_analysis(stock_id, stock_name):
-    df = fetch_chart_data(stock_id)
+    sid = str(stock_id).strip()
+    return prefetch_chart_data((sid,)).get(sid, pd.DataFrame())
+
+def bars_version(df):
+    """K 線內容指紋：頭尾日期、根數、最後一根 OHLCV (盤中重抓會改寫當天那根，日期不變，只看日期會一直拿到舊圖)"""
+    last = df.iloc[-1]
+    return (df.index[0], df.index[-1], len(df)) + tuple(float(last[c]) for c in ohlcv_store.BAR_COLS if c in df.columns)
+
+@st.cache_resource(max_entries=CHART_FIG_CACHE_SIZE, show_spinner=False)
+def resampled_bars(stock_id, timeframe, version, _df):
+    """日 K → 日/週/月 K (含均線、均量) 依 (代號, 週期, 日 K 內容指紋) 跨 session 共用；切換週期不連網"""
+    return chart_builder.resample(_df, timeframe)
+
+@st.cache_resource(max_entries=CHART_FIG_CACHE_SIZE, show_spinner=False)
+def chart_figure(stock_id, stock_name, window, timeframe, version, shares, _df):
+    """建好的 Figure 依 (代號, K 線內容指紋, 區間, 週期) 跨 session 共用；K 棒有變 (含當天那根被改寫) 才重建"""
+    daily = chart_builder.TIMEFRAMES[timeframe] is None
+    return chart_builder.build(_df, f'{stock_id} {stock_name}' + ('' if daily else f' ({timeframe}K)'),
+                               CHART_WINDOWS[window], daily=daily, shares=shares)
+
+def shares_from_row(row):
+    """Sheet 的目前量 (張) ÷ 週轉率 (%) 反推流通股數；缺值回 None (圖上就不疊週轉率)"""
+    vol, rate = row.get('目前量'), row.get('週轉率(%)')
+    if not vol or not rate or pd.isna(vol) or pd.isna(rate) or rate <= 0: return None
+    return round(float(vol) * 1000 / (float(rate) / 100))
+
+@metrics.timed("plot_stock_analysis")
+def plot_stock_analysis(stock_id, stock_name, df=None, shares=None):
+    col_win, col_tf = st.columns([0.6, 0.4])
+    window = col_win.radio("區間", list(CHART_WINDOWS), horizontal=True, key=f"win_{stock_id}",
+                           label_visibility="collapsed")
+    timeframe = col_tf.radio("週期", list(chart_builder.TIMEFRAMES), horizontal=True, key=f"tf_{stock_id}",
+                             format_func=lambda t: f"{t}K", label_visibility="collapsed")
+    if CHART_WINDOWS[window] > CHART_WINDOWS[CHART_DEFAULT_WINDOW]:
+        df = fetch_chart_history(stock_id)
+    else:
+        if df is None: df = fetch_chart_data(stock_id)
+        if chart_builder.TIMEFRAMES[timeframe] and not df.empty:
+            df = local_chart_history(stock_id, df)   # 週/月均線需要更長的暖身
     if df.empty: 
         st.warning("⚠️ 無法載入 K 線圖數據 (Yahoo 可能暫時限流)")
         return
-
-    df.index = df.index.strftime('%Y-%m-%d')
-    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.05, 
-                        row_heights=[0.7, 0.3], subplot_titles=(f'{stock_id} {stock_name}', '成交量'))
-    
-    fig.add_trace(go.Candlestick(x=df.index, open=df['Open'], high=df['High'], 
-                                 low=df['Low'], close=df['Close'], name='K線',
-                                 increasing_line_color='#ff4b4b', decreasing_line_color='#00da3c'), row=1, col=1)
-    
-    colors = {'MA5':'#00FFFF', 'MA10':'#FFFF00', 'MA20':'#FF00FF', 'MA60':'#00FF00'}
-    for ma, color in colors.items():
-        if ma in df.columns:
-            fig.add_trace(go.Scatter(x=df.index, y=df[ma], line=dict(color=color, width=1), name=ma), row=1, col=1)
-            
-    colors_vol = ['#ff4b4b' if c >= o else '#00da3c' for c, o in zip(df['Close'], df['Open'])]
-    fig.add_trace(go.Bar(x=df.index, y=df['Volume'], marker_color=colors_vol, name='成交量'), row=2, col=1)
-    
-    fig.update_layout(height=500, template='plotly_dark', xaxis_rangeslider_visible=False, 
-                      showlegend=False, margin=dict(l=10, r=10, t=30, b=10))
-    
-    fig.update_xaxes(type='category', tickmode='auto', nticks=10) 
-    
+    bars = resampled_bars(stock_id, timeframe, bars_version(df), df)
+    bars = chart_builder.window(bars, CHART_WINDOWS[window])
+    fig = chart_figure(stock_id, stock_name, window, timeframe, bars_version(bars), shares, bars)
     st.plotly_chart(fig, use_container_width=True)
 
 # ==========================================
 # 4. UI 呈現
 # ==========================================
-def render_risk_item(row):
+@st.fragment
+@metrics.timed("render_risk_item")
+def render_risk_item(row, chart_df=None):
+    """每張卡片是獨立 fragment：卡片裡的 K 線開關、區間/週期切換只重跑這一張"""
     stock_id = row['代號']
     stock_name = row['名稱']
-    risk_level = row.get('風險等級', '低')
-    trigger_msg = row.get('觸發條件', '')
-    reason_msg = row.get('處置觸發原因', '')
+    # 欄位型別、風險升級都已在 normalize_risk_df 處理好，這裡直接讀
+    risk_level = row['風險等級']
+    trigger_msg = row['觸發條件']
+    reason_msg = row['處置觸發原因']
+    est_days = row['最快處置天數']
+
+    curr_price = row['目前價']
+    limit_price = row['警戒價']
+    curr_vol = row['目前量']
+    limit_vol = row['警戒量']
     
-    try: est_days = int(row.get('最快處置天數', 99))
-    except: est_days = 99
-    
-    # ✅ [前端修正]：強制把剩 2 天以內的股票升級為「高風險(紅燈)」
-    if est_days <= 2:
-        risk_level = '高'
-    
-    def safe_float(v):
-        try: return float(str(v).replace(',', ''))
-        except: return 0
-    def safe_int(v):
-        try: return int(float(str(v).replace(',', '')))
-        except: return 0
-
-    curr_price = safe_float(row.get('目前價'))
-    limit_price = safe_float(row.get('警戒價'))
-    curr_vol = safe_int(row.get('目前量'))
-    limit_vol = safe_int(row.get('警戒量'))
-    
-    turnover_val = safe_float(row.get('成交值(億)'))
-    turnover_rate = safe_float(row.get('週轉率(%)'))
-    pe = safe_float(row.get('PE'))
-    pb = safe_float(row.get('PB'))
-    day_trade_pct = safe_float(row.get('當沖佔比(%)'))
+    turnover_val = row['成交值(億)']
+    turnover_rate = row['週轉率(%)']
+    pe = row['PE']
+    pb = row['PB']
+    day_trade_pct = row['當沖佔比(%)']
 
-    cnt_10 = safe_int(row.get('近10日注意次數'))
-    cnt_30 = safe_int(row.get('近30日注意次數'))
-    streak = safe_int(row.get('連續天數'))
+    cnt_10 = row['近10日注意次數']
+    cnt_30 = row['近30日注意次數']
+    streak = row['連續天數']
 
     if risk_level == '高':
         icon = "🔴"
@@ -201,10 +542,7 @@ def render_risk_item(row):
 
     days_str = f"最快 {est_days} 營業日進處置" if est_days < 90 else "觀察中"
 
-    is_accumulated = (
-        "10日" in reason_msg or "30日" in reason_msg or "次" in reason_msg or
-        (est_days <= 1 and (cnt_10 >= 5 or cnt_30 >= 11 or streak >= 2))
-    )
+    is_accumulated = row['is_accumulated']
 
     key_conditions = []
     
@@ -230,7 +568,7 @@ def render_risk_item(row):
     elif est_days == 3:
         key_conditions.append(f"⚠️關鍵: 累積頻繁 留意連續觸發")
 
-    title_parts = [f"{icon} {stock_id} {stock_name} (現價 {curr_price})", days_str]
+    title_parts = [f"{row.get('變動標記', '')}{icon} {stock_id} {stock_name} (現價 {curr_price})", days_str]
     if key_conditions: title_parts.extend(key_conditions)
     title_text = " | ".join(title_parts)
     
@@ -242,6 +580,17 @@ def render_risk_item(row):
             st.markdown(f"#### 預測：{days_str}", unsafe_allow_html=True)
             if reason_msg:
                 st.markdown(f"<div style='color:#ffaaaa; font-size:0.9em;'>⚠️ {reason_msg}</div>", unsafe_allow_html=True)
+            # App 內推算 (disposition_engine)，和 Sheet 不同時標出來
+            engine_days = row.get('推算天數')
+            if engine_days is not None and pd.notna(engine_days):
+                far = disposition_engine.HORIZON
+                same = engine_days == est_days or (engine_days > far and est_days > far)
+                engine_str = f"最快 {engine_days} 日" if engine_days <= far else "觀察中"
+                st.caption(f"🧮 App 推算：{engine_str}" + ("" if same else " (與 Sheet 不同)"))
+            if pd.notna(row.get('推算警戒價', float('nan'))):
+                vol = row.get('推算警戒量')
+                vol_str = f"{int(vol):,} 張" if pd.notna(vol) else '-'
+                st.caption(f"🧮 推算警戒價 {row['推算警戒價']} / 警戒量 {vol_str}")
             
         with c2:
             strategy_text = ""
@@ -277,7 +626,11 @@ def render_risk_item(row):
             st.write(f"**PE**: {pe} | **PB**: {pb}")
         
         st.markdown("---")
-        plot_stock_analysis(stock_id, stock_name)
+        # chart_df 為 None 代表點選才載入：按鈕沒打開就不抓資料、不建圖
+        if chart_df is not None:
+            plot_stock_analysis(stock_id, stock_name, chart_df, shares_from_row(row))
+        elif st.toggle("📈 載入 K 線圖", key=f"chart_{stock_id}"):
+            plot_stock_analysis(stock_id, stock_name, shares=shares_from_row(row))
 
 # ==========================================
 # 5. 輔助函數 (處置中股票用) - 本地一致版
@@ -286,61 +639,13 @@ def get_today_date():
     # 強制使用台灣時間，確保換日邏輯一致
     return datetime.now(ZoneInfo("Asia/Taipei")).date()
 
-def extract_dates_any(s: str):
-    s = str(s or "").strip()
-
-    # 1) 114/12/25、114-12-25、2025.12.25
-    p1 = re.findall(r'(\d{2,4})[./-](\d{1,2})[./-](\d{1,2})', s)
-
-    # 2) 114年12月25日（可無日）
-    p2 = re.findall(r'(\d{2,4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日?', s)
-    
-    # 3) 1141223 (7碼純數字，TPEx 常見格式)
-    p3 = re.findall(r'(\d{3})(\d{2})(\d{2})', s)
-
-    hits = p1 + p2 + p3
-    dates = []
-    for y, m, d in hits:
-        try:
-            y = int(y); m = int(m); d = int(d)
-            # 年份判斷：小於 1911 視為民國年；否則視為西元年
-            if y < 1911:
-                y += 1911
-            dates.append(date(y, m, d))
-        except:
-            pass
-    return dates
-
 def format_roc_period(period_str):
     """將解析到的日期格式化為 114/MM/DD～114/MM/DD"""
-    dates = extract_dates_any(period_str)
-    if len(dates) >= 2:
-        start, end = dates[0], dates[1]
-        # 確保順序
-        if start > end: start, end = end, start
-        
-        s_str = f"{start.year - 1911}/{start.month:02d}/{start.day:02d}"
-        e_str = f"{end.year - 1911}/{end.month:02d}/{end.day:02d}"
-        return f"{s_str}～{e_str}"
-    return period_str
-
-def is_active(period_str):
-    """
-    回傳：
-    - True  : 今日在處置區間內
-    - False : 今日不在處置區間內
-    - None  : 解析不到區間（避免把整批 TPEx 全濾掉）
-    """
-    ds = extract_dates_any(period_str)
-    if len(ds) < 2:
-        return None
-
-    start, end = ds[0], ds[1]
-    if start > end:
-        start, end = end, start
-
-    today = get_today_date()
-    return start <= today <= end
+    interval = period_parser.parse_period(period_parser.normalize(period_str))
+    if interval is None:
+        return period_str
+    start, end = interval
+    return f"{period_parser.to_roc(start)}～{period_parser.to_roc(end)}"
 
 def clean_tpex_name(raw_name):
     return raw_name.split('(')[0] if '(' in raw_name else raw_name
@@ -349,278 +654,433 @@ def clean_tpex_measure(content):
     if any(k in content for k in ["第二次", "再次", "每20分鐘", "每25分鐘", "每60分鐘"]): return "20分鐘盤"
     return "5分鐘盤"
 
+@st.cache_resource
+def get_http_session():
+    """TWSE / TPEx 共用連線池，省掉每次重新 TLS 握手"""
+    requests = lazy_deps.load('requests')
+    urllib3 = lazy_deps.load('urllib3')
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)  # 忽略 SSL 警告
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("https://", adapter)
+    session.verify = False
+    return session
+
 def safe_get(url, headers=None, timeout=10):
     """
     Streamlit Cloud 上 openapi.twse / tpex 常見 OpenSSL 驗證問題：
     直接強制 verify=False，避免每次先 verify=True 一定炸。
+    (會在背景執行緒跑，不能直接 st.error，失敗訊息包進例外往上丟)
     """
+    host = urlparse(url).netloc
+    t0 = time.perf_counter()
     try:
-        res = requests.get(url, headers=headers, timeout=timeout, verify=False)
+        res = get_http_session().get(url, headers=headers, timeout=timeout, verify=False)
+        metrics.inc("upstream_requests", source=host, status=res.status_code)
         return res
     except Exception as e:
-        st.error(f"❌ 請求失敗: {url}\n原因: {e}")
-        raise
-
-def safe_json(res):
-    """避免 res.json() 因為 BOM/非 JSON 直接炸掉"""
-    try:
-        return res.json()
-    except Exception:
-        return json.loads(res.text.lstrip("\ufeff").strip())
-
-def pick_4digit_code_from_values(obj):
-    # obj 可以是 dict 或 list
-    vals = obj.values() if isinstance(obj, dict) else obj
-    for v in vals:
-        t = re.sub(r'<[^>]+>', '', str(v)).strip()  # 去 HTML
-        if re.fullmatch(r'\d{4}', t):
-            return t
-    return ""
-
-def clean_text(x):
-    return re.sub(r'<[^>]+>', '', str(x)).replace("&nbsp;", " ").strip()
-
-@st.cache_data(ttl=300)
-def fetch_all_disposition_stocks():
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    all_stock_list = []
-
-    # 1. 上市 (TWSE) - 移除 verify=False，使用標準流程
+        kind = "timeout" if isinstance(e, lazy_deps.load('requests').Timeout) else "error"
+        metrics.inc("upstream_errors", source=host, kind=kind)
+        raise RuntimeError(f"❌ 請求失敗: {url}\n原因: {e}") from e
+    finally:
+        if metrics.enabled(): metrics.observe(f"safe_get:{host}", (time.perf_counter() - t0) * 1000)
+
+def _load_quotes(channels):
+    """盤中報價快照的 loader：所有 channel 分批一次查完"""
+    return quote_feed.fetch(lambda url: safe_get(url, timeout=5), channels)
+
+DISPO_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+RELEASE_WINDOW = 10  # 出關日曆往後看幾個營業日
+TPEX_HEDGE_SEC = 2.0  # TPEx OpenAPI 超過這個時間沒回來，就同時打舊端點備援
+
+def _period_fields(period_raw):
+    """期間字串 → 統一格式的「處置期間」與起迄日 (解析不到為 None)"""
+    interval = period_parser.parse_period(period_parser.normalize(period_raw))
+    start, end = interval if interval else (None, None)
+    return {'處置期間': format_roc_period(period_raw), '起日': start, '迄日': end}
+
+def _has_current(rows, today):
+    """是否有今天仍在處置中的列 (解析不到期間也算)"""
+    return any(r['起日'] is None or r['起日'] <= today <= r['迄日'] for r in rows)
+
+def _fetch_twse_disposition(errors):
+    """上市 (TWSE)"""
+    url_twse = "https://openapi.twse.com.tw/v1/announcement/punish"
+    res = safe_get(url_twse, headers=DISPO_HEADERS, timeout=10)
+    if res.status_code != 200:
+        errors.append(f"TWSE 回傳非 200: {res.status_code}\n{res.text[:200]}")
+        return []
+    rows, err = disposition_ingest.parse(res.text, "TWSE")
+    if err: errors.append(err)
+    # 先全部留著 (含已出關)，是否處置中交給區間索引判斷
+    return [{'市場': '上市', '代號': code, '名稱': name,
+             '處置措施': "20分鐘盤" if any(k in measure for k in ["第二次", "再次"]) else "5分鐘盤",
+             **_period_fields(period)}
+            for code, name, period, measure in rows]
+
+def _tpex_records(rows):
+    # ✅ 關鍵：解析不到日期也不要丟掉 (起迄為 None)，否則 TPEx 很容易全空
+    return [{"市場": "上櫃", "代號": code, "名稱": clean_tpex_name(name) if name else "",
+             "處置措施": clean_tpex_measure(measure), **_period_fields(period)}
+            for code, name, period, measure in rows]
+
+def _fetch_tpex_openapi_disposition(errors):
+    """上櫃 (TPEx) OpenAPI v1（本地/雲端都更穩）；欄位格式每份回應偵測一次 (disposition_ingest)"""
+    url_tpex_api = "https://www.tpex.org.tw/openapi/v1/tpex_disposal_information"
+    res = safe_get(url_tpex_api, headers=DISPO_HEADERS, timeout=10)
+    if res.status_code != 200:
+        errors.append(f"TPEx OpenAPI 非 200: {res.status_code}\n{res.text[:200]}")
+    rows, err = disposition_ingest.parse(res.text, "TPEx OpenAPI")
+    if err: errors.append(err)
+    return _tpex_records(rows)
+
+def _fetch_tpex_legacy_disposition(errors):
+    """上櫃 (TPEx) 舊 aaData 端點，OpenAPI 空/慢時的備援"""
+    url_tpex_old = "https://www.tpex.org.tw/web/bulletin/disposal_information/disposal_information_result.php?l=zh-tw&o=json"
+    res2 = safe_get(url_tpex_old, headers=DISPO_HEADERS, timeout=10)
+    if res2.status_code != 200:
+        errors.append(f"TPEx 舊端點非 200: {res2.status_code}\n{res2.text[:200]}")
+    rows, err = disposition_ingest.parse(res2.text, "TPEx 舊端點")
+    if err: errors.append(err)
+    return _tpex_records(rows)
+
+def _collect(future, label, errors):
+    """取回背景結果，失敗就記錯誤訊息、回傳空 list"""
     try:
-        url_twse = "https://openapi.twse.com.tw/v1/announcement/punish"
-        # 使用 safe_get
-        res = safe_get(url_twse, headers=headers, timeout=10)
-        
-        if res.status_code == 200:
-            payload = safe_json(res)
-            for item in payload:
-                code = item.get('Code', '').strip()
-                # ✅ 修正 2: 增加四碼檢查
-                if not (code.isdigit() and len(code) == 4): continue
-
-                name = item.get('Name', '').strip()
-                period = item.get('DispositionPeriod', '').strip()
-                raw_measure = item.get('DispositionMeasures', '').strip()
-                
-                measure = "20分鐘盤" if any(k in raw_measure for k in ["第二次","再次"]) else "5分鐘盤"
-                
-                # is_active 回傳 True/False/None，只要不是 False 都當作有效 (None保留)
-                active = is_active(period)
-                if active is not False:
-                    # 上市通常已經格式好了，但也可以套用一下統一格式
-                    all_stock_list.append({'市場': '上市', '代號': code, '名稱': name, '處置期間': format_roc_period(period), '處置措施': measure})
-        else:
-            st.error(f"TWSE 回傳非 200: {res.status_code}\n{res.text[:200]}")
+        return future.result()
     except Exception as e:
-        st.error(f"TWSE 處置股抓取失敗: {e}")
+        errors.append(f"{label}失敗: {e}")
+        return []
 
-    # 2. 上櫃 (TPEx) - 改用 TPEx OpenAPI v1（本地/雲端都更穩），舊 aaData 當 fallback
+def _load_disposition_table():
+    """
+    TWSE、TPEx OpenAPI 同時發出 (共用連線池)；
+    TPEx 舊端點當對沖：OpenAPI 超過 TPEX_HEDGE_SEC 沒回來或回來是空的就同時打，
+    最後 OpenAPI 有今日處置資料就用 OpenAPI，否則用舊端點。
+    回傳處置區間表 (含已出關的區間)，非致命的錯誤訊息放在 attrs['errors'] (跟著共用快取走)。
+    """
+    today = get_today_date()
+    errors = []
+    pool = ThreadPoolExecutor(max_workers=3)
     try:
-        # ✅ 官方 OpenAPI：上櫃處置有價證券資訊
-        url_tpex_api = "https://www.tpex.org.tw/openapi/v1/tpex_disposal_information"
-        res = safe_get(url_tpex_api, headers=headers, timeout=10)
-        
-        if res.status_code != 200:
-            st.error(f"TPEx OpenAPI 非 200: {res.status_code}\n{res.text[:200]}")
-
-        payload = safe_json(res)
-
-        # 這個 API 實務上通常回傳「list[dict]」
-        if isinstance(payload, dict) and "data" in payload:
-            payload = payload["data"]
-        if not isinstance(payload, list):
-            payload = []
-
-        for item in payload:
-            # ✅ key 名可能不同：先吃常見 key，再不行就從 values 撿 4 碼代號
-            code = clean_text(
-                item.get("SecuritiesCompanyCode")
-                or item.get("證券代號")
-                or item.get("代號")
-                or ""
-            )
-            if not code:
-                code = pick_4digit_code_from_values(item)
-
-            if not (code.isdigit() and len(code) == 4):
-                continue
-
-            name = clean_text(
-                item.get("CompanyName")
-                or item.get("證券名稱")
-                or item.get("名稱")
-                or ""
-            )
-
-            # 抓取原始字串 (可能是 1141223 這種格式)
-            period_raw = clean_text(
-                item.get("DispositionPeriod")
-                or item.get("處置期間")
-                or item.get("處置起迄")
-                or ""
-            )
-            # 統一格式化
-            period = format_roc_period(period_raw)
-
-            raw_content = clean_text(
-                item.get("DisposalCondition")
-                or item.get("DispositionReasons")
-                or item.get("處置措施")
-                or item.get("處置內容")
-                or ""
-            )
-
-            active = is_active(period_raw)
-
-            # ✅ 關鍵：解析不到日期(None)不要直接丟掉，否則 TPEx 很容易全空
-            if active is False:
-                continue
-
-            all_stock_list.append({
-                "市場": "上櫃",
-                "代號": code,
-                "名稱": clean_tpex_name(name) if name else "",
-                "處置期間": period,
-                "處置措施": clean_tpex_measure(raw_content),
-            })
-
-        # ✅ 若 OpenAPI 端點回來是空（被擋/格式變），再用你本來 aaData 的舊端點備援
-        if len([x for x in all_stock_list if x.get("市場") == "上櫃"]) == 0:
-            url_tpex_old = "https://www.tpex.org.tw/web/bulletin/disposal_information/disposal_information_result.php?l=zh-tw&o=json"
-            res2 = safe_get(url_tpex_old, headers=headers, timeout=10)
-            
-            if res2.status_code != 200:
-                st.error(f"TPEx 舊端點非 200: {res2.status_code}\n{res2.text[:200]}")
-
-            data2 = safe_json(res2)
-            tpex_data = data2.get("aaData", [])
-
-            for row in tpex_data:
-                if not isinstance(row, list) or len(row) == 0:
-                    continue
-
-                cells = [clean_text(x) for x in row]
-
-                code = next((c for c in cells if re.fullmatch(r"\d{4}", c)), "")
-                if not code:
-                    continue
-
-                # 名稱：找第一個「不是代號、不是日期區間」的字串
-                name = ""
-                for c in cells:
-                    if not c or c == code:
-                        continue
-                    if len(extract_dates_any(c)) >= 2:
-                        continue
-                    name = c
-                    break
-
-                # 期間：找包含至少 2 個日期的 cell
-                period_raw = next((c for c in cells if len(extract_dates_any(c)) >= 2), "")
-                period = format_roc_period(period_raw)
-
-                # 措施：找含「分鐘」或「分盤」字樣
-                raw_content = next((c for c in cells if ("分鐘" in c) or ("分盤" in c)), "")
-                if not raw_content:
-                    raw_content = " ".join(cells)
-
-                active = is_active(period_raw)
-                if active is False:
-                    continue
-
-                all_stock_list.append({
-                    "市場": "上櫃",
-                    "代號": code,
-                    "名稱": clean_tpex_name(name) if name else "",
-                    "處置期間": period,
-                    "處置措施": clean_tpex_measure(raw_content),
-                })
-
-    except Exception as e:
-        st.error(f"TPEx 處置股抓取失敗: {e}")
-
-    df = pd.DataFrame(all_stock_list)
+        f_twse = pool.submit(_fetch_twse_disposition, errors)
+        f_tpex = pool.submit(_fetch_tpex_openapi_disposition, errors)
+        f_legacy = None
+
+        wait([f_tpex], timeout=TPEX_HEDGE_SEC)
+        if not f_tpex.done() or f_tpex.exception() is not None or not _has_current(f_tpex.result(), today):
+            f_legacy = pool.submit(_fetch_tpex_legacy_disposition, errors)
+
+        twse_list = _collect(f_twse, "TWSE 處置股抓取", errors)
+        tpex_list = _collect(f_tpex, "TPEx 處置股抓取", errors)
+        # ✅ 若 OpenAPI 端點回來是空（被擋/格式變），用舊 aaData 端點備援
+        if not _has_current(tpex_list, today):
+            if f_legacy is None:
+                f_legacy = pool.submit(_fetch_tpex_legacy_disposition, errors)
+            tpex_list = _collect(f_legacy, "TPEx 舊端點抓取", errors)
+    finally:
+        # OpenAPI 已有資料時，舊端點不必等它回來
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    table = pd.DataFrame(twse_list + tpex_list, columns=disposition_index.TABLE_COLS)
+    for col in ['起日', '迄日']:
+        table[col] = pd.to_datetime(table[col])
+    # 重複值很多的欄位用 category：省記憶體，篩選/排序也快
+    for col in ['市場', '處置措施']:
+        table[col] = table[col].astype('category')
+    # TWSE/TPEx 給的市場別比 twstock 內建清單新，順便更新 Yahoo 後綴索引
+    get_ticker_index().learn_markets(zip(table['代號'], table['市場']))
+    if table.empty and errors:
+        # 兩邊都失敗：丟例外讓快照層保留上一份名單
+        raise RuntimeError("\n".join(errors))
+    table.attrs['errors'] = list(errors)
+    return table
+
+def _build_disposition_index(load_table):
+    """處置名單快照的 loader：取區間表 (可能來自共用快取) 建成 DispositionIndex，錯誤訊息掛在 .errors"""
+    def load():
+        table = load_table()
+        idx = disposition_index.DispositionIndex(table)
+        idx.errors = list(table.attrs.get('errors', []))
+        return idx
+    return load
+
+def get_disposition_index(show_errors=True):
+    """處置名單快照 (跨 session 共用)；從沒成功過才回傳空索引"""
+    try:
+        idx = STORE.get('disposition')
+    except SnapshotUnavailable as e:
+        if show_errors: st.error(f"處置股抓取失敗: {e}")
+        return disposition_index.DispositionIndex(pd.DataFrame())
+    if show_errors:
+        for msg in idx.errors: st.error(msg)
+    return idx
+
+def fetch_all_disposition_stocks(idx=None):
+    """今日處置中名單 (解析不到期間的也保留)"""
+    idx = idx if idx is not None else get_disposition_index()
+    df = idx.current_table(get_today_date())
     if not df.empty:
         df['sort_key'] = df['市場'].map({'上市': 0, '上櫃': 1})
         df = df.sort_values(by=['sort_key', '代號'], ascending=[True, True])
-        df = df[['市場', '代號', '名稱', '處置期間', '處置措施']]
-    return df
+    return df[['市場', '代號', '名稱', '處置期間', '處置措施']]
+
+# ==========================================
+# 5.5 跨 session 快照 (背景更新)
+# ==========================================
+SHEET_TTL = 30
+DISPO_TTL = 300
+CHART_TTL = 600
+CHART_IDLE_TTL = 1800  # K 線超過這麼久沒人看就不再背景更新
+REFRESH_WAIT_SEC = 8   # 按下重新讀取時最多等多久
+QUOTE_INTERVAL_SEC = int(os.environ.get("STOCK_QUOTE_INTERVAL", "15"))  # 盤中即時報價更新間隔
+ALERT_WEBHOOK = os.environ.get("STOCK_ALERT_WEBHOOK", "")  # 有設就把快照變動 POST 過去 (例如 http://127.0.0.1:9000/hook)
+CHANGES_STRIP_LIMIT = 12  # 變動列最多直接列出幾筆，其餘收在表格裡
+
+# 多個 replica 共用的快取 (STOCK_CACHE_URL：空=DATA_CACHE_DIR 下的 SQLite、redis://...、off=關閉)
+SHARED_CACHE_URL = os.environ.get("STOCK_CACHE_URL", "")
+SHARED_CACHE_MAX_MB = 256
+SHARED_KEEP_SEC = 86400  # 共用快取保留多久 (上游掛掉時新起的 replica 還有資料可用)
+
+@st.cache_resource(show_spinner=False)
+def get_shared_cache():
+    cache = shared_cache.from_url(SHARED_CACHE_URL, os.path.join(DATA_CACHE_DIR, "shared_cache.sqlite"),
+                                  max_bytes=SHARED_CACHE_MAX_MB * 1024 * 1024, keep_sec=SHARED_KEEP_SEC)
+    metrics.register_gauge("shared_cache", lambda: {k: v for k, v in cache.stats().items() if k != 'backend'})
+    return cache
+
+_shared = get_shared_cache()
+STORE.register('sheet', _shared.wrap('sheet', _load_sheet, SHEET_TTL), ttl=SHEET_TTL)
+STORE.register('disposition', _build_disposition_index(_shared.wrap('disposition', _load_disposition_table, DISPO_TTL)),
+               ttl=DISPO_TTL)
+STORE.register('chart', _shared.wrap_batch('chart', _load_chart_batch, CHART_TTL), ttl=CHART_TTL,
+               batch=True, idle_ttl=CHART_IDLE_TTL)
+STORE.register('history', _load_history_batch, ttl=CHART_TTL, batch=True, idle_ttl=CHART_IDLE_TTL)
+STORE.register('quotes', _load_quotes, ttl=QUOTE_INTERVAL_SEC, batch=True, idle_ttl=QUOTE_INTERVAL_SEC * 3)
+STORE.start_scheduler()
+metrics.register_gauge("engine_check", engine_check)
+metrics.start_exporters()
+
+@st.cache_resource(show_spinner=False)
+def get_change_feed():
+    return change_feed.ChangeFeed(webhook=ALERT_WEBHOOK or None)
+
+def observe_changes(df, idx, jail_status):
+    """把目前的 Sheet / 處置名單快照交給變動偵測 (快照沒換只做 identity 比較)；回傳最新版本號"""
+    today = get_today_date()
+    def names():
+        table = idx.current_table(today)
+        out = dict(zip(table['代號'], table['名稱']))
+        if not df.empty: out.update(zip(df['代號'], df['名稱']))
+        return out
+    return get_change_feed().observe(df, (id(idx), today), jail_status.index, names)
+
+@st.fragment(run_every=SHEET_TTL)
+def watch_changes(version):
+    """
+    定時看快照有沒有換、換了有沒有實際變動：沒變動什麼都不重畫，
+    有變動才整頁重跑 (更新卡片與變動列)。
+    """
+    df = fetch_data_from_sheet()
+    idx = get_disposition_index(show_errors=False)
+    if observe_changes(df, idx, idx.jail_status(get_today_date())) > version:
+        st.rerun(scope="app")
+
+def render_change_strip(changes, version):
+    """上次確認後的變動：一列摘要 + 可展開的明細"""
+    counts = changes['變動'].value_counts()
+    summary = " ".join(f"{change_feed.KIND_ICON[k]} {k} {counts[k]}" for k in change_feed.KINDS if k in counts)
+    col_msg, col_ack = st.columns([0.85, 0.15])
+    head = "、".join(f"{change_feed.KIND_ICON[k]}{c} {n}" for c, n, k in
+                    changes[['代號', '名稱', '變動']].head(CHANGES_STRIP_LIMIT).itertuples(index=False))
+    col_msg.warning(f"🔔 上次更新後的變動：{summary}\n\n{head}{' …' if len(changes) > CHANGES_STRIP_LIMIT else ''}")
+    if col_ack.button("✓ 知道了", key="ack_changes"):
+        st.session_state['changes_seen'] = version
+        st.rerun()
+    if len(changes) > CHANGES_STRIP_LIMIT:
+        with st.expander(f"全部 {len(changes)} 筆變動"):
+            st.dataframe(changes, hide_index=True, use_container_width=True)
+
+def refresh_datasets(*names):
+    """只讓指定資料集過期並同時更新 (其他 replica 的共用快取也一併標成過期)，最多等 REFRESH_WAIT_SEC"""
+    for name in names:
+        get_shared_cache().mark_stale(name)
+        STORE.invalidate(name)
+    deadline = time.time() + REFRESH_WAIT_SEC
+    for name in names: STORE.wait(name, max(0.0, deadline - time.time()))
+
+def snapshot_label(name):
+    """快照時間 (台灣時間) 與是否正在背景更新"""
+    s = STORE.status(name)
+    if not s.get('updated_at'): return "尚未載入"
+    ts = datetime.fromtimestamp(s['updated_at'], ZoneInfo("Asia/Taipei")).strftime('%H:%M:%S')
+    return f"快照 {ts}" + (" (背景更新中)" if s['refreshing'] else "")
 
 # ==========================================
 # 6. 主頁面
 # ==========================================
+@st.cache_resource(show_spinner=False)
+def get_search_index():
+    """全市場 (twstock 股票/ETF) 代號名稱索引，第一次搜尋時才建；Sheet 的代號在查詢時補進來"""
+    codes = lazy_deps.load('twstock').codes
+    return search_index.SearchIndex((c, v.name) for c, v in codes.items() if v.type in SEARCH_TYPES)
+
+def render_search_others(others, expanded=False):
+    """搜尋到、但不在目前風險名單裡的股票：選一檔直接畫 K 線"""
+    if not others: return
+    with st.expander(f"🔎 不在風險名單的股票 ({len(others)})", expanded=expanded):
+        pick = st.selectbox("選擇股票查看 K 線", others, index=None, key="search_pick",
+                            format_func=lambda p: f"{p[0]} {p[1]}", placeholder="選擇股票")
+        if pick: plot_stock_analysis(pick[0], pick[1])
+
+@st.fragment(run_every=QUOTE_INTERVAL_SEC)
+def render_live_board(rows):
+    """
+    盤中即時報價：這一頁的代號一次批次查價 (跨 session 共用快照)，只有這一塊定時重跑，
+    卡片不重畫 (展開狀態不會跑掉)。價/量剛突破警戒時跳通知。
+    rows: (代號, 名稱, 市場, 警戒價, 警戒量)
+    """
+    chans = {quote_feed.channel(code, market): (code, name, lp, lv) for code, name, market, lp, lv in rows}
+    quotes = STORE.get_many('quotes', list(chans))
+    prev = st.session_state.setdefault('live_prev', {})
+    table, stamp = [], ""
+    for ch, (code, name, limit_price, limit_vol) in chans.items():
+        q = quotes.get(ch)
+        if not q or q['price'] is None: continue
+        price, vol = q['price'], q['volume'] or 0
+        hit_p = limit_price > 0 and price >= limit_price
+        hit_v = limit_vol > 0 and vol >= limit_vol
+        old = prev.get(code)
+        if old is not None:
+            if hit_p and not old[2]: st.toast(f"🚨 {code} {name} 突破警戒價 {limit_price}（現價 {price}）")
+            if hit_v and not old[3]: st.toast(f"🚨 {code} {name} 量突破警戒 {limit_vol:,} 張（現量 {vol:,}）")
+        changed = old is None or old[:2] != (price, vol)
+        prev[code] = (price, vol, hit_p, hit_v)
+        stamp = max(stamp, q['time'] or "")
+        table.append({'代號': code, '名稱': name, '即時價': price, '警戒價': limit_price or None,
+                      '即時量': vol, '警戒量': limit_vol or None,
+                      '狀態': " ".join(s for s, on in (("⚠️價", hit_p), ("⚠️量", hit_v)) if on) or "✅",
+                      '變動': "🔄" if changed else ""})
+    st.markdown("##### ⏱️ 盤中即時報價")
+    if not table:
+        err = STORE.status('quotes', next(iter(chans), None)).get('error')
+        st.caption(f"暫時拿不到報價{f'：{err}' if err else ''}")
+        return
+    # 達警戒的排前面
+    table.sort(key=lambda r: r['狀態'] == "✅")
+    st.dataframe(pd.DataFrame(table), hide_index=True, use_container_width=True)
+    st.caption(f"報價時間 {stamp or '-'} | 每 {QUOTE_INTERVAL_SEC} 秒更新 | 🔄 = 這次有變動")
+
 def run_warning_page():
     st.title("⚠️ 處置股預警機")
     
-    col_btn, col_chk, col_info = st.columns([0.2, 0.2, 0.6])
+    col_btn, col_chk, col_chart, col_info = st.columns([0.15, 0.15, 0.15, 0.55])
     
     if col_btn.button("🔄 重新讀取"):
-        st.cache_data.clear() 
+        # 只更新 Sheet 與處置名單 (同時進行、多人同時按只會打一次上游)，
+        # 等不到就先顯示舊快照，背景會繼續更新
+        with st.spinner("更新中..."):
+            refresh_datasets('sheet', 'disposition')
         st.rerun()
     
     # 讓使用者決定要不要看已經被關的股票
     show_jail_stocks = col_chk.checkbox("顯示已處置股", value=False)
+    # 預設點開卡片、按下按鈕才抓 K 線；關掉則整頁預抓
+    chart_on_demand = col_chart.checkbox("K 線點選才載入", value=True)
     
     # ✅ 新增：搜尋欄
-    search_term = st.text_input("🔍 搜尋股票 (輸入代號或名稱)", "").strip()
+    col_search, col_live = st.columns([0.8, 0.2])
+    search_term = col_search.text_input("🔍 搜尋股票 (輸入代號或名稱)", "").strip()
+    live_mode = col_live.toggle("⏱️ 盤中即時報價", value=False, help=f"每 {QUOTE_INTERVAL_SEC} 秒批次查價，只更新報價區")
         
     df = fetch_data_from_sheet()
-    df_jail = fetch_all_disposition_stocks()
-    # ✅ 修正 3: 增加 str.strip()，確保比對精確
-    jail_codes = df_jail['代號'].astype(str).str.strip().tolist() if not df_jail.empty else []
+    # 依今天日期查區間索引，得到「代號 → 出關日」的處置狀態表
+    dispo_idx = get_disposition_index()
+    jail_status = dispo_idx.jail_status(get_today_date())
+    # 快照變動：這個 session 上次確認之後的都列出來 (第一次進來看最近一批)
+    version = observe_changes(df, dispo_idx, jail_status)
+    seen = st.session_state.setdefault('changes_seen', max(version - 1, 0))
+    changes = get_change_feed().since(seen)
+    watch_changes(version)
+    if not changes.empty: render_change_strip(changes, version)
+    marks = changes.groupby('代號')['變動'].agg(lambda ks: "".join(change_feed.KIND_ICON[k] for k in ks)).to_dict() \
+        if not changes.empty else {}
 
     if not df.empty:
-        last_date = df.iloc[0].get('最近一次日期', '未知')
-        col_info.info(f"資料來源：Google Sheet | 資料日期：{last_date}")
+        last_date = df.iloc[0].get('最近一次日期')
+        last_date = last_date.strftime('%Y-%m-%d') if pd.notna(last_date) else '未知'
+        check = disposition_engine.cross_check(df)
+        agree = f" | App 推算一致 {check['days_match']}/{check['checked']}" if check['checked'] else ""
+        col_info.info(f"資料來源：Google Sheet | 資料日期：{last_date} | {snapshot_label('sheet')}{agree}")
+        
+        # ✅ 修正 3: 代號已在 normalize_risk_df 去空白，這裡整欄 join 處置狀態 (assign 是淺複製)
+        codes = df['代號']
+        df = df.assign(in_jail=codes.isin(jail_status.index), release_date=codes.map(jail_status['迄日']))
         
         # 修改邏輯：只有在「不勾選」顯示處置股時，才進行過濾
         if not show_jail_stocks:
-            df = df[~df['代號'].isin(jail_codes)]
+            df = df[~df['in_jail']]
         
-        # ✅ 新增：搜尋過濾邏輯
+        # ✅ 新增：搜尋過濾邏輯 (索引查詢，純字面比對；名單外的股票另外列出可直接看 K 線)
         if search_term:
-            df = df[df['代號'].astype(str).str.contains(search_term) | df['名稱'].astype(str).str.contains(search_term)]
-
-        # ✅ 優化排序：天數越少越前面 (權重最大)，其次是風險等級
-        def sort_key(row):
-            try: days = int(row.get('最快處置天數', 99))
-            except: days = 99
-            
-            # 前端強制修正風險等級 (讓排序正確)
-            risk_level = row.get('風險等級', '低')
-            if days <= 2: risk_level = '高'
-            
-            risk_map = {'高': 3, '中': 2, '低': 1}
-            risk_score = risk_map.get(risk_level, 0)
-            
-            # 排序公式：
-            # 1. 天數 (越小分越高): (100 - days) * 100000 -> 權重最大，確保剩1天的排在剩2天的前面
-            # 2. 風險 (越高分越高): risk_score * 1000
-            return ((100 - days) * 100000) + (risk_score * 1000)
-
-        data_list = df.to_dict('records')
-        data_list.sort(key=sort_key, reverse=True)
+            sidx = get_search_index()
+            sidx.extend(zip(df['代號'], df['名稱']))
+            hits = sidx.search(search_term)
+            df = df[df['代號'].isin({c for c, _ in hits})]
+            listed = set(df['代號'])
+            render_search_others([h for h in hits if h[0] not in listed][:SEARCH_OTHERS_LIMIT], expanded=df.empty)
+
+        # 排序已在 normalize_risk_df 依 sort_score 排好，這裡只轉出這一頁
+        st.subheader(f"📋 潛在風險名單 (共 {len(df)} 檔)")
         
-        st.subheader(f"📋 潛在風險名單 (共 {len(data_list)} 檔)")
-        
-        if len(data_list) == 0:
+        if len(df) == 0:
             st.info("目前沒有符合條件的股票。")
         
-        for row in data_list: 
-            # 額外標註一下是否在處置中
-            is_in_jail = str(row['代號']) in jail_codes
-            if is_in_jail:
-                row['名稱'] = f"(🔒處置中) {row['名稱']}"
-            render_risk_item(row)
+        # ✅ 分頁：只畫前 N 檔，按「載入更多」再往下加；篩選條件一變就回到第一頁
+        view_sig = (show_jail_stocks, search_term, len(df))
+        if st.session_state.get('warn_view_sig') != view_sig:
+            st.session_state['warn_view_sig'] = view_sig
+            st.session_state['warn_visible'] = PAGE_SIZE
+        visible_list = page_records(df.iloc[:st.session_state['warn_visible']])
+        
+        # ✅ 過濾完才整批預抓 K 線 (只抓這一頁)，一趟抓完再分給各張卡片
+        chart_map = None
+        if not chart_on_demand and visible_list:
+            with st.spinner("載入 K 線資料中..."):
+                chart_map = prefetch_chart_data(tuple(str(r['代號']).strip() for r in visible_list))
+        # 已經有 K 線快照的 (任何 session 抓過都算) 整頁一次推算警戒價/量
+        levels = disposition_engine.alert_levels(STORE.peek_many('chart', [r['代號'] for r in visible_list]))
+        for row in visible_list:
+            if row['代號'] in levels.index: row.update(levels.loc[row['代號']].to_dict())
+
+        if live_mode and visible_list:
+            render_live_board(tuple((r['代號'], r['名稱'], str(r.get('市場', '')), r['警戒價'], r['警戒量'])
+                                    for r in visible_list))
+        
+        for row in visible_list: 
+            if row['代號'] in marks: row['變動標記'] = marks[row['代號']] + " "
+            # 額外標註一下是否在處置中 (知道出關日就一併標上)
+            if row['in_jail']:
+                until = f" 至 {period_parser.to_roc(row['release_date'])}" if pd.notna(row['release_date']) else ""
+                row['名稱'] = f"(🔒處置中{until}) {row['名稱']}"
+            chart_df = chart_map.get(str(row['代號']).strip(), pd.DataFrame()) if chart_map is not None else None
+            render_risk_item(row, chart_df)
+        
+        remaining = len(df) - len(visible_list)
+        if remaining > 0:
+            if st.button(f"⬇️ 載入更多 (還有 {remaining} 檔)"):
+                st.session_state['warn_visible'] += PAGE_SIZE
+                st.rerun()
     else:
         st.warning("無法讀取資料，請檢查 Google Sheet 連線或確認後端程式是否已執行。")
 
 def run_jail_page():
     st.title("🔒 處置中股票")
     if st.button("🔄 抓取最新名單"):
-        st.cache_data.clear()
         with st.spinner("連線中..."):
-            df_dispo = fetch_all_disposition_stocks()
+            refresh_datasets('disposition')
+            idx = get_disposition_index()
+            df_dispo = fetch_all_disposition_stocks(idx)
             if not df_dispo.empty:
                 st.success(f"目前共有 {len(df_dispo)} 檔處置股。")
                 def highlight_status(val):
@@ -631,10 +1091,109 @@ def run_jail_page():
                 except:
                     st.dataframe(df_dispo, hide_index=True, use_container_width=True)
             else: st.success("目前沒有處置股。")
+            render_release_calendar(idx)
 
-with st.sidebar:
-    st.title("⚡ 監控中心")
-    page = st.radio("功能", ["⚠️ 處置預警", "🔒 處置中股票"])
+def _change(prev, cur, fmt=str):
+    return fmt(cur) if pd.isna(prev) else f"{fmt(prev)} → {fmt(cur)}" if prev != cur else fmt(cur)
 
-if page == "⚠️ 處置預警": run_warning_page()
-elif page == "🔒 處置中股票": run_jail_page()
+def run_history_page():
+    st.title("📊 風險變化")
+    hist = get_history_store()
+    movers = hist.movers(limit=MOVERS_LIMIT)
+    if movers.empty:
+        st.info("歷史資料還不夠 (至少要兩個交易日的 Sheet 快照)。")
+    else:
+        prev = movers.attrs.get('prev')
+        st.subheader(f"🚀 風險變化最大 ({prev or '首次'} → {movers.attrs['date']})")
+        risk = lambda v: history_store.RISK_LABEL.get(int(v), '-')
+        view = pd.DataFrame({
+            '代號': movers['code'], '名稱': movers['name'],
+            '風險等級': [_change(p, c, risk) for p, c in zip(movers['prev_risk'], movers['risk'])],
+            '最快處置天數': [_change(p, c, int) for p, c in zip(movers['prev_days'], movers['days'])],
+            '近10日注意次數': [_change(p, c, int) for p, c in zip(movers['prev_cnt10'], movers['cnt10'])],
+        })
+        st.dataframe(view, hide_index=True, use_container_width=True)
+
+    st.subheader("📈 單檔走勢")
+    df = fetch_data_from_sheet()
+    options = list(zip(df['代號'], df['名稱'])) if not df.empty else []
+    if not movers.empty:
+        top = set(movers['code'])
+        options.sort(key=lambda o: o[0] not in top)  # 變化大的排前面
+    pick = st.selectbox("選擇股票", options, format_func=lambda o: f"{o[0]} {o[1]}", key="history_pick")
+    if pick:
+        trend = hist.trend(pick[0])
+        if len(trend) < 2:
+            st.info("這檔的歷史資料還不到兩天。")
+        else:
+            st.line_chart(trend[['days', 'cnt10', 'cnt30']].rename(
+                columns={'days': '最快處置天數', 'cnt10': '近10日注意次數', 'cnt30': '近30日注意次數'}))
+            st.line_chart(trend[['risk']].rename(columns={'risk': '風險等級 (1低 2中 3高)'}), height=160)
+
+def render_release_calendar(idx):
+    """出關日曆：未來 RELEASE_WINDOW 個營業日內出關的股票，另列出關後又再次處置的"""
+    today = get_today_date()
+    st.subheader(f"📅 出關日曆 (未來 {RELEASE_WINDOW} 個營業日)")
+    rel = idx.releasing_within(today, RELEASE_WINDOW)
+    if rel.empty:
+        st.info("近期沒有即將出關的處置股。")
+    else:
+        cal = rel.assign(出關日=rel['迄日'].map(period_parser.to_roc))
+        st.dataframe(cal[['出關日', '剩餘營業日', '市場', '代號', '名稱', '處置措施']], hide_index=True, use_container_width=True)
+
+    again = idx.reentries(today)
+    if not again.empty:
+        st.subheader("🔁 出關後再次處置")
+        again = again.assign(前次出關=again['前次迄日'].map(period_parser.to_roc))
+        st.dataframe(again[['市場', '代號', '名稱', '前次出關', '處置期間', '處置措施']], hide_index=True, use_container_width=True)
+
+def admin_token():
+    """管理員密語：環境變數 STOCK_ADMIN_TOKEN 優先，其次 st.secrets["admin_token"]；都沒設回傳空字串 (沒有人能改設定)"""
+    token = os.environ.get("STOCK_ADMIN_TOKEN", "")
+    if token: return token
+    try:
+        return str(st.secrets.get("admin_token", ""))
+    except Exception:
+        return ""
+
+def is_admin():
+    """網址帶 ?admin=<密語> 且與設定的密語相同"""
+    token = admin_token()
+    given = st.query_params.get("admin", "")
+    return bool(token) and hmac.compare_digest(given.encode(), token.encode())
+
+def render_metrics_panel(can_edit):
+    """各階段耗時、快取命中、上游錯誤；只有管理員 (can_edit) 能開關計時、清除統計，其他人唯讀"""
+    with st.expander("🛠️ 效能監控"):
+        on = st.checkbox("啟用計時", value=metrics.enabled(), disabled=not can_edit)
+        if can_edit: metrics.set_enabled(on)
+        else: st.caption("唯讀 (網址加上 ?admin=<密語> 才能調整)")
+        rows, counters = metrics.summary()
+        if rows:
+            st.dataframe(pd.DataFrame(rows).round(1), hide_index=True, use_container_width=True)
+        if counters:
+            st.dataframe(pd.DataFrame(counters), hide_index=True, use_container_width=True)
+        st.caption("Yahoo 排程")
+        st.dataframe(pd.DataFrame([get_yahoo_scheduler().stats()]), hide_index=True, use_container_width=True)
+        st.caption("共用快取")
+        st.dataframe(pd.DataFrame([get_shared_cache().stats()]), hide_index=True, use_container_width=True)
+        st.caption("首次 import 耗時 (ms)")
+        st.dataframe(pd.DataFrame([lazy_deps.import_times()]), hide_index=True, use_container_width=True)
+        if not rows and not counters:
+            st.caption("尚無資料")
+        st.download_button("⬇️ 匯出 (Prometheus)", metrics.render_prometheus(), file_name="metrics.prom", mime="text/plain")
+        if can_edit and st.button("🧹 清除統計"):
+            metrics.reset()
+
+# report.py 等離線工具 (STOCK_HEADLESS=1) import 時只要函式與快照，不畫頁面
+if os.environ.get("STOCK_HEADLESS") != "1":
+    with st.sidebar:
+        st.title("⚡ 監控中心")
+        page = st.radio("功能", ["⚠️ 處置預警", "🔒 處置中股票", "📊 風險變化"])
+        admin = is_admin()
+        if admin or metrics.enabled():
+            render_metrics_panel(admin)
+
+    if page == "⚠️ 處置預警": run_warning_page()
+    elif page == "🔒 處置中股票": run_jail_page()
+    elif page == "📊 風險變化": run_history_page()
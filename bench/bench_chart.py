@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+K 線圖建構 micro-benchmark
+用法：python bench/bench_chart.py [--repeat N]
+
+3 個月 / 1 年 / 3 年 區間下，比較舊版畫法 (category 軸、整欄 strftime、每根 K 棒都畫)
+與 chart_builder (合併 K 棒 + LTTB 均線 + WebGL) 的建圖耗時、序列化耗時與 JSON 大小，
+以及日/週/月 K 重取樣耗時。
+K 線為固定種子的隨機漫步，不連網。
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import chart_builder  # noqa: E402
+import ohlcv_store  # noqa: E402
+
+
+def make_bars(years=3, seed=0):
+    idx = pd.bdate_range(end='2026-10-16', periods=int(years * 250), name='Date')
+    rng = np.random.default_rng(seed)
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, len(idx))))
+    opn = close * (1 + rng.normal(0, 0.005, len(idx)))
+    df = pd.DataFrame({'Open': opn, 'High': np.maximum(opn, close) * 1.01, 'Low': np.minimum(opn, close) * 0.99,
+                       'Close': close, 'Volume': rng.integers(1e5, 1e7, len(idx)).astype('float64')}, index=idx)
+    return ohlcv_store.add_moving_averages(df)
+
+
+def legacy_build(df, title):
+    """改版前 plot_stock_analysis 的建圖部分"""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    df = df.copy()
+    df.index = df.index.strftime('%Y-%m-%d')
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.05,
+                        row_heights=[0.7, 0.3], subplot_titles=(title, '成交量'))
+    fig.add_trace(go.Candlestick(x=df.index, open=df['Open'], high=df['High'],
+                                 low=df['Low'], close=df['Close'], name='K線',
+                                 increasing_line_color='#ff4b4b', decreasing_line_color='#00da3c'), row=1, col=1)
+    for ma, color in chart_builder.MA_COLORS.items():
+        if ma in df.columns:
+            fig.add_trace(go.Scatter(x=df.index, y=df[ma], line=dict(color=color, width=1), name=ma), row=1, col=1)
+    colors_vol = ['#ff4b4b' if c >= o else '#00da3c' for c, o in zip(df['Close'], df['Open'])]
+    fig.add_trace(go.Bar(x=df.index, y=df['Volume'], marker_color=colors_vol, name='成交量'), row=2, col=1)
+    fig.update_layout(height=500, template='plotly_dark', xaxis_rangeslider_visible=False,
+                      showlegend=False, margin=dict(l=10, r=10, t=30, b=10))
+    fig.update_xaxes(type='category', tickmode='auto', nticks=10)
+    return fig
+
+
+def measure(build, repeat):
+    """回傳 (建圖 ms, 序列化 ms, JSON KB)；序列化同 st.plotly_chart (to_dict + to_json)"""
+    import plotly.io as pio
+    builds, dumps = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fig = build()
+        t1 = time.perf_counter(); spec = pio.to_json(fig.to_dict(), validate=False)
+        builds.append((t1 - t0) * 1000); dumps.append((time.perf_counter() - t1) * 1000)
+    return statistics.median(builds), statistics.median(dumps), len(spec) / 1024
+
+
+def timeit_ms(fn):
+    t0 = time.perf_counter(); fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    bars = make_bars()
+    measure(lambda: chart_builder.build(bars.tail(60), 'warm', 3), 1)   # plotly 第一次載入不算
+    print(f"{'區間':<8}{'K 棒':>6}  {'版本':<8}{'建圖 ms':>9}{'序列化 ms':>11}{'JSON KB':>9}")
+    for label, months in (('3 個月', 3), ('1 年', 12), ('3 年', 36)):
+        df = chart_builder.window(bars, months)
+        for name, build in (('舊版', lambda: legacy_build(df, 'bench')),
+                            ('新版', lambda: chart_builder.build(chart_builder.resample(df, '日'), 'bench', months))):
+            b, d, kb = measure(build, args.repeat)
+            print(f"{label:<8}{len(df):>6}  {name:<8}{b:>9.1f}{d:>11.1f}{kb:>9.1f}")
+    print()
+    for tf in chart_builder.TIMEFRAMES:
+        ms = statistics.median(timeit_ms(lambda: chart_builder.resample(bars, tf)) for _ in range(args.repeat))
+        print(f"{tf}K 重取樣 (3 年日 K)：{ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
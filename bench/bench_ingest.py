@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+處置公告解析 throughput 測試
+用法：python bench/bench_ingest.py [--rows 1000 10000] [--repeat N]
+
+把 bench/fixtures 的 TWSE punish / TPEx OpenAPI / TPEx aaData 錄製資料複製到指定筆數，
+比較舊版逐筆解析 (每筆 or 鏈、每格去 HTML、每格解析日期) 與 disposition_ingest
+(偵測一次格式後逐筆解碼) 的 rows/sec。另外檢查：
+- 兩版解析結果一致 (代號、期間、措施；aaData 的名稱舊版會撿到序號欄，只比新版是否為文字)
+- 欄位改名時新版回報對不到 + schema_drift metrics，而不是回空名單
+- 前幾筆混進 5 碼代號 (CB/ETF) 時只丟那幾筆，其他照樣解析
+有不一致就 exit 1。
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+import disposition_ingest  # noqa: E402
+import metrics  # noqa: E402
+import period_parser  # noqa: E402
+
+FIXTURES = os.path.join(HERE, "fixtures")
+SOURCES = (("TWSE", "twse_punish.json"), ("TPEx OpenAPI", "tpex_openapi.json"), ("TPEx 舊端點", "tpex_aadata.json"))
+
+
+# ---------- 改版前 app.py 的解析 (只留回傳欄位) ----------
+def _clean_text(x):
+    return re.sub(r'<[^>]+>', '', str(x)).replace("&nbsp;", " ").strip()
+
+
+def _pick_4digit_code_from_values(obj):
+    vals = obj.values() if isinstance(obj, dict) else obj
+    for v in vals:
+        t = re.sub(r'<[^>]+>', '', str(v)).strip()
+        if re.fullmatch(r'\d{4}', t):
+            return t
+    return ""
+
+
+def legacy_twse(text):
+    out = []
+    for item in json.loads(text.lstrip("﻿").strip()):
+        code = item.get('Code', '').strip()
+        if not (code.isdigit() and len(code) == 4): continue
+        out.append((code, item.get('Name', '').strip(), item.get('DispositionPeriod', '').strip(),
+                    item.get('DispositionMeasures', '').strip()))
+    return out
+
+
+def legacy_tpex_openapi(text):
+    payload = json.loads(text.lstrip("﻿").strip())
+    if isinstance(payload, dict) and "data" in payload:
+        payload = payload["data"]
+    out = []
+    for item in payload:
+        code = _clean_text(item.get("SecuritiesCompanyCode") or item.get("證券代號") or item.get("代號") or "")
+        if not code:
+            code = _pick_4digit_code_from_values(item)
+        if not (code.isdigit() and len(code) == 4):
+            continue
+        name = _clean_text(item.get("CompanyName") or item.get("證券名稱") or item.get("名稱") or "")
+        period_raw = _clean_text(item.get("DispositionPeriod") or item.get("處置期間") or item.get("處置起迄") or "")
+        raw_content = _clean_text(item.get("DisposalCondition") or item.get("DispositionReasons")
+                                  or item.get("處置措施") or item.get("處置內容") or "")
+        out.append((code, name, period_raw, raw_content))
+    return out
+
+
+def legacy_tpex_aadata(text):
+    out = []
+    for row in json.loads(text.lstrip("﻿").strip()).get("aaData", []):
+        if not isinstance(row, list) or len(row) == 0:
+            continue
+        cells = [_clean_text(x) for x in row]
+        code = next((c for c in cells if re.fullmatch(r"\d{4}", c)), "")
+        if not code:
+            continue
+        has_period = [period_parser.parse_period(period_parser.normalize(c)) is not None for c in cells]
+        name = next((c for c, p in zip(cells, has_period) if c and c != code and not p), "")
+        period_raw = next((c for c, p in zip(cells, has_period) if p), "")
+        raw_content = next((c for c in cells if ("分鐘" in c) or ("分盤" in c)), "")
+        if not raw_content:
+            raw_content = " ".join(cells)
+        out.append((code, name, period_raw, raw_content))
+    return out
+
+
+LEGACY = {"TWSE": legacy_twse, "TPEx OpenAPI": legacy_tpex_openapi, "TPEx 舊端點": legacy_tpex_aadata}
+
+
+# ---------- 資料 ----------
+def replicate(text, n):
+    """fixture 的資料列複製到 n 筆，外層格式 (list / {"aaData": [...]}) 不變"""
+    payload = json.loads(text.lstrip("﻿"))
+    rows = payload["aaData"] if isinstance(payload, dict) else payload
+    rows = (rows * (n // len(rows) + 1))[:n]
+    return json.dumps({**payload, "aaData": rows} if isinstance(payload, dict) else rows, ensure_ascii=False)
+
+
+def rename_keys(text):
+    """模擬上游改欄位名稱 (值不變，期間改成認不出來的字)"""
+    rows = json.loads(text.lstrip("﻿"))
+    return json.dumps([{f"{k}_v2": ("見公告" if "Period" in k else v) for k, v in r.items()} for r in rows],
+                      ensure_ascii=False)
+
+
+def odd_codes(text):
+    """把每個來源的第 1、3 筆代號改成 5 碼 (CB/ETF 之類)，落在偵測格式用的樣本裡"""
+    payload = json.loads(text.lstrip("﻿"))
+    rows = payload["aaData"] if isinstance(payload, dict) else payload
+    for i in (0, 2):
+        row = rows[i]
+        keys = range(len(row)) if isinstance(row, list) else list(row)
+        for k in keys:
+            if re.fullmatch(r"\d{4}", disposition_ingest.clean(row[k])):
+                row[k] = disposition_ingest.clean(row[k]) + "1"
+                break
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def best_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        period_parser.parse_period.cache_clear()   # 每輪都從冷快取開始，兩版公平
+        t0 = time.perf_counter(); fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+# ---------- 檢查 ----------
+def check_equal(source, old, new):
+    if len(old) != len(new):
+        return [f"{source}: 筆數 舊 {len(old)} / 新 {len(new)}"]
+    errs = []
+    for a, b in zip(old, new):
+        if (a[0], a[2], a[3]) != (b[0], b[2], b[3]):
+            errs.append(f"{source}: 舊 {a} / 新 {b}")
+        elif source == "TPEx 舊端點" and not (b[1] and not b[1].isdigit()):
+            errs.append(f"{source}: 名稱欄沒對到 {b}")
+        elif source != "TPEx 舊端點" and a[1] != b[1]:
+            errs.append(f"{source}: 名稱 舊 {a[1]} / 新 {b[1]}")
+    return errs[:5]
+
+
+def check_drift(text):
+    before = _drift_count()
+    rows, err = disposition_ingest.parse(rename_keys(text), "drift-check")
+    errs = []
+    if rows or not err:
+        errs.append(f"欄位改名沒被發現：rows={len(rows)} err={err}")
+    if _drift_count() <= before:
+        errs.append("欄位改名沒記到 schema_drift metrics")
+    return errs
+
+
+def check_odd_rows(source, text):
+    odd = odd_codes(text)
+    rows, err = disposition_ingest.parse(odd, source)
+    expected = len(LEGACY[source](odd))
+    if err or len(rows) != expected:
+        return [f"{source}: 混進 5 碼代號後 新 {len(rows)} 筆 / 舊 {expected} 筆 ({err})"]
+    return []
+
+
+def _drift_count():
+    return sum(c['value'] for c in metrics.summary()[1] if c['name'] == "schema_drift")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    metrics.set_enabled(True)
+    texts = {src: open(os.path.join(FIXTURES, f), encoding="utf-8").read() for src, f in SOURCES}
+
+    errors = []
+    for src, text in texts.items():
+        new, err = disposition_ingest.parse(text, src)
+        errors += [f"{src}: {err}"] if err else check_equal(src, LEGACY[src](text), new)
+        errors += check_odd_rows(src, text)
+    errors += check_drift(texts["TPEx OpenAPI"])
+
+    print(f"{'來源':<14}{'筆數':>7}{'舊版 ms':>10}{'新版 ms':>10}{'舊版 rows/s':>14}{'新版 rows/s':>14}{'倍數':>7}")
+    for n in args.rows:
+        for src, text in texts.items():
+            big = replicate(text, n)
+            old_ms = best_ms(lambda: LEGACY[src](big), args.repeat)
+            new_ms = best_ms(lambda: disposition_ingest.parse(big, src), args.repeat)
+            print(f"{src:<14}{n:>7}{old_ms:>10.1f}{new_ms:>10.1f}{n / old_ms * 1000:>14,.0f}"
+                  f"{n / new_ms * 1000:>14,.0f}{old_ms / new_ms:>6.1f}x")
+
+    if errors:
+        print("\n❌ 不一致：")
+        for e in errors: print("  " + e)
+        return 1
+    print("\n✅ 解析結果一致、欄位改名有回報、零星 5 碼代號不影響整批")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
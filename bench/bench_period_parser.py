@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+處置期間解析 micro-benchmark
+用法：python bench/bench_period_parser.py [--repeat N]
+
+比較舊版 extract_dates_any (每次呼叫現場編譯/比對) 與 period_parser
+(預編譯 + LRU) 在冷/熱快取下的單次耗時。語料取自 TWSE punish、
+TPEx OpenAPI 與舊 aaData 端點實際出現過的期間字串。
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import period_parser  # noqa: E402
+
+CORPUS = [
+    # TWSE openapi /announcement/punish
+    "114/12/24~115/01/09",
+    "114/12/26~115/01/12",
+    "115/01/05~115/01/16",
+    "114/12/19～115/01/05",
+    # TPEx OpenAPI tpex_disposal_information (7 碼)
+    "1141223~1150107",
+    "1141224-1150108",
+    "1150105~1150116",
+    "1141230",
+    # TPEx 舊 aaData (含 HTML 清掉後的字串)
+    "114/12/24 ~ 115/01/09",
+    "自114年12月24日起至115年01月09日止",
+    "114年12月26日至115年1月12日",
+    # 西元格式
+    "2025.12.24-2026.01.09",
+    "2025-12-24~2026-01-09",
+    # aaData 其他欄位 (名稱、措施)，舊版名稱掃描時也會被丟進來解析
+    "環球晶",
+    "每5分鐘撮合一次",
+    "第二次處置 每20分鐘撮合",
+    "6488",
+    "",
+]
+
+
+def legacy_extract_dates_any(s):
+    """舊版實作 (原 app.py)，僅供比較"""
+    s = str(s or "").strip()
+    p1 = re.findall(r'(\d{2,4})[./-](\d{1,2})[./-](\d{1,2})', s)
+    p2 = re.findall(r'(\d{2,4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日?', s)
+    p3 = re.findall(r'(\d{3})(\d{2})(\d{2})', s)
+    dates = []
+    for y, m, d in p1 + p2 + p3:
+        try:
+            y = int(y); m = int(m); d = int(d)
+            if y < 1911: y += 1911
+            dates.append(date(y, m, d))
+        except Exception:
+            pass
+    return dates
+
+
+def legacy_parse(s):
+    ds = legacy_extract_dates_any(s)
+    if len(ds) < 2: return None
+    start, end = ds[0], ds[1]
+    if start > end: start, end = end, start
+    return start, end
+
+
+def new_parse(s):
+    return period_parser.parse_period(period_parser.normalize(s))
+
+
+def check_equivalence():
+    for s in CORPUS:
+        assert legacy_extract_dates_any(s) == list(period_parser.extract_dates(period_parser.normalize(s))), s
+        assert legacy_parse(s) == new_parse(s), s
+
+
+def per_call_us(fn, repeat, setup=None):
+    def run():
+        if setup: setup()
+        for s in CORPUS: fn(s)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return best / len(CORPUS) * 1e6
+
+
+def clear_caches():
+    period_parser.extract_dates.cache_clear()
+    period_parser.parse_period.cache_clear()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    check_equivalence()
+    rows = [
+        ("legacy extract_dates_any", per_call_us(legacy_parse, args.repeat)),
+        ("period_parser (cold cache)", per_call_us(new_parse, args.repeat, setup=clear_caches)),
+        ("period_parser (warm cache)", per_call_us(new_parse, args.repeat)),
+    ]
+    print(f"corpus: {len(CORPUS)} strings, best of {args.repeat}")
+    for label, us in rows:
+        print(f"{label:<28} {us:8.2f} us/call  ({rows[0][1] / us:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+冷啟動量測：每個相依套件在全新 process 裡 import 要多久
+- 各套件分開量 (python -X importtime 的最外層累計時間)
+- app.py 模組層的 import 敘述 (用 ast 抽出來單獨跑，不會跑頁面)，
+  並列出哪些 lazy_deps.HEAVY 套件被提早載入了 —— 有的話就是退步
+
+用法：
+  python bench/bench_startup.py
+  python bench/bench_startup.py --save startup.json
+  python bench/bench_startup.py --compare startup.json   # 慢超過 --tolerance 或重新 eager 載入就 exit 1
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import lazy_deps  # noqa: E402
+
+EAGER = ('streamlit', 'pandas')
+
+
+def import_ms(stmt, cwd=None):
+    """全新 process 執行 stmt，回傳 -X importtime 最外層模組累計耗時 (ms)"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", stmt], cwd=cwd,
+                          capture_output=True, text=True, check=True)
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line: continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):   # 沒縮排 = 這行 stmt 直接 import 的
+            total += int(cumulative)
+    return total / 1000, proc.stdout
+
+
+def app_import_block():
+    """app.py 模組層的所有 import 敘述 (函式內的延後 import 不算)"""
+    with open(os.path.join(ROOT, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(n) for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom)))
+
+
+def measure(repeat):
+    out = {}
+    for name in EAGER + lazy_deps.HEAVY:
+        out[name] = statistics.median(import_ms(f"import {name}")[0] for _ in range(repeat))
+    probe = (app_import_block() + "\nimport sys\n"
+             f"print(','.join(m for m in {lazy_deps.HEAVY!r} if m in sys.modules))")
+    runs = [import_ms(probe, cwd=ROOT) for _ in range(repeat)]
+    out['app.py imports'] = statistics.median(ms for ms, _ in runs)
+    eager = [m for m in runs[-1][1].strip().split(",") if m]
+    return out, eager
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--save", help="結果存成 JSON")
+    ap.add_argument("--compare", help="與先前存的 JSON 比較")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="允許比基準慢的比例")
+    args = ap.parse_args()
+
+    results, eager = measure(args.repeat)
+    for label, ms in results.items():
+        print(f"{label:<32} {ms:10.1f} ms")
+    # 有些套件會被 streamlit / gspread 自己帶進來 (例如 plotly、requests)，只列出來參考
+    print(f"\napp.py import 區塊已載入的重量級套件: {eager or '無'}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "eager": eager}, f, ensure_ascii=False, indent=1)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        worse = [f"{label}: {base['results'][label]:.1f} → {ms:.1f} ms" for label, ms in results.items()
+                 if base["results"].get(label) and ms > base["results"][label] * (1 + args.tolerance)
+                 and ms - base["results"][label] > 5.0]
+        worse += [f"{m} 變成啟動時就載入" for m in eager if m not in base.get("eager", [])]
+        if worse:
+            print("\n❌ 冷啟動退步：\n" + "\n".join(worse))
+            sys.exit(1)
+        print("\n✅ 沒有超過容許範圍的退步")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Yahoo 錯誤分類檢查 (不連網)
+用法：python bench/check_yahoo_errors.py
+
+走真正安裝的 yf.download，只把 Ticker.history 換掉，模擬 yf 吞掉的個別代號錯誤：
+- 限流 (YFRateLimitError)：要觸發退避重試，重試用完列在 failed
+- 連線錯誤：列在 failed
+- 查無資料 (YFPricesMissingError，「possibly delisted」)：不在 failed，當成真的沒資料
+另外用 app._load_chart_batch 走一次：被限流的代號不能進 TickerIndex 冷卻期 (兩個後綴都要還在)，
+恢復後要抓得到；明說查無資料的才進冷卻期。其餘上游用 bench/stand_ins 的替身。
+有不符就 exit 1。
+"""
+import logging
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+import yahoo_scheduler  # noqa: E402
+
+
+def fake_history(behaviour):
+    """behaviour: {symbol: 'ok' | 'rate_limit' | 'network' | 'no_data'}"""
+    from yfinance.exceptions import YFPricesMissingError, YFRateLimitError
+
+    def history(self, *a, **k):
+        kind = behaviour.get(self.ticker, 'ok')
+        if kind == 'rate_limit': raise YFRateLimitError()
+        if kind == 'network': raise ConnectionError("Failed to establish a new connection")
+        if kind == 'no_data': raise YFPricesMissingError(self.ticker, "(period=3mo)")
+        idx = pd.date_range('2026-10-01', periods=5, freq='B', name='Date')
+        return pd.DataFrame({c: np.arange(5.0) + 1 for c in ('Open', 'High', 'Low', 'Close', 'Volume')}, index=idx)
+    return history
+
+
+def check_fetch(behaviour, expect_got, expect_failed, expect_throttled):
+    import yfinance as yf
+    yf.Ticker.history = fake_history(behaviour)
+    sched = yahoo_scheduler.YahooScheduler(yf.download, rate=1000, burst=1000, max_retries=2,
+                                           base_backoff=0.001, max_backoff=0.01)
+    got, failed = sched.fetch(list(behaviour), period='3mo')
+    throttled = sched.stats()['throttled'] > 0
+    ok = set(got) == set(expect_got) and set(failed) == set(expect_failed) and throttled == expect_throttled
+    print(f"{'✅' if ok else '❌'} {behaviour} → got={sorted(got)} failed={sorted(failed)} throttled={throttled}")
+    return ok
+
+
+def check_app(behaviour):
+    """被吞掉的限流不能讓 _load_chart_batch 把代號放進冷卻期"""
+    import yfinance as yf
+    import stand_ins
+    real_download = yf.download
+    os.chdir(stand_ins.prepare_workdir(tempfile.mkdtemp(prefix="stock_yahoo_check_")))
+    os.environ["STOCK_HEADLESS"] = "1"
+    os.environ["STOCK_CACHE_URL"] = "off"
+    stand_ins.install()
+    yf.download = real_download   # Yahoo 走真的 yf.download + 假的 Ticker.history
+    logging.disable(logging.WARNING)
+    import app
+    sched = app.get_yahoo_scheduler()
+    sched._bucket = yahoo_scheduler.TokenBucket(1000, 1000)
+    sched.base_backoff, sched.max_backoff, sched.max_retries = 0.001, 0.01, 1
+    idx = app.get_ticker_index()
+    yf.Ticker.history = fake_history(behaviour)
+
+    behaviour.update({'2330.TW': 'rate_limit', '2330.TWO': 'rate_limit', '9999.TW': 'no_data', '9999.TWO': 'no_data'})
+    out = app._load_chart_batch(['2330', '9999'])
+    results = [('限流時沒有 K 線', '2330' not in out),
+               ('限流的兩個後綴都沒進冷卻期', len(idx.candidates('2330')) == 2),
+               ('查無資料的進冷卻期', idx.candidates('9999') == [])]
+    behaviour['2330.TW'] = behaviour['2330.TWO'] = 'ok'
+    results.append(('恢復後抓得到', '2330' in app._load_chart_batch(['2330'])))
+    for label, ok in results:
+        print(f"{'✅' if ok else '❌'} app: {label}")
+    return all(ok for _, ok in results)
+
+
+def main():
+    import yfinance as yf
+    original = yf.Ticker.history
+    try:
+        results = [
+            check_fetch({'2330.TW': 'rate_limit', '2454.TW': 'rate_limit'}, [], ['2330.TW', '2454.TW'], True),
+            check_fetch({'2330.TW': 'ok', '2454.TW': 'rate_limit'}, ['2330.TW'], ['2454.TW'], True),
+            check_fetch({'2330.TW': 'ok', '2454.TW': 'network'}, ['2330.TW'], ['2454.TW'], False),
+            check_fetch({'2330.TW': 'ok', '9999.TW': 'no_data'}, ['2330.TW'], [], False),
+            check_app({}),
+        ]
+    finally:
+        yf.Ticker.history = original
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
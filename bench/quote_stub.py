@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+盤中報價本機替身：回應格式同 TWSE getStockInfo.jsp，價格/量每次請求隨機走一步
+
+用法：
+  python bench/quote_stub.py --port 8765
+  STOCK_QUOTE_URL=http://127.0.0.1:8765/stock/api/getStockInfo.jsp streamlit run app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PATH = "/stock/api/getStockInfo.jsp"
+
+
+class Market:
+    """每檔一個隨機漫步，起始價由代號決定 (每次啟動一樣)"""
+
+    def __init__(self, step=0.01, seed=None):
+        self.step = step
+        self.rng = random.Random(seed)
+        self.state = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def quote(self, ex, code):
+        with self.lock:
+            s = self.state.get(code)
+            if s is None:
+                base = 20 + zlib.crc32(code.encode()) % 900
+                s = self.state[code] = {'y': float(base), 'z': float(base), 'v': 0}
+            s['z'] = round(max(0.01, s['z'] * (1 + self.rng.uniform(-self.step, self.step * 1.2))), 2)
+            s['v'] += self.rng.randint(0, 500)
+            return {'c': code, 'ex': ex, 'n': code, 'z': f"{s['z']:.4f}", 'y': f"{s['y']:.4f}",
+                    'v': str(s['v']), 't': time.strftime('%H:%M:%S'), 'b': f"{s['z']:.4f}_"}
+
+
+def make_handler(market):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != PATH:
+                self.send_response(404); self.end_headers(); return
+            market.requests += 1
+            chans = parse_qs(url.query).get('ex_ch', [''])[0].split('|')
+            items = []
+            for ch in filter(None, chans):
+                ex, _, rest = ch.partition('_')
+                items.append(market.quote(ex, rest.rsplit('.', 1)[0]))
+            body = json.dumps({'msgArray': items, 'rtcode': '0000'}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+def start(port=0, step=0.01, seed=None):
+    """背景啟動，回傳 (server, market, url)；port=0 自動挑"""
+    market = Market(step, seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(market))
+    threading.Thread(target=server.serve_forever, daemon=True, name="quote-stub").start()
+    return server, market, f"http://127.0.0.1:{server.server_address[1]}{PATH}"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--step", type=float, default=0.01, help="每次請求的最大漲跌比例")
+    args = ap.parse_args()
+    market = Market(args.step)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(market))
+    print(f"STOCK_QUOTE_URL=http://127.0.0.1:{args.port}{PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
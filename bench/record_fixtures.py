@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+從正式上游錄製 benchmark 用的 fixtures (需要網路；Sheet 需要憑證)
+用法：python bench/record_fixtures.py [--tickers 2330.TW 6488.TWO] [--skip-sheet]
+
+輸出到 bench/fixtures/：
+- sheet_values.json   ws.get_all_values() 原樣
+- twse_punish.json    TWSE openapi /announcement/punish
+- tpex_openapi.json   TPEx openapi tpex_disposal_information
+- tpex_aadata.json    TPEx 舊 aaData 端點
+- yf_history.csv      yf.download(period=3mo) 的第一檔 (欄位 Date,Open,High,Low,Close,Volume)
+"""
+import argparse
+import ast
+import json
+import os
+
+import requests
+import urllib3
+import yfinance as yf
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "fixtures")
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+SOURCES = {
+    "twse_punish.json": "https://openapi.twse.com.tw/v1/announcement/punish",
+    "tpex_openapi.json": "https://www.tpex.org.tw/openapi/v1/tpex_disposal_information",
+    "tpex_aadata.json": "https://www.tpex.org.tw/web/bulletin/disposal_information/disposal_information_result.php?l=zh-tw&o=json",
+}
+
+
+def _dump(name, payload):
+    with open(os.path.join(FIXTURES, name), "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1)
+    print(f"✅ {name}")
+
+
+def record_http():
+    for name, url in SOURCES.items():
+        res = requests.get(url, headers=HEADERS, timeout=15, verify=False)
+        res.raise_for_status()
+        _dump(name, json.loads(res.text.lstrip("\ufeff").strip()))
+
+
+def record_sheet():
+    import gspread
+    cfg = _app_settings("GSHEET_URL", "GSHEET_WORKSHEET")
+    gc = gspread.service_account(filename=os.path.join(os.path.dirname(HERE), "service_key.json"))
+    _dump("sheet_values.json", gc.open_by_url(cfg["GSHEET_URL"]).worksheet(cfg["GSHEET_WORKSHEET"]).get_all_values())
+
+
+def _app_settings(*names):
+    """從 app.py 設定區讀常數 (import app 會直接跑整個頁面，所以用 ast 讀)"""
+    with open(os.path.join(os.path.dirname(HERE), "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    out = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and getattr(node.targets[0], "id", None) in names:
+            out[node.targets[0].id] = ast.literal_eval(node.value)
+    return out
+
+
+def record_yahoo(tickers):
+    df = yf.download(tickers[0], period="3mo", auto_adjust=True, progress=False, multi_level_index=False)
+    df.index.name = "Date"
+    df[['Open', 'High', 'Low', 'Close', 'Volume']].to_csv(os.path.join(FIXTURES, "yf_history.csv"))
+    print("✅ yf_history.csv")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tickers", nargs="+", default=["2330.TW"])
+    ap.add_argument("--skip-sheet", action="store_true")
+    args = ap.parse_args()
+    os.makedirs(FIXTURES, exist_ok=True)
+    record_http()
+    record_yahoo(args.tickers)
+    if not args.skip_sheet:
+        record_sheet()
+
+
+if __name__ == "__main__":
+    main()
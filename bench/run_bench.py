@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+離線 benchmark：用 bench/fixtures 錄製資料重播所有上游，量測
+- fetch_data_from_sheet          (整張下載 / 版本沒變 / 快照命中)
+- fetch_all_disposition_stocks   (冷載入 / 快照命中)
+- fetch_chart_data               (單檔冷載入；整頁預抓：無本地快取 / 有本地快取 / 快照命中)
+- run_warning_page 整頁 render   (K 線點選才載入 / 預抓本頁 K 線)
+每項在 10/100/1000 檔下各量一次。
+
+用法：
+  python bench/run_bench.py                          # 全部跑，印表格
+  python bench/run_bench.py --sizes 10 100 --latency-ms 50
+  python bench/run_bench.py --save base.json         # 存結果
+  python bench/run_bench.py --compare base.json      # 任一項比基準慢超過 --tolerance 就 exit 1
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import stand_ins  # noqa: E402
+
+
+def _timed(fn, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup: setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def bench_sources(app, up, size, repeat):
+    from snapshot_store import STORE
+    up.set_size(size)
+    codes = [r[0] for r in up.get_all_values()[1:]]
+    cache_dir = os.path.abspath(app.DATA_CACHE_DIR)
+
+    def wipe_disk():
+        STORE.clear('chart')
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def new_sheet_version():
+        STORE.clear('sheet'); up.bump_sheet_version()
+
+    out = {}
+    out['sheet: full download'] = _timed(app.fetch_data_from_sheet, repeat, new_sheet_version)
+    out['sheet: unchanged check'] = _timed(app.fetch_data_from_sheet, repeat, lambda: STORE.clear('sheet'))
+    out['sheet: snapshot hit'] = _timed(app.fetch_data_from_sheet, repeat)
+    out['disposition: cold'] = _timed(app.fetch_all_disposition_stocks, repeat, lambda: STORE.clear('disposition'))
+    out['disposition: snapshot hit'] = _timed(app.fetch_all_disposition_stocks, repeat)
+    out['chart: single cold'] = _timed(lambda: app.fetch_chart_data(codes[0]), repeat, wipe_disk)
+    out['chart: prefetch all, no disk cache'] = _timed(lambda: app.prefetch_chart_data(codes), repeat, wipe_disk)
+    out['chart: prefetch all, disk cache'] = _timed(lambda: app.prefetch_chart_data(codes), repeat,
+                                                    lambda: STORE.clear('chart'))
+    out['chart: prefetch all, snapshot hit'] = _timed(lambda: app.prefetch_chart_data(codes), repeat)
+    return out
+
+
+def bench_render(up, size, repeat):
+    from snapshot_store import STORE
+    from streamlit.testing.v1 import AppTest
+    up.set_size(size)
+
+    def cold():
+        STORE.clear(); up.bump_sheet_version()
+
+    def render(prefetch_charts):
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=600)
+        at.run()
+        if prefetch_charts:
+            for cb in at.checkbox:
+                if cb.label == "K 線點選才載入": cb.uncheck()
+            at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+
+    out = {}
+    out['render: cold'] = _timed(lambda: render(False), repeat, cold)
+    out['render: warm rerun'] = _timed(lambda: render(False), repeat)
+    out['render: prefetch page charts'] = _timed(lambda: render(True), repeat, cold)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="每次上游呼叫加的模擬延遲")
+    ap.add_argument("--no-render", action="store_true", help="略過整頁 render (較慢)")
+    ap.add_argument("--save", help="結果存成 JSON")
+    ap.add_argument("--compare", help="與先前存的 JSON 比較")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="允許比基準慢的比例")
+    ap.add_argument("--shared-cache", default="off",
+                    help="STOCK_CACHE_URL (預設 off：量的是單一 process 打上游的成本)")
+    args = ap.parse_args()
+    os.environ["STOCK_CACHE_URL"] = args.shared_cache
+
+    workdir = stand_ins.prepare_workdir(tempfile.mkdtemp(prefix="stock_bench_"))
+    os.chdir(workdir)
+    up = stand_ins.install(latency_ms=args.latency_ms)
+
+    # 裸跑 / AppTest 會噴大量 ScriptRunContext、棄用警告，蓋掉結果表
+    logging.disable(logging.WARNING)
+    import app  # 裸跑模式 import 會順便跑一次頁面，上游已是替身
+
+    results = {}
+    for size in args.sizes:
+        before = dict(up.calls)
+        rows = bench_sources(app, up, size, args.repeat)
+        if not args.no_render:
+            rows.update(bench_render(up, size, args.repeat))
+        calls = {k: up.calls[k] - before[k] for k in up.calls}
+        results[str(size)] = rows
+        print(f"\n=== {size} 檔 (upstream calls: {calls}) ===")
+        for label, ms in rows.items():
+            print(f"{label:<36} {ms:10.2f} ms")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"latency_ms": args.latency_ms, "results": results}, f, ensure_ascii=False, indent=1)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)["results"]
+        worse = []
+        for size, rows in results.items():
+            for label, ms in rows.items():
+                ref = base.get(size, {}).get(label)
+                if ref and ms > ref * (1 + args.tolerance) and ms - ref > 1.0:
+                    worse.append(f"{size} 檔 {label}: {ref:.2f} → {ms:.2f} ms")
+        if worse:
+            print("\n❌ 效能退步：\n" + "\n".join(worse))
+            sys.exit(1)
+        print("\n✅ 沒有超過容許範圍的退步")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+離線上游替身：用 bench/fixtures 的錄製資料取代 Google Sheet、TWSE、TPEx 與 Yahoo
+- 直接替換函式庫進入點 (gspread / requests.Session.get / yf.download)，
+  app.py 不需要為了 benchmark 改任何程式
+- 每次上游呼叫可加固定延遲 (latency_ms) 模擬網路
+- Sheet 可放大到任意檔數 (代號取自 twstock 清單)，用來量 10/100/1000 檔
+"""
+import json
+import os
+import time
+import zlib
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "fixtures")
+
+
+def _read_json(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _universe():
+    """放大 Sheet 用的代號池 (twstock 上市櫃股票)；前面幾列仍沿用錄製資料"""
+    import twstock
+    codes = sorted(c for c, v in twstock.codes.items() if len(c) == 4 and c.isdigit() and v.type == '股票')
+    return [(c, twstock.codes[c].name, twstock.codes[c].market) for c in codes]
+
+
+class _Response:
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self.text = json.dumps(payload, ensure_ascii=False)
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class _Cell:
+    def __init__(self, value):
+        self.value = value
+
+
+class Upstream:
+    """所有替身共用的狀態：fixtures、Sheet 檔數/版本、延遲與呼叫次數"""
+
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.sheet_rows = _read_json("sheet_values.json")
+        self.http = {
+            "openapi.twse.com.tw": _read_json("twse_punish.json"),
+            "openapi/v1/tpex_disposal_information": _read_json("tpex_openapi.json"),
+            "disposal_information_result.php": _read_json("tpex_aadata.json"),
+        }
+        hist = pd.read_csv(os.path.join(FIXTURES, "yf_history.csv"), index_col="Date", parse_dates=True)
+        hist.index = hist.index.tz_localize("Asia/Taipei")
+        self.history = hist
+        self.calls = {"sheet": 0, "http": 0, "yahoo": 0, "yahoo_symbols": 0}
+        self.sheet_version = 0
+        self._sheet = self.sheet_rows
+        self._universe = None
+
+    # ---------- Sheet ----------
+    def set_size(self, n):
+        """Sheet 放大/縮小到 n 檔，並換一個版本 (下次讀取會整張重抓)"""
+        header, template = self.sheet_rows[0], self.sheet_rows[1:]
+        if self._universe is None:
+            self._universe = _universe()
+        code_i, name_i = header.index('代號'), header.index('名稱')
+        market_i = header.index('市場') if '市場' in header else None
+        # 放大的部分只用錄製資料裡沒有的代號，n 檔就是 n 個不同的代號
+        taken = {row[code_i] for row in template[:n]}
+        pool = [u for u in self._universe if u[0] not in taken]
+        if n > len(template) + len(pool):
+            raise ValueError(f"最多只能放大到 {len(template) + len(pool)} 檔")
+        rows = [header]
+        for i in range(n):
+            row = list(template[i % len(template)])
+            if i >= len(template):
+                code, name, market = pool[i - len(template)]
+                row[code_i], row[name_i] = code, name
+                if market_i is not None: row[market_i] = market
+            rows.append(row)
+        self._sheet = rows
+        self.bump_sheet_version()
+
+    def bump_sheet_version(self):
+        self.sheet_version += 1
+
+    def _sleep(self):
+        if self.latency: time.sleep(self.latency)
+
+    def get_all_values(self):
+        self._sleep()
+        self.calls["sheet"] += 1
+        return [list(r) for r in self._sheet]
+
+    # ---------- TWSE / TPEx ----------
+    def http_get(self, url):
+        self._sleep()
+        self.calls["http"] += 1
+        for key, payload in self.http.items():
+            if key in url:
+                return _Response(payload)
+        return _Response({}, status_code=404)
+
+    # ---------- Yahoo ----------
+    def download(self, tickers, start=None, **kw):
+        self._sleep()
+        if isinstance(tickers, str): tickers = tickers.split()
+        self.calls["yahoo"] += 1
+        self.calls["yahoo_symbols"] += len(tickers)
+        base = self.history if start is None else self.history[self.history.index.tz_localize(None) >= pd.Timestamp(start)]
+        frames = {}
+        for t in tickers:
+            scale = 1 + (zlib.crc32(t.encode()) % 50) / 10.0
+            f = base.copy()
+            f[['Open', 'High', 'Low', 'Close']] *= scale
+            frames[t] = f
+        return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+
+
+def install(latency_ms=0.0, size=None):
+    """把替身裝進 gspread / google-auth / requests / yfinance，回傳 Upstream"""
+    import gspread
+    import requests
+    import yfinance as yf
+    from google.oauth2 import service_account
+
+    up = Upstream(latency_ms)
+    if size is not None: up.set_size(size)
+
+    class _Spreadsheet:
+        def get_lastUpdateTime(self):
+            up._sleep()
+            return f"v{up.sheet_version}"
+
+    class _Worksheet:
+        spreadsheet = _Spreadsheet()
+
+        def get_all_values(self):
+            return up.get_all_values()
+
+        def acell(self, a1):
+            return _Cell(f"v{up.sheet_version}")
+
+    class _Client:
+        def open_by_url(self, url):
+            class _Sh:
+                def worksheet(self, name): return _Worksheet()
+            return _Sh()
+
+    gspread.authorize = lambda creds: _Client()
+    gspread.service_account = lambda filename=None, **kw: _Client()
+    service_account.Credentials.from_service_account_info = staticmethod(lambda info, scopes=None: object())
+    requests.Session.get = lambda self, url, *a, **k: up.http_get(url)
+    yf.download = up.download
+    return up
+
+
+def prepare_workdir(path):
+    """app.py 以 cwd 找 service_key.json 與 DATA_CACHE_DIR；放一個假的憑證檔"""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "service_key.json"), "w", encoding="utf-8") as f:
+        f.write("{}")
+    return path
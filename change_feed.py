@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+快照變動偵測
+- 每當 Sheet 或處置名單快照換了一份，跟上一份整表比對一次 (跨 session 共用，同一份只比一次)
+- 變動種類：新上榜、風險升級、最快處置天數縮短、進處置、出關
+- 有變動才遞增版本號；各 session 記住自己看到哪一版，畫面只標出之後的變動
+- 可選擇把每批變動 POST 到本機 webhook (STOCK_ALERT_WEBHOOK)，背景送、失敗只記 metrics
+"""
+import json
+import threading
+import time
+import urllib.request
+
+import pandas as pd
+
+import metrics
+
+JAIL_IN, RISK_UP, DAYS_DROP, NEW, JAIL_OUT = '進處置', '風險升級', '天數縮短', '新上榜', '出關'
+KINDS = (JAIL_IN, RISK_UP, DAYS_DROP, NEW, JAIL_OUT)   # 顯示順序 (越前面越要緊)
+KIND_ICON = {JAIL_IN: '🔒', RISK_UP: '⬆️', DAYS_DROP: '⏩', NEW: '🆕', JAIL_OUT: '🔓'}
+COLUMNS = ['代號', '名稱', '變動', '說明']
+FAR_DAYS = 90   # 與卡片一致：>= 90 顯示「觀察中」
+
+
+def _days_label(d):
+    return "觀察中" if pd.isna(d) or d >= FAR_DAYS else f"{int(d)} 日"
+
+
+def diff_sheet(prev, curr):
+    """兩份 normalize 過的 Sheet 比對；回傳 COLUMNS 欄位的 DataFrame"""
+    cols = ['代號', '名稱', '風險等級', '最快處置天數']
+    m = curr[cols].merge(prev[cols], on='代號', how='left', suffixes=('', '_prev'), indicator=True)
+    new = m['_merge'] == 'left_only'
+    old = m[~new]
+    risk, risk_prev = old['風險等級'].cat.codes, old['風險等級_prev'].astype(old['風險等級'].dtype).cat.codes
+    up = old[risk > risk_prev]
+    drop = old[old['最快處置天數'] < old['最快處置天數_prev']]
+    parts = [
+        pd.DataFrame({'代號': m.loc[new, '代號'], '名稱': m.loc[new, '名稱'], '變動': NEW,
+                      '說明': m.loc[new, '風險等級'].astype(str) + "風險"}),
+        pd.DataFrame({'代號': up['代號'], '名稱': up['名稱'], '變動': RISK_UP,
+                      '說明': up['風險等級_prev'].astype(str) + " → " + up['風險等級'].astype(str)}),
+        pd.DataFrame({'代號': drop['代號'], '名稱': drop['名稱'], '變動': DAYS_DROP,
+                      '說明': [f"{_days_label(a)} → {_days_label(b)}"
+                             for a, b in zip(drop['最快處置天數_prev'], drop['最快處置天數'])]}),
+    ]
+    return pd.concat(parts, ignore_index=True)
+
+
+def diff_jail(prev, curr, names):
+    """prev/curr 為處置中代號的集合；names 為 {代號: 名稱}"""
+    rows = [(c, names.get(c, ''), JAIL_IN, '') for c in sorted(curr - prev)]
+    rows += [(c, names.get(c, ''), JAIL_OUT, '') for c in sorted(prev - curr)]
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def order(changes):
+    """依變動種類的緊急程度、代號排序"""
+    rank = changes['變動'].map({k: i for i, k in enumerate(KINDS)})
+    return changes.assign(_r=rank).sort_values(['_r', '代號'], kind='stable').drop(columns='_r')
+
+
+class ChangeFeed:
+    def __init__(self, webhook=None, keep=50):
+        self.webhook = webhook
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._sheet = None      # 上一份 Sheet 快照 (物件本身，用 identity 判斷換了沒)
+        self._jail_key = None   # (處置名單快照 id, 日期)
+        self._jail = None       # 上一份處置中代號集合
+        self._log = []          # [(version, 時間, changes)]
+        self.version = 0
+
+    def observe(self, sheet, jail_key, jail_codes, names):
+        """
+        每次 rerun 呼叫；快照沒換就直接回傳目前版本 (只做 identity 比較)。
+        第一次看到的快照只當基準，不算變動。names() 回傳 {代號: 名稱}，處置名單有變才會呼叫。
+        """
+        with self._lock:
+            parts = []
+            if sheet is not None and not sheet.empty and sheet is not self._sheet:
+                if self._sheet is not None and not self._sheet.empty:
+                    parts.append(diff_sheet(self._sheet, sheet))
+                self._sheet = sheet
+            if jail_key != self._jail_key:
+                codes = set(jail_codes)
+                if self._jail is not None and codes != self._jail:
+                    parts.append(diff_jail(self._jail, codes, names()))
+                self._jail_key, self._jail = jail_key, codes
+            changes = pd.concat(parts, ignore_index=True) if parts else None
+            if changes is None or changes.empty:
+                return self.version
+            self.version += 1
+            changes = order(changes)
+            self._log.append((self.version, time.time(), changes))
+            del self._log[:-self.keep]
+            version = self.version
+        metrics.inc("snapshot_changes", n=len(changes))
+        if self.webhook:
+            threading.Thread(target=self._notify, args=(version, changes), daemon=True,
+                             name="change-webhook").start()
+        return version
+
+    def since(self, version):
+        """version 之後累積的變動 (同一檔同一種只留最新一筆)"""
+        with self._lock:
+            parts = [c for v, _, c in self._log if v > version]
+        if not parts: return pd.DataFrame(columns=COLUMNS)
+        merged = pd.concat(parts, ignore_index=True).drop_duplicates(['代號', '變動'], keep='last')
+        return order(merged).reset_index(drop=True)
+
+    def _notify(self, version, changes):
+        body = json.dumps({'version': version, 'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                           'changes': changes.to_dict('records')}, ensure_ascii=False).encode()
+        req = urllib.request.Request(self.webhook, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=5) as res:
+                metrics.inc("upstream_requests", source="webhook", status=res.status)
+        except Exception:
+            metrics.inc("upstream_errors", source="webhook", kind="error")
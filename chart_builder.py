@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+K 線圖建構 (3 個月 / 1 年 / 3 年；日 / 週 / 月 K)
+- 週/月 K 由本地日 K 向量化重取樣 (依週期切組後 reduceat)，均線/均量在重取樣後的 K 棒上重算，不另外向 Yahoo 要資料
+- 成交量圖疊上均量線與週轉率 (%)：股本由 Sheet 的目前量 ÷ 週轉率 反推，每根 K 棒的量 ÷ 股本
+- 點數固定：K 棒超過 MAX_BARS 根就把連續幾根合併成一根 (開=第一根開、高=最高、低=最低、收=最後一根收、量=加總)，
+  均線用 LTTB (Largest-Triangle-Three-Buckets) 在原始解析度上挑點，形狀不走樣
+- x 軸用日期軸：未合併時把週末/沒開盤的日子用 rangebreaks 拿掉 (效果同以前的 category 軸)
+- 長區間的均線改用 WebGL (Scattergl)
+- 向量化：量柱顏色 np.where；日期只對畫上去的點轉成 YYYY-MM-DD (payload 比 ISO 時間字串小)
+"""
+import numpy as np
+import pandas as pd
+
+import lazy_deps
+import metrics
+import ohlcv_store
+
+MAX_BARS = 130        # 圖上最多幾根 K 棒 / 均線點數 (約半年日 K；3 年約等於週 K)
+GL_MIN_MONTHS = 12    # 這麼長以上的區間均線用 WebGL
+MA_COLORS = {'MA5': '#00FFFF', 'MA10': '#FFFF00', 'MA20': '#FF00FF', 'MA60': '#00FF00'}
+VOL_MA_COLORS = {'VMA5': '#FFA500', 'VMA20': '#1E90FF'}
+TURNOVER_COLOR = '#BBBBBB'
+UP_COLOR, DOWN_COLOR = '#ff4b4b', '#00da3c'
+TIMEFRAMES = {'日': None, '週': 'W-FRI', '月': 'M'}   # 顯示名稱 → pandas 週期
+
+
+def window(df, months):
+    """最近 months 個月 (以最後一根 K 棒為準)"""
+    if df.empty: return df
+    return df[df.index > df.index[-1] - pd.DateOffset(months=months)]
+
+
+def resample(df, timeframe):
+    """
+    日 K (含 MA) → 指定週期的 K 棒，index 為各週期最後一個交易日 (本週還沒收完也照樣是最後一根)。
+    均線在新週期上重算，另加均量 VMA5/VMA20。
+    """
+    freq = TIMEFRAMES[timeframe]
+    if freq is None:
+        out = df.copy()
+    else:
+        if df.empty: return df
+        period = df.index.to_period(freq).asi8
+        out = ohlcv_store.add_moving_averages(_aggregate(df, np.flatnonzero(np.r_[True, period[1:] != period[:-1]])))
+    for col in VOL_MA_COLORS:
+        out[col] = out['Volume'].rolling(int(col[3:])).mean()
+    return out
+
+
+def ohlc_buckets(df, max_bars=MAX_BARS):
+    """連續 k 根合併成一根 (從最後一根往前分組，最新的一組一定完整)；index 為每組最後一天"""
+    n = len(df)
+    if n <= max_bars: return df
+    k = -(-n // max_bars)
+    starts = np.arange(n % k, n, k)
+    if n % k: starts = np.r_[0, starts]
+    return _aggregate(df, starts)
+
+
+def _aggregate(df, starts):
+    """依各組起點 (已排序的位置) 合併 K 棒：開=第一根、高/低=極值、收=最後一根、量=加總；index 為各組最後一天"""
+    ends = np.r_[starts[1:], len(df)] - 1
+    o, h, l, c = (df[col].to_numpy(dtype='float64') for col in ('Open', 'High', 'Low', 'Close'))
+    v = np.nan_to_num(df['Volume'].to_numpy(dtype='float64'))
+    return pd.DataFrame({'Open': o[starts], 'High': np.fmax.reduceat(h, starts),
+                         'Low': np.fmin.reduceat(l, starts), 'Close': c[ends],
+                         'Volume': np.add.reduceat(v, starts)}, index=df.index[ends])
+
+
+def lttb(y, n_out=MAX_BARS):
+    """Largest-Triangle-Three-Buckets：回傳要保留的位置 (含頭尾)，x 用等距位置"""
+    y = np.asarray(y, dtype='float64')
+    n = len(y)
+    if n_out >= n or n_out < 3: return np.arange(n)
+    x = np.arange(n, dtype='float64')
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)   # 中間 n_out-2 個桶的邊界
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _days(index):
+    return np.datetime_as_string(index.to_numpy(dtype='datetime64[D]'))
+
+
+def _lines(df, cols, n_out):
+    """(欄位, x, y)；K 棒有合併時用 LTTB 降到 n_out 點"""
+    for col in cols:
+        if col not in df.columns: continue
+        line = df[col].dropna()
+        if line.empty: continue
+        if n_out < len(df): line = line.iloc[lttb(line.to_numpy(), n_out)]
+        yield col, _days(line.index), line.to_numpy()
+
+
+@metrics.timed("chart_build")
+def build(df, title, months, daily=True, shares=None):
+    """
+    df 為 resample 過、已截好區間的 K 棒；daily=False (週/月 K) 時不做休市日 rangebreaks。
+    shares 為流通股數 (股)，有給就在成交量圖右軸疊週轉率 (%)。回傳 plotly Figure
+    """
+    go = lazy_deps.load('plotly.graph_objects')
+    make_subplots = lazy_deps.load('plotly.subplots').make_subplots
+    bars = ohlc_buckets(df)
+    merged = len(bars) < len(df)
+    scatter = go.Scattergl if months >= GL_MIN_MONTHS else go.Scatter
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.05,
+                        row_heights=[0.7, 0.3], subplot_titles=(title, '成交量'),
+                        specs=[[{}], [{'secondary_y': True}]])
+    x = _days(bars.index)
+    fig.add_trace(go.Candlestick(x=x, open=bars['Open'], high=bars['High'],
+                                 low=bars['Low'], close=bars['Close'], name='K線',
+                                 increasing_line_color=UP_COLOR, decreasing_line_color=DOWN_COLOR), row=1, col=1)
+    for ma, lx, ly in _lines(df, MA_COLORS, len(bars)):
+        fig.add_trace(scatter(x=lx, y=ly, mode='lines', line=dict(color=MA_COLORS[ma], width=1), name=ma),
+                      row=1, col=1)
+    colors_vol = np.where(bars['Close'].to_numpy() >= bars['Open'].to_numpy(), UP_COLOR, DOWN_COLOR)
+    fig.add_trace(go.Bar(x=x, y=bars['Volume'], marker_color=colors_vol, name='成交量'), row=2, col=1)
+    for ma, lx, ly in _lines(df, VOL_MA_COLORS, len(bars)):
+        fig.add_trace(scatter(x=lx, y=ly, mode='lines', line=dict(color=VOL_MA_COLORS[ma], width=1), name=ma),
+                      row=2, col=1)
+    if shares:
+        fig.add_trace(scatter(x=x, y=np.round(bars['Volume'].to_numpy() / shares * 100, 2), mode='lines',
+                              line=dict(color=TURNOVER_COLOR, width=1, dash='dot'), name='週轉率(%)'),
+                      row=2, col=1, secondary_y=True)
+        fig.update_yaxes(title_text='週轉率%', showgrid=False, row=2, col=1, secondary_y=True)
+
+    fig.update_layout(height=500, template='plotly_dark', xaxis_rangeslider_visible=False,
+                      showlegend=False, margin=dict(l=10, r=10, t=30, b=10))
+    if daily and not merged and len(bars):
+        # 沒開盤的日子 (週末、國定假日) 不留空白
+        closed = pd.bdate_range(bars.index[0], bars.index[-1]).difference(bars.index)
+        fig.update_xaxes(rangebreaks=[dict(bounds=['sat', 'mon']), dict(values=list(_days(closed)))])
+    return fig
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+處置預測引擎 (整表向量化，不再只靠後端寫進 Sheet 的欄位)
+規則 (公布注意交易資訊暨處置作業要點，簡化)：
+- 連續 3 個營業日列注意股 (第一款：累積漲跌幅)
+- 連續 5 個營業日列注意股 (任何款)
+- 最近 10 個營業日內 6 次
+- 最近 30 個營業日內 12 次
+「最快處置天數」= 假設接下來每天都再被列注意，最少還要幾天達到任一門檻 (1 = 今天再列就處置)。
+
+兩種輸入：
+- days_from_counts：Sheet 給的近10/近30/連續天數 (不知道哪天會滾出視窗，是下限估計)
+- days_from_flags ：每日是否列注意的矩陣 (股票 × 日)，視窗滾動精確計算
+警戒價/量由 OHLCV 矩陣一次算：6 日累積漲幅 32% 的收盤價、60 日均量 5 倍。
+"""
+import numpy as np
+import pandas as pd
+
+STREAK_FIRST = 3
+STREAK_ANY = 5
+WINDOWS = ((10, 6), (30, 12))   # (營業日數, 次數門檻)
+HORIZON = 10                    # 超過就當觀察中
+FAR = 99                        # 與 Sheet 相同：99 代表觀察中
+FIRST_CLAUSE_PATTERN = '第一款|漲幅|漲跌幅'
+RISE_DAYS, RISE_LIMIT = 6, 0.32
+VOL_DAYS, VOL_MULT = 60, 5
+
+
+def _finish(days):
+    days = np.maximum(days, 1)
+    return np.where(days > HORIZON, FAR, days).astype('int16')
+
+
+def days_from_counts(cnt10, cnt30, streak, first_clause):
+    """各參數為同長度陣列；回傳 int16 陣列"""
+    cnt10, cnt30, streak = (np.asarray(a, dtype='int32') for a in (cnt10, cnt30, streak))
+    need = np.minimum.reduce([
+        np.where(first_clause, STREAK_FIRST, STREAK_ANY) - streak,
+        WINDOWS[0][1] - cnt10,
+        WINDOWS[1][1] - cnt30,
+    ])
+    return _finish(need)
+
+
+def days_from_flags(flags, first_clause):
+    """
+    flags: (股票數, 天數) bool，最後一欄是最新一天，至少要有 30 欄才準。
+    對 k = 1..HORIZON 計算「再連續 k 天列注意」後的連續天數與各視窗次數，取第一個達標的 k。
+    """
+    flags = np.asarray(flags, dtype=bool)
+    n, t = flags.shape
+    # 連續天數：從最後一天往回數到第一個 False
+    tail = flags[:, ::-1]
+    streak = np.where(tail.all(axis=1), t, np.argmin(tail, axis=1))
+    csum = np.concatenate([np.zeros((n, 1), dtype='int32'), np.cumsum(flags, axis=1, dtype='int32')], axis=1)
+
+    def recent(m):
+        """最近 m 天 (m<=0 回 0) 的次數"""
+        m = min(max(m, 0), t)
+        return csum[:, t] - csum[:, t - m]
+
+    streak_limit = np.where(first_clause, STREAK_FIRST, STREAK_ANY)
+    days = np.full(n, HORIZON + 1, dtype='int32')
+    for k in range(HORIZON, 0, -1):
+        hit = streak + k >= streak_limit
+        for window, limit in WINDOWS:
+            hit |= recent(window - k) + min(k, window) >= limit
+        days = np.where(hit, k, days)
+    return _finish(days)
+
+
+def risk_level(days):
+    """天數 → 風險等級 (與卡片邏輯一致：2 天內高、5 天內中)"""
+    days = np.asarray(days)
+    return np.select([days <= 2, days <= 5], ['高', '中'], '低')
+
+
+def first_clause_mask(trigger):
+    return pd.Series(trigger, dtype='string').fillna('').str.contains(FIRST_CLAUSE_PATTERN, regex=True).to_numpy()
+
+
+def predict(df, flags=None):
+    """
+    df 為 normalize 過的 Sheet；flags 為可選的 {代號: 每日是否列注意 (bool 陣列)}。
+    有完整每日紀錄的代號用精確算法，其餘用 Sheet 的次數。回傳 (推算天數, 推算風險) 兩個 Series。
+    """
+    first = first_clause_mask(df['觸發條件']) if '觸發條件' in df.columns else np.zeros(len(df), bool)
+    days = days_from_counts(df['近10日注意次數'], df['近30日注意次數'], df['連續天數'], first)
+    if flags:
+        codes = df['代號'].to_numpy()
+        rows = [i for i, c in enumerate(codes) if c in flags]
+        if rows:
+            width = max(len(flags[codes[i]]) for i in rows)
+            matrix = np.zeros((len(rows), width), dtype=bool)
+            for j, i in enumerate(rows):
+                f = flags[codes[i]]
+                matrix[j, width - len(f):] = f
+            days[rows] = days_from_flags(matrix, first[rows])
+    return (pd.Series(days, index=df.index, name='推算天數'),
+            pd.Series(pd.Categorical(risk_level(days), categories=['低', '中', '高'], ordered=True),
+                      index=df.index, name='推算風險'))
+
+
+def cross_check(df):
+    """與 Sheet 後端的結果比對；回傳統計 dict"""
+    if df.empty or '推算天數' not in df.columns: return {'checked': 0}
+    sheet_days = df['最快處置天數'].where(df['最快處置天數'] <= HORIZON, FAR)
+    days_ok = sheet_days.to_numpy() == df['推算天數'].to_numpy()
+    risk_ok = df['風險等級'].astype(str).to_numpy() == df['推算風險'].astype(str).to_numpy()
+    return {'checked': len(df), 'days_match': int(days_ok.sum()), 'risk_match': int(risk_ok.sum())}
+
+
+def _tails(series_list, width):
+    """每檔各自 dropna 後的最後 width 筆靠右排成 (股票 × width) 矩陣，不足補 NaN (各檔最後一根日期不同也不會錯位)"""
+    matrix = np.full((len(series_list), width), np.nan)
+    for j, s in enumerate(series_list):
+        tail = s.dropna().to_numpy(dtype='float64')[-width:]
+        if len(tail): matrix[j, width - len(tail):] = tail
+    return matrix
+
+
+def alert_levels(bars):
+    """
+    bars: {代號: OHLCV DataFrame}。每檔取自己的最後幾根，整批排成矩陣後一次算：
+    - 警戒價：收盤達到這個價，6 日累積漲幅就到 32%
+    - 警戒量 (張)：60 日均量的 5 倍 (Yahoo 量為股數，/1000 換成張)
+    """
+    bars = {c: b for c, b in bars.items() if b is not None and not b.empty}
+    if not bars: return pd.DataFrame(columns=['推算警戒價', '推算警戒量'])
+    c = _tails([b['Close'] for b in bars.values()], RISE_DAYS)
+    v = _tails([b['Volume'] for b in bars.values()], VOL_DAYS)
+    base = c[:, 0]   # 不足 RISE_DAYS 根時為 NaN
+    n = (~np.isnan(v)).sum(axis=1)
+    vol_avg = np.where(n > 0, np.nansum(v, axis=1) / np.maximum(n, 1), np.nan)
+    return pd.DataFrame({'推算警戒價': np.round(base * (1 + RISE_LIMIT), 2),
+                         '推算警戒量': np.round(vol_avg * VOL_MULT / 1000)},
+                        index=list(bars))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+處置期間區間索引
+- 起迄日建成 pandas IntervalIndex (底層是 interval tree)，
+  「某日處置中」查詢為 O(log n + k)
+- 迄日另外排序，「N 個營業日內出關」用二分搜尋
+- 同一檔的前一次迄日預先算好，「出關後再次進處置」不用回頭掃
+營業日只排除週末 (國定假日未計入)。
+"""
+import numpy as np
+import pandas as pd
+
+TABLE_COLS = ['市場', '代號', '名稱', '處置期間', '處置措施', '起日', '迄日']
+
+
+def _busday_offset(d, n):
+    return pd.Timestamp(np.busday_offset(np.datetime64(d.date(), 'D'), n, roll='forward'))
+
+
+class DispositionIndex:
+    def __init__(self, table):
+        table = table if not table.empty else pd.DataFrame(columns=TABLE_COLS)
+        parsed = table.dropna(subset=['起日', '迄日'])
+        t = parsed.sort_values(['代號', '起日'], kind='stable').reset_index(drop=True)
+        t['前次迄日'] = t.groupby('代號')['迄日'].shift()
+        self.table = t
+        self.errors = []  # 抓取時的非致命錯誤 (例如只有一邊市場失敗)
+        # 解析不到期間的列：無法判斷，視為處置中 (避免整批 TPEx 被濾掉)
+        self.unparsed = table[table['起日'].isna() | table['迄日'].isna()].reset_index(drop=True)
+
+        # 一律用 ns：從共用快取 (parquet) 讀回來的是 ms，查詢日期又是 s，解析度不同 IntervalIndex 不給比
+        self._intervals = pd.IntervalIndex.from_arrays(
+            pd.DatetimeIndex(t['起日']).as_unit('ns'), pd.DatetimeIndex(t['迄日']).as_unit('ns'), closed='both')
+        ends = t['迄日'].to_numpy(dtype='datetime64[ns]')
+        self._end_order = np.argsort(ends, kind='stable')
+        self._ends_sorted = ends[self._end_order]
+
+    def __len__(self):
+        return len(self.table) + len(self.unparsed)
+
+    def active_on(self, d):
+        """d 當天處置中的區間 (不含解析不到期間的列)"""
+        if self.table.empty: return self.table
+        pos, _ = self._intervals.get_indexer_non_unique(pd.DatetimeIndex([pd.Timestamp(d)]).as_unit('ns'))
+        pos = np.sort(pos[pos >= 0])
+        return self.table.iloc[pos]
+
+    def releasing_within(self, d, n_days):
+        """迄日落在 [d, d + n_days 個營業日] 的區間，附「剩餘營業日」"""
+        d = pd.Timestamp(d)
+        stop = _busday_offset(d, n_days)
+        lo = np.searchsorted(self._ends_sorted, np.datetime64(d), side='left')
+        hi = np.searchsorted(self._ends_sorted, np.datetime64(stop), side='right')
+        out = self.table.iloc[self._end_order[lo:hi]].copy()
+        out['剩餘營業日'] = np.busday_count(
+            np.datetime64(d.date(), 'D'), out['迄日'].to_numpy(dtype='datetime64[D]'))
+        return out
+
+    def reentries(self, d):
+        """d 當天處置中、且先前已出關過一次以上 (出關後再次進處置)"""
+        active = self.active_on(d)
+        return active[active['前次迄日'].notna()]
+
+    def jail_status(self, d):
+        """
+        以代號為 index 的處置狀態表 (迄日、處置措施)，給預警頁用 join。
+        解析不到期間的列也算處置中，迄日為 NaT。
+        """
+        active = pd.concat([self.active_on(d), self.unparsed], ignore_index=True)
+        if active.empty:
+            return pd.DataFrame(columns=['迄日', '處置措施'], index=pd.Index([], name='代號'))
+        active = active.sort_values('迄日', na_position='first').drop_duplicates('代號', keep='last')
+        return active.set_index('代號')[['迄日', '處置措施']]
+
+    def current_table(self, d):
+        """d 當天的處置名單 (含解析不到期間的列)，欄位同原本的處置股表"""
+        return pd.concat([self.active_on(d), self.unparsed], ignore_index=True)[TABLE_COLS]
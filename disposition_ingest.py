@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+TWSE / TPEx 處置公告解析 (每份回應只偵測一次欄位格式)
+- 大回應 (>= STREAM_MIN_BYTES) 逐筆解碼 (json raw_decode 走陣列，不先整份轉成 Python list)；
+  小回應整份 json.loads 比較快。頭幾筆拿來偵測格式，編成「欄位 → key / 欄位索引」的對照，之後每筆只取這四格
+- 兩種格式：OpenAPI 的 list[dict] (也接受 {"data": [...]})、舊端點的 {"aaData": [[...], ...]}
+- dict：依候選 key 順序挑第一個存在的；都沒有就從值的樣子多數決猜 (4 碼代號、兩個日期的期間、含「分鐘」的措施)
+- list：同樣從值的樣子多數決決定欄位索引 (名稱取代號之後第一個文字欄)；
+  少數不符的列 (例如 5 碼代號) 在逐筆解析時才個別丟掉，不會讓整批對不到
+- 只有含 '<' / '&' 的值才跑去 HTML 的 regex
+- 格式跟上一次不同、必要欄位對不上、整批沒有有效列 → metrics schema_drift；對不上時另外回傳可顯示的錯誤訊息
+"""
+import json
+import re
+
+import metrics
+import period_parser
+
+FIELDS = {
+    '代號': ('Code', 'SecuritiesCompanyCode', '證券代號', '代號'),
+    '名稱': ('Name', 'CompanyName', '證券名稱', '名稱'),
+    '期間': ('DispositionPeriod', '處置期間', '處置起迄'),
+    '措施': ('DispositionMeasures', 'DisposalCondition', 'DispositionReasons', '處置措施', '處置內容'),
+}
+REQUIRED = ('代號', '期間')
+ARRAY_KEYS = ('aaData', 'data')   # 外層是 dict 時，資料陣列可能的 key
+SAMPLE_ROWS = 5                   # 偵測格式看前幾筆
+MIN_VOTE = 0.5                    # 樣本中超過這個比例符合才認定是該欄 (混進 5 碼 CB/ETF 等少數列不影響)
+STREAM_MIN_BYTES = 1 << 20        # 小於這個大小直接整份 loads (逐筆解碼每筆有 Python 迴圈成本)
+_TAG = re.compile(r'<[^>]+>')
+_CODE = re.compile(r'\d{4}')
+_NOT_NAME = re.compile(r'[\d\s/\-~～.:]*')   # 純數字/日期的欄位不會是名稱
+_decoder = json.JSONDecoder()
+_last_signature = {}              # source → 上次的格式簽章
+
+
+def clean(v):
+    v = "" if v is None else str(v)
+    if '<' in v or '&' in v:
+        v = _TAG.sub('', v).replace("&nbsp;", " ")
+    return v.strip()
+
+
+def _is_period(v):
+    return period_parser.parse_period(period_parser.normalize(v)) is not None
+
+
+def _is_measure(v):
+    return "分鐘" in v or "分盤" in v
+
+
+# ---------- 逐筆解碼 ----------
+def _skip_ws(text, pos):
+    while pos < len(text) and text[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+
+def _array_of(payload):
+    if isinstance(payload, dict):
+        return next((payload[k] for k in ARRAY_KEYS if isinstance(payload.get(k), list)), [])
+    return payload if isinstance(payload, list) else []
+
+
+def iter_items(text):
+    """回應文字 → 逐筆產生陣列元素。外層是 dict 時找 ARRAY_KEYS 裡的陣列；格式不認得就整份 loads 後照舊處理"""
+    text = text.lstrip('﻿').strip()
+    if len(text) < STREAM_MIN_BYTES:
+        yield from _array_of(json.loads(text)) if text else ()
+        return
+    pos = 0
+    if text[pos] == '{':
+        for key in ARRAY_KEYS:
+            m = re.search(r'"%s"\s*:\s*\[' % key, text)
+            if m:
+                pos = m.end() - 1
+                break
+        else:
+            yield from _array_of(json.loads(text))
+            return
+    if text[pos] != '[':
+        return
+    pos = _skip_ws(text, pos + 1)
+    if pos < len(text) and text[pos] == ']':
+        return
+    while pos < len(text):
+        item, pos = _decoder.raw_decode(text, pos)
+        yield item
+        pos = _skip_ws(text, pos)
+        if pos >= len(text) or text[pos] == ']':
+            return
+        pos = _skip_ws(text, pos + 1)   # 跳過逗號
+
+
+# ---------- 格式偵測 ----------
+class Schema:
+    """kind='records' 時 fields 為 {欄位: (候選 key, ...)}；kind='rows' 時為 {欄位: 欄位索引}"""
+    __slots__ = ('kind', 'fields', 'signature', 'missing')
+
+    def __init__(self, kind, fields, signature):
+        self.kind = kind
+        self.fields = fields
+        self.signature = signature
+        self.missing = [f for f in REQUIRED if fields.get(f) in (None, ())]
+
+
+def _vote(candidates, values_of, pred):
+    """多數決：回傳樣本中符合比例最高且超過 MIN_VOTE 的候選 (同分取前面的)"""
+    best, best_ratio = None, MIN_VOTE
+    for c in candidates:
+        vals = values_of(c)
+        ratio = sum(1 for v in vals if pred(v)) / len(vals)
+        if ratio > best_ratio:
+            best, best_ratio = c, ratio
+    return best
+
+
+def _guess_key(sample, keys, pred):
+    return _vote(keys, lambda k: [clean(r.get(k)) for r in sample], pred)
+
+
+def _detect_records(sample):
+    keys = list(sample[0])
+    fields = {f: tuple(k for k in cands if k in sample[0]) for f, cands in FIELDS.items()}
+    guesses = {'代號': lambda v: bool(_CODE.fullmatch(v)), '期間': _is_period, '措施': _is_measure}
+    for f, pred in guesses.items():
+        if not fields[f]:
+            k = _guess_key(sample, keys, pred)
+            fields[f] = (k,) if k else ()
+    return Schema('records', fields, ('records',) + tuple(sorted(keys)))
+
+
+def _detect_rows(sample):
+    width = max(len(r) for r in sample)
+    cells = [[clean(v) for v in r] + [""] * (width - len(r)) for r in sample]
+    cols = range(width)
+    column = lambda i: [c[i] for c in cells]
+    code = _vote(cols, column, lambda v: bool(_CODE.fullmatch(v)))
+    period = _vote([i for i in cols if i != code], column, _is_period)
+    measure = next((i for i in cols if i not in (code, period) and any(_is_measure(c[i]) for c in cells)), None)
+    text_cols = [i for i in cols if i not in (code, period, measure)
+                 and _vote([i], column, lambda v: bool(v) and not _NOT_NAME.fullmatch(v)) is not None]
+    name = next((i for i in text_cols if code is not None and i > code), text_cols[0] if text_cols else None)
+    fields = {'代號': code, '名稱': name, '期間': period, '措施': measure}
+    return Schema('rows', fields, ('rows', width) + tuple(fields.values()))
+
+
+def detect(sample):
+    """頭幾筆 → Schema；認不得的格式回傳 None"""
+    if sample and all(isinstance(r, dict) for r in sample):
+        return _detect_records(sample)
+    if sample and all(isinstance(r, list) and r for r in sample):
+        return _detect_rows(sample)
+    return None
+
+
+# ---------- 解析 ----------
+def _records_parser(fields):
+    def getter(keys):
+        if len(keys) == 1:   # 常見情況：每個欄位只有一個 key 在回應裡
+            k = keys[0]
+            return lambda item: clean(item.get(k))
+        return lambda item: clean(next((v for v in map(item.get, keys) if v), None))
+    code, name, period, measure = (getter(fields[f]) for f in FIELDS)
+    return lambda item: (code(item), name(item), period(item), measure(item))
+
+
+def _rows_parser(fields):
+    code_i, name_i, period_i, measure_i = (fields[f] for f in FIELDS)
+
+    def cell(row, i):
+        return clean(row[i]) if i is not None and i < len(row) else ""
+
+    def parse(row):
+        # 措施欄認不得時退回整列字串 (舊做法)，照樣能判斷 5/20 分鐘
+        measure = cell(row, measure_i) if measure_i is not None else " ".join(clean(v) for v in row)
+        return cell(row, code_i), cell(row, name_i), cell(row, period_i), measure
+    return parse
+
+
+def parse(text, source):
+    """
+    回應文字 → ([(代號, 名稱, 期間字串, 措施字串)], 錯誤訊息或 None)。
+    只留 4 碼代號的列；格式偵測與漂移紀錄見模組說明。
+    """
+    items = iter_items(text)
+    sample = []
+    for item in items:
+        sample.append(item)
+        if len(sample) >= SAMPLE_ROWS: break
+    if not sample:
+        return [], None
+    schema = detect(sample)
+    if schema is None or schema.missing:
+        metrics.inc("schema_drift", source=source, kind="unmapped")
+        what = "、".join(schema.missing) if schema else "未知的資料格式"
+        keys = list(sample[0])[:12] if isinstance(sample[0], dict) else f"{len(sample[0])} 欄"
+        return [], f"{source} 欄位格式變了，對不到：{what} ({keys})"
+    prev = _last_signature.get(source)
+    if prev is not None and prev != schema.signature:
+        metrics.inc("schema_drift", source=source, kind="changed")
+    _last_signature[source] = schema.signature
+
+    row_parser = _records_parser(schema.fields) if schema.kind == 'records' else _rows_parser(schema.fields)
+    out, skipped = [], 0
+    for item in _chain(sample, items):
+        try:
+            rec = row_parser(item)
+        except (AttributeError, TypeError):
+            skipped += 1
+            continue
+        if len(rec[0]) == 4 and rec[0].isdigit():
+            out.append(rec)
+        else:
+            skipped += 1
+    metrics.inc("ingest_rows", n=len(out), source=source, result="ok")
+    if skipped: metrics.inc("ingest_rows", n=skipped, source=source, result="skipped")
+    if not out:
+        # 全部被濾掉 (例如整批都不是 4 碼)：可能是格式變了，也可能真的沒有，只記 metrics
+        metrics.inc("schema_drift", source=source, kind="empty")
+    return out, None
+
+
+def _chain(head, rest):
+    yield from head
+    yield from rest
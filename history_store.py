@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+注意股統計歷史 (本機 SQLite)
+- Sheet 只有「現在」；每次整張重抓後把各檔的關鍵欄位依 (代號, 最近一次日期) 寫進來，
+  同一天盤中多次更新以最後一次為準
+- 主鍵 (code, date) 的 WITHOUT ROWID 表：單檔走勢是主鍵範圍查詢；
+  另有 date 索引，「今天 vs 前一個交易日」只比對兩天的列，不掃整個歷史
+"""
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+RISK_SCORE = {'高': 3, '中': 2, '低': 1}
+RISK_LABEL = {v: k for k, v in RISK_SCORE.items()}
+# DataFrame 欄位 → 歷史表欄位
+COLUMNS = {'名稱': 'name', '風險等級': 'risk', '最快處置天數': 'days', '近10日注意次數': 'cnt10',
+           '近30日注意次數': 'cnt30', '連續天數': 'streak', '目前價': 'price'}
+
+
+class HistoryStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS attention (
+                code TEXT NOT NULL, date TEXT NOT NULL, name TEXT, risk INTEGER, days INTEGER,
+                cnt10 INTEGER, cnt30 INTEGER, streak INTEGER, price REAL,
+                PRIMARY KEY (code, date)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS attention_date ON attention(date);
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- 寫入 ----------
+    def append(self, df):
+        """寫入一份 normalize 過的 Sheet；回傳寫入列數 (沒有日期的列略過)"""
+        if df.empty or '最近一次日期' not in df.columns: return 0
+        dates = pd.to_datetime(df['最近一次日期'], errors='coerce')
+        ok = dates.notna()
+        if not ok.any(): return 0
+        part = df.loc[ok]
+        cols = {'code': part['代號'].astype(str), 'date': dates[ok].dt.strftime('%Y-%m-%d')}
+        for src, dst in COLUMNS.items():
+            if src not in part.columns: cols[dst] = None
+            elif dst == 'risk': cols[dst] = part[src].astype(str).map(RISK_SCORE)
+            # float32 先轉字串再轉回，存原本的十進位數字 (240.44 而不是 240.440002)
+            elif part[src].dtype == 'float32': cols[dst] = part[src].astype(str).astype('float64')
+            else: cols[dst] = part[src]
+        rows = pd.DataFrame(cols).astype(object).where(lambda x: x.notna(), None)
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO attention (code, date, name, risk, days, cnt10, cnt30, streak, price) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows.itertuples(index=False, name=None))
+        return len(rows)
+
+    # ---------- 查詢 ----------
+    def _frame(self, sql, params):
+        df = pd.read_sql_query(sql, self._conn(), params=params)
+        if 'date' in df.columns: df['date'] = pd.to_datetime(df['date'])
+        return df
+
+    def flags(self, n_days=30, max_gap_days=5):
+        """
+        最近 n_days 個有紀錄的日期，每檔「當天是否列注意」(連續天數 > 0)：{代號: bool 陣列}。
+        紀錄不滿 n_days 天、或中間漏記超過 max_gap_days 個營業日時回傳 {} (不夠精確就不用)。
+        """
+        dates = [r[0] for r in self._conn().execute(
+            "SELECT DISTINCT date FROM attention ORDER BY date DESC LIMIT ?", (n_days,))][::-1]
+        if len(dates) < n_days: return {}
+        if np.busday_count(dates[0], dates[-1]) + 1 - len(dates) > max_gap_days: return {}
+        df = pd.read_sql_query("SELECT code, date, streak FROM attention WHERE date >= ?",
+                               self._conn(), params=(dates[0],))
+        grid = (df.assign(on=df['streak'] > 0)
+                  .pivot_table(index='code', columns='date', values='on', aggfunc='max')
+                  .reindex(columns=dates).fillna(False).astype(bool))
+        return dict(zip(grid.index, grid.to_numpy()))
+
+    def trend(self, code, limit=120):
+        """單檔最近 limit 筆 (依日期)，主鍵範圍查詢"""
+        df = self._frame("SELECT * FROM (SELECT date, risk, days, cnt10, cnt30, streak, price FROM attention "
+                         "WHERE code=? ORDER BY date DESC LIMIT ?) ORDER BY date", (str(code), limit))
+        return df.set_index('date')
+
+    def movers(self, date=None, limit=20):
+        """
+        date (預設最新一天) 與前一個有資料的日期比較，依「風險升級、最快處置天數縮短、注意次數增加」排序。
+        新出現在名單上的股票前一天欄位為空；只有一天的資料時回傳空表。
+        """
+        conn = self._conn()
+        if date is None:
+            date = conn.execute("SELECT MAX(date) FROM attention").fetchone()[0]
+        if date is None: return pd.DataFrame()
+        prev = conn.execute("SELECT MAX(date) FROM attention WHERE date < ?", (date,)).fetchone()[0]
+        if prev is None: return pd.DataFrame()
+        df = self._frame("""
+            SELECT c.code, c.name, c.risk, c.days, c.cnt10, c.price,
+                   p.risk AS prev_risk, p.days AS prev_days, p.cnt10 AS prev_cnt10
+            FROM attention c LEFT JOIN attention p ON p.code = c.code AND p.date = ?
+            WHERE c.date = ?""", (prev, date))
+        if df.empty: return df
+        df['risk_delta'] = df['risk'] - df['prev_risk'].fillna(0)
+        df['days_delta'] = df['prev_days'].fillna(99) - df['days']
+        df['cnt10_delta'] = df['cnt10'] - df['prev_cnt10'].fillna(0)
+        df = df.sort_values(['risk_delta', 'days_delta', 'cnt10_delta', 'code'],
+                            ascending=[False, False, False, True], kind='stable')
+        df = df[(df['risk_delta'] != 0) | (df['days_delta'] != 0) | (df['cnt10_delta'] != 0)]
+        df.attrs.update(date=date, prev=prev)
+        return df.head(limit).reset_index(drop=True)
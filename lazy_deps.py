@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+重量級相依套件延後載入
+- yfinance / twstock / gspread / google-auth / plotly / requests 只在用到的路徑才 import
+  (處置中股票頁不需要 Sheet 與畫圖那一整套)
+- 第一次真正載入的耗時記在 import_times()，以 gauge 匯出，追冷啟動退步用
+"""
+import importlib
+import sys
+import threading
+import time
+
+HEAVY = ('yfinance', 'twstock', 'gspread', 'google.oauth2.service_account',
+         'plotly.graph_objects', 'plotly.subplots', 'requests')
+
+_lock = threading.Lock()
+_times = {}   # module -> 首次 import 耗時 (ms)
+
+
+def load(name):
+    """import_module 並記錄首次載入耗時；已載入過就是一次 dict lookup"""
+    mod = sys.modules.get(name)
+    # 別的執行緒還在 import 到一半時交給 import_module 等它完成
+    if mod is not None and getattr(getattr(mod, '__spec__', None), '_initializing', False) is False:
+        return mod
+    t0 = time.perf_counter()
+    mod = importlib.import_module(name)
+    record(name, (time.perf_counter() - t0) * 1000)
+    return mod
+
+
+def record(name, ms):
+    """同一個名字只記第一次 (之後的 rerun 都是快取)"""
+    with _lock:
+        _times.setdefault(name, round(ms, 1))
+
+
+def import_times():
+    with _lock:
+        return dict(_times)
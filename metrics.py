@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+熱路徑計時與計數 (process 內共用)
+- timed(stage)：延遲直方圖 (固定 bucket) + 最近樣本 (算 p50/p95)
+- inc(name, **labels)：快取命中/未命中、上游錯誤/逾時等計數
+- register_gauge(name, fn)：即時數值 (Yahoo 排程排隊數、限流次數)
+- 關閉時 (預設) timed 只多一次布林判斷，幾乎零成本
+- 匯出 Prometheus 文字格式：側邊欄下載、寫檔 (METRICS_FILE) 或 HTTP (METRICS_PORT)
+
+環境變數：
+  STOCK_METRICS=1   啟動即開啟
+  METRICS_FILE=路徑  每 METRICS_FILE_SEC 秒寫一次 (給 node_exporter textfile collector)
+  METRICS_PORT=9108 起一個 /metrics HTTP 端點 (沒有驗證，預設只聽 127.0.0.1)
+  METRICS_HOST=0.0.0.0  要讓其他機器 (例如遠端 Prometheus) 抓時才明確打開
+"""
+import functools
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+RECENT_SAMPLES = 512
+METRICS_FILE_SEC = 15
+PREFIX = "stock_dashboard"
+
+_enabled = (os.environ.get("STOCK_METRICS", "") not in ("", "0", "false")
+            or bool(os.environ.get("METRICS_FILE")) or bool(os.environ.get("METRICS_PORT")))
+_lock = threading.Lock()
+_hist = {}                      # stage -> {'buckets': [..., +Inf], 'sum', 'count'}
+_recent = defaultdict(lambda: deque(maxlen=RECENT_SAMPLES))
+_counters = defaultdict(int)    # (name, labels tuple) -> n
+_gauges = {}                    # name -> callable 回傳 {stat: 數值}，匯出時才讀
+_exporters_started = False
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(on):
+    global _enabled
+    _enabled = bool(on)
+
+
+def reset():
+    with _lock:
+        _hist.clear(); _recent.clear(); _counters.clear()
+
+
+def observe(stage, ms):
+    with _lock:
+        h = _hist.get(stage)
+        if h is None:
+            h = _hist[stage] = {'buckets': [0] * (len(BUCKETS_MS) + 1), 'sum': 0.0, 'count': 0}
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]: i += 1
+        h['buckets'][i] += 1
+        h['sum'] += ms
+        h['count'] += 1
+        _recent[stage].append(ms)
+
+
+def inc(name, n=1, **labels):
+    if not _enabled or not n: return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] += n
+
+
+def register_gauge(name, fn):
+    """登記即時數值 (排隊數等)；fn() 回傳 dict，匯出時呼叫"""
+    with _lock:
+        _gauges[name] = fn
+
+
+def timed(stage):
+    """裝飾器：開啟時記錄耗時 (ms)，例外也會記一筆並計入 errors"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                inc("stage_errors", stage=stage)
+                raise
+            finally:
+                observe(stage, (time.perf_counter() - t0) * 1000)
+        return wrapper
+    return deco
+
+
+# ---------- 查詢 ----------
+def _quantile(samples, q):
+    if not samples: return None
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def summary():
+    """給側邊欄看的：每個 stage 的次數、平均、p50、p95 (最近樣本)"""
+    with _lock:
+        rows = []
+        for stage, h in sorted(_hist.items()):
+            recent = list(_recent[stage])
+            rows.append({
+                'stage': stage, 'count': h['count'],
+                'avg_ms': h['sum'] / h['count'] if h['count'] else 0.0,
+                'p50_ms': _quantile(recent, 0.5), 'p95_ms': _quantile(recent, 0.95),
+            })
+        counters = [{'name': n, 'labels': ", ".join(f"{k}={v}" for k, v in labels), 'value': c}
+                    for (n, labels), c in sorted(_counters.items(), key=lambda kv: (kv[0][0], str(kv[0][1])))]
+    return rows, counters
+
+
+def _fmt_labels(labels):
+    if not labels: return ""
+    body = ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in labels)
+    return "{" + body + "}"
+
+
+def render_prometheus():
+    lines = [f"# TYPE {PREFIX}_stage_latency_ms histogram"]
+    with _lock:
+        for stage, h in sorted(_hist.items()):
+            acc = 0
+            for le, n in zip(list(BUCKETS_MS) + ["+Inf"], h['buckets']):
+                acc += n
+                lines.append(f'{PREFIX}_stage_latency_ms_bucket{{stage="{stage}",le="{le}"}} {acc}')
+            lines.append(f'{PREFIX}_stage_latency_ms_sum{{stage="{stage}"}} {h["sum"]:.3f}')
+            lines.append(f'{PREFIX}_stage_latency_ms_count{{stage="{stage}"}} {h["count"]}')
+        names = sorted({n for n, _ in _counters})
+        for name in names:
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            for (n, labels), v in sorted(_counters.items(), key=lambda kv: str(kv[0])):
+                if n == name:
+                    lines.append(f"{PREFIX}_{name}_total{_fmt_labels(labels)} {v}")
+        gauges = sorted(_gauges.items())
+    for name, fn in gauges:
+        try: values = fn()
+        except Exception: continue
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        for stat, v in sorted(values.items()):
+            lines.append(f'{PREFIX}_{name}{{stat="{stat}"}} {v}')
+    return "\n".join(lines) + "\n"
+
+
+def write_file(path):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+# ---------- 匯出 ----------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404); self.end_headers(); return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_exporters():
+    """依環境變數啟動寫檔/HTTP 匯出，每個 process 只會啟動一次"""
+    global _exporters_started
+    with _lock:
+        if _exporters_started: return
+        _exporters_started = True
+    path = os.environ.get("METRICS_FILE")
+    if path:
+        def loop():
+            while True:
+                time.sleep(METRICS_FILE_SEC)
+                try: write_file(path)
+                except OSError: pass
+        threading.Thread(target=loop, daemon=True, name="metrics-file").start()
+    port = os.environ.get("METRICS_PORT")
+    if port:
+        try:
+            server = ThreadingHTTPServer((os.environ.get("METRICS_HOST", "127.0.0.1"), int(port)), _Handler)
+        except OSError:
+            return  # 多個 process 時只有一個拿得到 port
+        threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+K 線本地快取 (DATA_CACHE_DIR)
+- 每檔一個 parquet，保留歷史 K 棒
+- 只補抓最後一根之後的新 K 棒 (最後一根會重抓一次，盤中會變動)
+- MA5/10/20/60 只重算新增的那一段
+"""
+import os
+import time
+import pandas as pd
+from datetime import datetime, time as dtime, timedelta
+from zoneinfo import ZoneInfo
+
+MA_WINDOWS = (5, 10, 20, 60)
+BAR_COLS = ['Open', 'High', 'Low', 'Close', 'Volume']
+MARKET_CLOSE_SETTLED = dtime(14, 30)  # 13:30 收盤，留一點時間給 Yahoo 結算
+MIN_REFETCH_SEC = 600  # 盤中/假日最短重抓間隔
+TZ = ZoneInfo("Asia/Taipei")
+
+
+def _path(cache_dir, symbol):
+    return os.path.join(cache_dir, f"{symbol}.parquet")
+
+
+def load_bars(cache_dir, symbol):
+    path = _path(cache_dir, symbol)
+    if not os.path.exists(path): return pd.DataFrame()
+    try:
+        return pd.read_parquet(path)
+    except Exception:
+        # 檔案壞掉就當作沒快取，下次整段重抓
+        return pd.DataFrame()
+
+
+def save_bars(cache_dir, symbol, df):
+    """先寫暫存檔再 rename，避免多個 session 同時寫時讀到半個檔"""
+    path = _path(cache_dir, symbol)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp)
+    os.replace(tmp, path)
+
+
+def add_moving_averages(df, start_pos=0):
+    """
+    只重算 start_pos 之後的均線；往前多拿 max(MA_WINDOWS)-1 根當暖身。
+    start_pos=0 等於全部重算。
+    """
+    if df.empty: return df
+    warm = max(0, start_pos - (max(MA_WINDOWS) - 1))
+    close = df['Close'].iloc[warm:]
+    for m in MA_WINDOWS:
+        col = f'MA{m}'
+        if col not in df.columns: df[col] = float('nan')
+        ma = close.rolling(m).mean()
+        df.iloc[start_pos:, df.columns.get_loc(col)] = ma.iloc[start_pos - warm:].to_numpy()
+    return df
+
+
+def merge_bars(cached, fresh):
+    """新資料覆蓋重疊日期 (通常只有最後一根)，其餘往後接，均線只算新增段"""
+    if cached.empty:
+        return add_moving_averages(fresh[BAR_COLS].copy())
+    if fresh.empty:
+        return cached
+    keep = cached[cached.index < fresh.index.min()]
+    merged = pd.concat([keep, fresh[BAR_COLS]])
+    merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+    return add_moving_averages(merged, start_pos=len(keep))
+
+
+def last_session_date(now=None):
+    """最近一個「已開盤」的交易日 (只排除週末，國定假日交給 MIN_REFETCH_SEC 節流)"""
+    now = now or datetime.now(TZ)
+    d = now.date()
+    if now.time() < dtime(9, 0): d -= timedelta(days=1)
+    while d.weekday() >= 5: d -= timedelta(days=1)
+    return d
+
+
+def is_fresh(cache_dir, symbol, df, now=None):
+    """
+    - 最後一根已是最近交易日，且檔案在該日收盤結算後寫入 → 不用再抓
+    - 否則檔案在 MIN_REFETCH_SEC 內寫過 → 先不抓 (盤中、假日節流)
+    """
+    if df.empty: return False
+    now = now or datetime.now(TZ)
+    try:
+        mtime = os.path.getmtime(_path(cache_dir, symbol))
+    except OSError:
+        return False
+    session = last_session_date(now)
+    settled = datetime.combine(session, MARKET_CLOSE_SETTLED, tzinfo=TZ).timestamp()
+    if df.index[-1].date() >= session and mtime >= settled:
+        return True
+    return time.time() - mtime < MIN_REFETCH_SEC
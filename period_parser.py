@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+處置期間解析 (民國/西元皆可)
+- 正規式預先編譯
+- 以原始字串為 key 做有上限的 LRU 快取，同一字串只解析一次
+- parse_period 回傳排好順序的 (起, 迄)，格式化與是否生效都共用這個結果
+"""
+import re
+from datetime import date
+from functools import lru_cache
+
+# 1) 114/12/25、114-12-25、2025.12.25
+_P_SEP = re.compile(r'(\d{2,4})[./-](\d{1,2})[./-](\d{1,2})')
+# 2) 114年12月25日（可無日）
+_P_CJK = re.compile(r'(\d{2,4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日?')
+# 3) 1141223 (7碼純數字，TPEx 常見格式)
+_P_DIGITS = re.compile(r'(\d{3})(\d{2})(\d{2})')
+
+CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def extract_dates(s):
+    """回傳字串裡所有合法日期 (tuple，可安全共用)"""
+    hits = _P_SEP.findall(s) + _P_CJK.findall(s) + _P_DIGITS.findall(s)
+    dates = []
+    for y, m, d in hits:
+        try:
+            y = int(y); m = int(m); d = int(d)
+            # 年份判斷：小於 1911 視為民國年；否則視為西元年
+            if y < 1911:
+                y += 1911
+            dates.append(date(y, m, d))
+        except ValueError:
+            pass
+    return tuple(dates)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_period(s):
+    """取前兩個日期當區間並確保順序；不足兩個日期回傳 None"""
+    ds = extract_dates(s)
+    if len(ds) < 2:
+        return None
+    start, end = ds[0], ds[1]
+    if start > end: start, end = end, start
+    return start, end
+
+
+def to_roc(d):
+    return f"{d.year - 1911}/{d.month:02d}/{d.day:02d}"
+
+
+def normalize(raw):
+    """與舊版 extract_dates_any 相同的前處理，當作快取 key"""
+    return str(raw or "").strip()
+
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+盤中即時報價 (TWSE 基本市況 getStockInfo.jsp，上市/上櫃同一支 API)
+- 一次請求帶多檔：ex_ch=tse_2330.tw|otc_6488.tw|...，每批 BATCH_SIZE 檔
+- 快照 key 直接用 channel 字串 (tse_2330.tw)，市場別在 key 裡，loader 不必再查
+- STOCK_QUOTE_URL 可改指到本機替身 (bench/quote_stub.py)
+"""
+import json
+import os
+
+QUOTE_URL = os.environ.get("STOCK_QUOTE_URL", "https://mis.twse.com.tw/stock/api/getStockInfo.jsp")
+BATCH_SIZE = 50
+MARKET_PREFIX = {'上市': 'tse', '上櫃': 'otc'}
+
+
+def channel(code, market):
+    return f"{MARKET_PREFIX.get(str(market), 'tse')}_{str(code).strip()}.tw"
+
+
+def _num(s):
+    """'-'、空字串、'123.4500' 之類的欄位轉數字"""
+    try:
+        return float(str(s).split('_')[0])
+    except (TypeError, ValueError):
+        return None
+
+
+def parse(payload):
+    """回傳 {channel: {'price', 'volume', 'prev_close', 'time'}}；還沒成交的用最佳買價/昨收頂替"""
+    out = {}
+    for item in (payload or {}).get('msgArray', []):
+        code, ex = item.get('c'), item.get('ex')
+        if not code or not ex: continue
+        prev_close = _num(item.get('y'))
+        price = _num(item.get('z')) or _num(item.get('b')) or prev_close
+        volume = _num(item.get('v'))
+        out[f"{ex}_{code}.tw"] = {'price': price, 'volume': int(volume) if volume is not None else None,
+                                  'prev_close': prev_close, 'time': item.get('t', '')}
+    return out
+
+
+def fetch(get, channels, url=None):
+    """get(url) -> response (app 的 safe_get)。分批請求，回傳 {channel: quote}"""
+    out = {}
+    channels = list(channels)
+    for i in range(0, len(channels), BATCH_SIZE):
+        chunk = channels[i:i + BATCH_SIZE]
+        res = get(f"{url or QUOTE_URL}?ex_ch={'|'.join(chunk)}&json=1&delay=0")
+        if res.status_code != 200: continue
+        try:
+            out.update(parse(json.loads(res.text.lstrip('﻿'))))
+        except ValueError:
+            continue
+    return out
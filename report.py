@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+離線預先產生的處置預警報表 (不開 Streamlit)
+- 資料照 app 的路徑拿：fetch_data_from_sheet、fetch_all_disposition_stocks、prefetch_chart_data
+  (共用快照、本地 K 線快取、Yahoo 排程都一樣)
+- K 線圖用 chart_builder 在多個 worker process 平行建好，輸出成 HTML 片段
+- 輸出 (同一目錄，先寫暫存檔再 rename，讀的人不會拿到寫一半的檔案)：
+    index.html   整頁報表 (圖已內嵌，plotly.min.js 放在同目錄只寫一次)
+    summary.json 名單 + 處置股
+    summary.csv  名單 (utf-8-sig，Excel 直接開)
+開盤/收盤尖峰時讓大部分只看不點的人讀靜態檔，Streamlit 留給要互動的人。
+
+用法：
+  python report.py --out site                  # 產生一次
+  python report.py --out site --every 300      # 每 5 分鐘重產
+  python report.py --out site --workers 4 --limit 100
+"""
+import argparse
+import html
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+import chart_builder
+import lazy_deps
+import period_parser
+
+SUMMARY_COLS = ['代號', '名稱', '市場', '風險等級', '最快處置天數', '推算天數', '目前價', '警戒價', '目前量', '警戒量',
+                '近10日注意次數', '近30日注意次數', '連續天數', '觸發條件', '處置中', '出關日']
+RISK_ICON = {'高': '🔴', '中': '🟡', '低': '🟢'}
+CHART_MONTHS = 3
+PLOTLY_JS = "plotly.min.js"
+
+STYLE = """
+body { background:#0e1117; color:#fafafa; font-family:-apple-system,"Noto Sans TC",sans-serif; margin:24px; }
+h1 { margin-bottom:4px; } .meta { color:#aaa; margin-bottom:16px; }
+table { border-collapse:collapse; font-size:14px; } th, td { border-bottom:1px solid #333; padding:4px 8px; text-align:left; }
+details { border:1px solid #333; border-radius:6px; margin:6px 0; padding:4px 10px; }
+summary { cursor:pointer; font-weight:600; } .jail { color:#ffaaaa; }
+"""
+
+
+# ---------- worker (不 import app，只用 chart_builder) ----------
+def render_chart(job):
+    """job = (代號, 名稱, 日 K DataFrame, 流通股數)；回傳 (代號, HTML 片段)"""
+    code, name, df, shares = job
+    if df is None or df.empty: return code, "<p>⚠️ 無 K 線資料</p>"
+    bars = chart_builder.window(chart_builder.resample(df, '日'), CHART_MONTHS)
+    fig = chart_builder.build(bars, f"{code} {name}", CHART_MONTHS, shares=shares)
+    return code, fig.to_html(full_html=False, include_plotlyjs=False, config={'displaylogo': False})
+
+
+def render_charts(jobs, workers):
+    """worker 數 <= 1 就在本 process 依序建；否則用 spawn 的 process pool (主 process 有背景執行緒，不用 fork)"""
+    if workers <= 1 or len(jobs) <= 1:
+        return dict(map(render_chart, jobs))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        return dict(pool.map(render_chart, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+# ---------- 輸出 ----------
+def _write(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8-sig" if path.endswith(".csv") else "utf-8") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _card(row, chart_html):
+    days = row['最快處置天數']
+    days_str = f"最快 {days} 營業日進處置" if days < 90 else "觀察中"
+    jail = f" <span class='jail'>🔒處置中{' 至 ' + row['出關日'] if row['出關日'] else ''}</span>" if row['處置中'] else ""
+    title = (f"{RISK_ICON.get(row['風險等級'], '')} {html.escape(row['代號'])} {html.escape(row['名稱'])}"
+             f" (現價 {row['目前價']}) | {days_str}{jail}")
+    return f"<details><summary>{title}</summary>{chart_html}</details>"
+
+
+def build_html(summary, dispo, charts, meta):
+    cards = "\n".join(_card(r, charts.get(r['代號'], "")) for r in summary.to_dict('records'))
+    dispo_html = dispo.to_html(index=False, border=0, escape=True) if not dispo.empty else "<p>目前沒有處置股。</p>"
+    return f"""<!DOCTYPE html>
+<html lang="zh-Hant"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>處置股預警 {meta['data_date']}</title>
+<script src="{PLOTLY_JS}"></script><style>{STYLE}</style></head>
+<body>
+<h1>⚠️ 處置股預警機</h1>
+<div class="meta">資料日期：{meta['data_date']} | 產生時間：{meta['generated_at']} | 名單 {len(summary)} 檔 | 處置中 {len(dispo)} 檔</div>
+<h2>📋 潛在風險名單</h2>
+{cards}
+<h2>🔒 處置中股票</h2>
+{dispo_html}
+</body></html>
+"""
+
+
+def build_summary(records, jail_status):
+    """page_records 轉出的名單 + 處置狀態 → 報表用的表 (欄位固定)"""
+    page = pd.DataFrame(records)
+    release = page['代號'].map(jail_status['迄日'])
+    page['處置中'] = page['代號'].isin(jail_status.index)
+    page['出關日'] = [period_parser.to_roc(d) if pd.notna(d) else "" for d in release]
+    return page.reindex(columns=SUMMARY_COLS)
+
+
+def generate(app, out_dir, workers, limit=None):
+    """產生一次報表；Sheet 讀不到就不動舊檔，回傳 False"""
+    t0 = time.perf_counter()
+    df = app.fetch_data_from_sheet()
+    if df.empty:
+        logging.error("Sheet 沒有資料，保留上一份報表")
+        return False
+    if limit: df = df.head(limit)
+    idx = app.get_disposition_index(show_errors=False)
+    jail_status = idx.jail_status(app.get_today_date())
+    dispo = app.fetch_all_disposition_stocks(idx)
+    records = app.page_records(df)
+    summary = build_summary(records, jail_status)
+
+    bars = app.prefetch_chart_data(tuple(summary['代號']))
+    t1 = time.perf_counter()
+    jobs = [(r['代號'], r['名稱'], bars.get(r['代號']), app.shares_from_row(r)) for r in records]
+    charts = render_charts(jobs, workers)
+    t2 = time.perf_counter()
+
+    last_date = df.iloc[0].get('最近一次日期')
+    meta = {'data_date': last_date.strftime('%Y-%m-%d') if pd.notna(last_date) else '未知',
+            'generated_at': datetime.now(ZoneInfo("Asia/Taipei")).strftime('%Y-%m-%d %H:%M:%S')}
+    os.makedirs(out_dir, exist_ok=True)
+    js = os.path.join(out_dir, PLOTLY_JS)
+    if not os.path.exists(js):
+        _write(js, lazy_deps.load('plotly.offline').get_plotlyjs())
+    _write(os.path.join(out_dir, "summary.csv"), summary.to_csv(index=False))
+    _write(os.path.join(out_dir, "summary.json"), json.dumps(
+        {**meta, 'stocks': summary.to_dict('records'), 'disposition': dispo.to_dict('records')},
+        ensure_ascii=False, default=str))
+    _write(os.path.join(out_dir, "index.html"), build_html(summary, dispo, charts, meta))
+    logging.info("報表 %d 檔：資料 %.1fs、K 線圖 %.1fs (%d workers)、總計 %.1fs",
+                 len(summary), t1 - t0, t2 - t1, workers, time.perf_counter() - t0)
+    return True
+
+
+def main():
+    ap = argparse.ArgumentParser(description="產生靜態處置預警報表")
+    ap.add_argument("--out", default="report", help="輸出目錄")
+    ap.add_argument("--every", type=float, default=0, help="每隔幾秒重產 (0 = 只產一次)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="建 K 線圖的 process 數")
+    ap.add_argument("--limit", type=int, help="只取名單前 N 檔")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    # 裸跑 import app：只要裡面的函式與快照，不畫頁面
+    os.environ["STOCK_HEADLESS"] = "1"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+
+    while True:
+        ok = generate(app, args.out, args.workers, args.limit)
+        if not args.every:
+            return 0 if ok else 1
+        time.sleep(args.every)
+        # 下一輪前先更新 Sheet / 處置名單快照 (走共用快取，其他 replica 剛抓過就不再打上游)
+        for name in ('sheet', 'disposition'):
+            app.STORE.refresh(name, wait=app.REFRESH_WAIT_SEC)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
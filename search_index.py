@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+股票代號 / 名稱搜尋索引 (純字面比對，不走 regex，輸入 "(" 之類也不會炸)
+- 代號：排序好的代號陣列 + 二分搜尋做前綴查詢 (效果同 prefix trie)
+- 名稱：2-gram 倒排索引找子字串；單字或湊不齊時退回單字索引
+  做「字都有出現」的模糊比對 (例：「台電」也找得到「台積電」)
+- 排序：代號完全相同 > 代號前綴 > 名稱開頭 > 名稱包含 > 模糊，同級依代號
+"""
+import bisect
+import threading
+from collections import defaultdict
+
+EXACT, CODE_PREFIX, NAME_PREFIX, NAME_SUB, FUZZY = range(5)
+
+
+def _grams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class SearchIndex:
+    def __init__(self, pairs=()):
+        self._lock = threading.Lock()
+        self._names = {}                  # code -> name
+        self._codes = []                  # 排序好的代號
+        self._bigram = defaultdict(set)   # 2-gram -> codes
+        self._unigram = defaultdict(set)  # 單字 -> codes
+        self.extend(pairs)
+
+    def __len__(self):
+        return len(self._names)
+
+    def extend(self, pairs):
+        """加入 (代號, 名稱)；已經有、名稱也一樣的直接略過"""
+        with self._lock:
+            for code, name in pairs:
+                code, name = str(code).strip(), str(name).strip()
+                if not code: continue
+                old = self._names.get(code)
+                if old == name: continue
+                if old is None:
+                    bisect.insort(self._codes, code)
+                else:
+                    self._unindex(code, old)
+                self._names[code] = name
+                for g in _grams(name, 2): self._bigram[g].add(code)
+                for ch in name: self._unigram[ch].add(code)
+
+    def _unindex(self, code, name):
+        for g in _grams(name, 2): self._bigram[g].discard(code)
+        for ch in name: self._unigram[ch].discard(code)
+
+    def _code_prefix(self, q):
+        lo = bisect.bisect_left(self._codes, q)
+        hi = bisect.bisect_left(self._codes, q + "￿")
+        return self._codes[lo:hi]
+
+    @staticmethod
+    def _intersect(index, keys):
+        sets = sorted((index.get(k, set()) for k in keys), key=len)
+        if not sets: return set()
+        out = set(sets[0])
+        for s in sets[1:]:
+            out &= s
+            if not out: break
+        return out
+
+    def search(self, query, limit=None):
+        """回傳 [(代號, 名稱)]，依相關程度排序"""
+        q = str(query).strip()
+        if not q: return []
+        ranked = {}
+        with self._lock:
+            for code in self._code_prefix(q):
+                ranked[code] = EXACT if code == q else CODE_PREFIX
+            if len(q) >= 2:
+                grams = _grams(q, 2)
+                for code in self._intersect(self._bigram, grams):
+                    name = self._names[code]
+                    if q in name:
+                        ranked.setdefault(code, NAME_PREFIX if name.startswith(q) else NAME_SUB)
+            # 純數字/英文就是在找代號，不做逐字模糊 (不然 "2330" 會配到一堆名稱含 2、3 的)；單一字元照樣找名稱
+            fuzzy = q if not q.isascii() or len(q) == 1 else ""
+            for code in self._intersect(self._unigram, set(fuzzy)):
+                if code in ranked: continue
+                name = self._names[code]
+                ranked[code] = NAME_PREFIX if name.startswith(q) else NAME_SUB if q in name else FUZZY
+            order = sorted(ranked, key=lambda c: (ranked[c], c))
+            if limit is not None: order = order[:limit]
+            return [(c, self._names[c]) for c in order]
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+多個 Streamlit process (多 replica) 共用的快取層，包在 SnapshotStore 的 loader 外面
+- 後端可換：本機 SQLite (同主機/共用磁碟，WAL + 租約鎖) 或 Redis (redis:// URL，需另裝 redis 套件)
+- 每筆資料有 stored_at：fresh_sec 內直接用；過了才打上游。keep_sec 到期才真的刪 (上游掛掉時當備援)
+- 跨 process single-flight：同一個 key 只有拿到租約鎖的 replica 去打上游，其他人輪詢等它寫回來；
+  鎖有租期，持有者掛掉會自動失效
+- SQLite 後端依 max_bytes 以最近存取時間 (LRU) 淘汰；Redis 交給伺服器的 maxmemory 政策
+- 後端本身出錯 (鎖死、Redis 斷線) 一律當作沒命中，直接呼叫原 loader，不影響頁面
+- 值只能是 DataFrame (存 parquet，attrs 一起帶) 或 MISSING；不用 pickle，
+  能寫共用後端的人頂多塞壞資料，不能在每個 replica 上執行程式
+"""
+import importlib
+import io
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+import metrics
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+LOCK_LEASE_SEC = 30      # 租約鎖期限，也是等別人抓資料的上限
+POLL_SEC = 0.2
+TOUCH_SEC = 60           # 最近存取時間的更新間隔，避免每次讀都寫一次
+
+
+class _Missing:
+    """loader 這次沒抓到的 key (例如 Yahoo 沒資料)；在 fresh 期間內不再重打上游"""
+
+
+MISSING = _Missing()
+_TAG_MISSING, _TAG_FRAME = b"M", b"P"
+
+
+def encode(value):
+    """MISSING → 標記；DataFrame → parquet。其他型別不收 (TypeError)"""
+    if value is MISSING: return _TAG_MISSING
+    if not isinstance(value, pd.DataFrame):
+        raise TypeError(f"共用快取只存 DataFrame，收到 {type(value).__name__}")
+    buf = io.BytesIO()
+    value.to_parquet(buf)
+    return _TAG_FRAME + buf.getvalue()
+
+
+def decode(data):
+    data = bytes(data)
+    if data == _TAG_MISSING: return MISSING
+    if data[:1] != _TAG_FRAME: raise ValueError("未知的共用快取格式")
+    return pd.read_parquet(io.BytesIO(data[1:]))
+
+
+class SqliteBackend:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, value BLOB, stored_at REAL, expires_at REAL,
+                size INTEGER, accessed_at REAL);
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed_at);
+            CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT, expires_at REAL);
+        """)
+
+    def _conn(self):
+        """每個執行緒一條連線 (autocommit)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """回傳 (bytes, stored_at)；沒有或已過 keep 期限回傳 None"""
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value, stored_at, expires_at, accessed_at FROM entries WHERE key=?",
+                           (key,)).fetchone()
+        if row is None: return None
+        value, stored_at, expires_at, accessed_at = row
+        if expires_at <= now:
+            conn.execute("DELETE FROM entries WHERE key=? AND expires_at<=?", (key, now))
+            return None
+        if now - accessed_at > TOUCH_SEC:
+            conn.execute("UPDATE entries SET accessed_at=? WHERE key=?", (now, key))
+        return value, stored_at
+
+    def set(self, key, data, keep_sec, stored_at=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                     (key, data, stored_at or now, now + keep_sec, len(data), now))
+        self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes: return
+        conn.execute("DELETE FROM entries WHERE expires_at<=?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes: return
+        freed, victims = 0, []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes: break
+        conn.executemany("DELETE FROM entries WHERE key=?", victims)
+        metrics.inc("shared_cache_evictions", n=len(victims))
+
+    def mark_stale(self, key):
+        self._conn().execute("UPDATE entries SET stored_at=0 WHERE key=?", (key,))
+
+    def try_lock(self, key, lease):
+        """拿到回傳 token，別人持有中 (且未過期) 回傳 None"""
+        now = time.time()
+        token = uuid.uuid4().hex
+        conn = self._conn()
+        conn.execute("""INSERT INTO locks (key, token, expires_at) VALUES (?, ?, ?)
+                        ON CONFLICT(key) DO UPDATE SET token=excluded.token, expires_at=excluded.expires_at
+                        WHERE locks.expires_at < ?""", (key, token, now + lease, now))
+        row = conn.execute("SELECT token FROM locks WHERE key=?", (key,)).fetchone()
+        return token if row and row[0] == token else None
+
+    def unlock(self, key, token):
+        self._conn().execute("DELETE FROM locks WHERE key=? AND token=?", (key, token))
+
+    def stats(self):
+        n, size = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {'entries': n, 'bytes': size, 'max_bytes': self.max_bytes}
+
+
+_UNLOCK_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class RedisBackend:
+    """Redis 相容伺服器；容量上限請設 maxmemory + allkeys-lru，這裡只管 TTL"""
+
+    def __init__(self, url):
+        redis = importlib.import_module('redis')
+        self._r = redis.Redis.from_url(url)
+        self._r.ping()
+
+    def get(self, key):
+        value, stored_at = self._r.hmget(key, 'v', 't')
+        if value is None: return None
+        return value, float(stored_at)
+
+    def set(self, key, data, keep_sec, stored_at=None):
+        pipe = self._r.pipeline()
+        pipe.hset(key, mapping={'v': data, 't': stored_at or time.time()})
+        pipe.expire(key, int(keep_sec))
+        pipe.execute()
+
+    def mark_stale(self, key):
+        if self._r.exists(key): self._r.hset(key, 't', 0)
+
+    def try_lock(self, key, lease):
+        token = uuid.uuid4().hex
+        return token if self._r.set(f"{key}:lock", token, nx=True, px=int(lease * 1000)) else None
+
+    def unlock(self, key, token):
+        self._r.eval(_UNLOCK_LUA, 1, f"{key}:lock", token)
+
+    def stats(self):
+        return {'entries': self._r.dbsize()}
+
+
+class SharedCache:
+    def __init__(self, backend, namespace="stock", keep_sec=86400, lease_sec=LOCK_LEASE_SEC):
+        self.backend = backend
+        self.namespace = namespace
+        self.keep_sec = keep_sec
+        self.lease_sec = lease_sec
+
+    def _key(self, name, key=None):
+        return f"{self.namespace}:{name}" if key is None else f"{self.namespace}:{name}:{key}"
+
+    # ---------- 後端存取 (出錯就當沒命中) ----------
+    def _call(self, op, *args, default=None):
+        try:
+            return getattr(self.backend, op)(*args)
+        except Exception as e:
+            metrics.inc("shared_cache_errors", op=op, kind=type(e).__name__)
+            return default
+
+    def _get(self, key):
+        hit = self._call('get', key)
+        if hit is None: return None
+        try:
+            return decode(hit[0]), hit[1]
+        except Exception as e:
+            metrics.inc("shared_cache_errors", op="decode", kind=type(e).__name__)
+            return None
+
+    def _put(self, key, value):
+        try:
+            data = encode(value)
+        except Exception as e:
+            # 轉不成 parquet 的就不共用，這個 replica 照樣用 loader 的結果
+            metrics.inc("shared_cache_errors", op="encode", kind=type(e).__name__)
+            return
+        self._call('set', key, data, self.keep_sec)
+
+    def _lock(self, key):
+        # 後端壞掉時拿不到鎖也要能動：回傳假 token，等同沒有跨 process 鎖
+        return self._call('try_lock', key, self.lease_sec, default="") if self.backend else ""
+
+    # ---------- 包 loader ----------
+    def wrap(self, name, loader, fresh_sec):
+        """單一值資料集 (Sheet、處置名單表)"""
+        if self.backend is None: return loader
+
+        def load():
+            out = self._load_keys(name, lambda keys: {None: loader()}, [None], fresh_sec, raise_errors=True)
+            return out[None]
+        return load
+
+    def wrap_batch(self, name, loader, fresh_sec):
+        """批次資料集 (K 線)：loader(keys) -> {key: value}"""
+        if self.backend is None: return loader
+        return lambda keys: self._load_keys(name, loader, list(keys), fresh_sec)
+
+    def _load_keys(self, name, loader, keys, fresh_sec, raise_errors=False):
+        now = time.time()
+        out, seen, pending = {}, {}, []
+        for k in keys:
+            hit = self._get(self._key(name, k))
+            if hit is not None and hit[0] is not MISSING: seen[k] = hit
+            if hit is not None and now - hit[1] < fresh_sec:
+                self._accept(out, k, hit[0])
+            else:
+                pending.append(k)
+        if len(keys) > len(pending):
+            metrics.inc("shared_cache", n=len(keys) - len(pending), cache=name, result="hit")
+        deadline = now + self.lease_sec
+        while pending:
+            tokens, done = {}, set()
+            for k in pending:
+                token = self._lock(self._key(name, k))
+                if token is None: continue
+                # 拿到鎖前一刻別人可能剛寫回來，再看一次
+                hit = self._get(self._key(name, k))
+                if hit is not None and time.time() - hit[1] < fresh_sec:
+                    self._accept(out, k, hit[0])
+                    done.add(k)
+                    if token: self._call('unlock', self._key(name, k), token)
+                    continue
+                tokens[k] = token
+            waiting = [k for k in pending if k not in tokens and k not in done]
+            if tokens:
+                metrics.inc("shared_cache", n=len(tokens), cache=name, result="miss")
+                try:
+                    self._fill(name, loader, list(tokens), seen, out, raise_errors)
+                finally:
+                    for k, token in tokens.items():
+                        if token: self._call('unlock', self._key(name, k), token)
+            if not waiting: break
+            # 其他 replica 正在抓：等它寫回來，超過租期就自己抓
+            time.sleep(POLL_SEC)
+            pending = []
+            for k in waiting:
+                hit = self._get(self._key(name, k))
+                if hit is not None and (k not in seen or hit[1] > seen[k][1]):
+                    self._accept(out, k, hit[0])
+                    metrics.inc("shared_cache", cache=name, result="waited")
+                elif time.time() < deadline:
+                    pending.append(k)
+                else:
+                    self._fill(name, loader, [k], seen, out, raise_errors)
+        return out
+
+    @staticmethod
+    def _accept(out, k, value):
+        if value is not MISSING: out[k] = value
+
+    def _fill(self, name, loader, keys, seen, out, raise_errors):
+        """打上游並寫回；失敗時改用舊值 (有的話)，抓不到的寫入 MISSING 讓等待中的 replica 不必重抓"""
+        try:
+            got = loader(keys)
+        except Exception:
+            if raise_errors and not any(k in seen for k in keys): raise
+            got = None
+        for k in keys:
+            if got and k in got:
+                out[k] = got[k]
+                self._put(self._key(name, k), got[k])
+            elif k in seen:
+                out[k] = seen[k][0]
+                metrics.inc("shared_cache", cache=name, result="stale_fallback")
+            elif got is not None:
+                self._put(self._key(name, k), MISSING)
+
+    def mark_stale(self, name, key=None):
+        """手動重新讀取：讓其他 replica 也不要再用這份 (但保留當備援)"""
+        if self.backend is not None: self._call('mark_stale', self._key(name, key))
+
+    def stats(self):
+        if self.backend is None: return {'backend': 'off'}
+        return {'backend': type(self.backend).__name__, **(self._call('stats', default={}) or {})}
+
+
+def from_url(url, sqlite_path, max_bytes=DEFAULT_MAX_BYTES, **kw):
+    """
+    url 空字串 → sqlite_path 的 SQLite；redis:// 或 rediss:// → Redis；off → 關閉 (只用 process 內快照)。
+    Redis 連不上或沒裝 redis 套件時退回 SQLite。
+    """
+    url = (url or "").strip()
+    if url.lower() in ("off", "none", "0"):
+        return SharedCache(None, **kw)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            return SharedCache(RedisBackend(url), **kw)
+        except Exception as e:
+            metrics.inc("shared_cache_errors", op="connect", kind=type(e).__name__)
+    if url.startswith("sqlite:///"):
+        sqlite_path = url[len("sqlite:///"):]
+    return SharedCache(SqliteBackend(sqlite_path, max_bytes), **kw)
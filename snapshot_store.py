@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+跨 session 共用的資料快照 (stale-while-revalidate)
+- 每個資料集 (Sheet、處置名單、K 線) 註冊一個 loader 與 ttl
+- 有快照就立刻回傳上一份成功的結果；過期則丟到背景更新
+- 同一個 key 同時只會有一個 loader 在跑，其他請求等同一份結果 (single-flight)
+- invalidate/refresh 只影響指定資料集，不會像 st.cache_data.clear() 一次清光
+- 背景排程定期更新「最近有人看過」的 key，太久沒人看的直接丟掉
+"""
+import threading
+import time
+
+import metrics
+
+
+class SnapshotUnavailable(Exception):
+    """還沒有任何成功的快照，且這次載入也失敗"""
+
+
+class _Entry:
+    __slots__ = ('value', 'has_value', 'updated_at', 'checked_at', 'error', 'last_access')
+
+    def __init__(self):
+        self.value = None
+        self.has_value = False
+        self.updated_at = 0.0   # 最後一次成功
+        self.checked_at = 0.0   # 最後一次嘗試 (失敗也算，避免一直重打上游)
+        self.error = None
+        self.last_access = time.time()
+
+
+class _Spec:
+    __slots__ = ('loader', 'ttl', 'batch', 'idle_ttl')
+
+    def __init__(self, loader, ttl, batch, idle_ttl):
+        self.loader = loader
+        self.ttl = ttl
+        self.batch = batch
+        self.idle_ttl = idle_ttl
+
+
+class SnapshotStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._specs = {}
+        self._entries = {}
+        self._inflight = {}
+        self._scheduler = None
+
+    # ---------- 註冊 ----------
+    def register(self, name, loader, ttl, batch=False, idle_ttl=None):
+        """
+        batch=False: loader() -> value，key 固定為 None
+        batch=True : loader(keys) -> {key: value}，回傳裡沒有的 key 視為這次沒抓到
+        Streamlit 每次 rerun 都會重新註冊，這裡只更新 loader/ttl，不動既有快照。
+        """
+        with self._lock:
+            self._specs[name] = _Spec(loader, ttl, batch, idle_ttl)
+
+    # ---------- 讀取 ----------
+    def get(self, name, key=None):
+        """回傳快照；沒有快照就同步載入一次，失敗丟 SnapshotUnavailable"""
+        out = self.get_many(name, [key])
+        if key not in out:
+            raise SnapshotUnavailable(self.status(name, key).get('error') or "no data")
+        return out[key]
+
+    def get_many(self, name, keys):
+        """
+        有快照的 key 直接回傳 (過期的丟背景更新)；
+        沒快照的 key 整批同步載入。拿不到資料的 key 不會出現在結果裡。
+        """
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        spec = self._specs[name]
+        missing, stale = [], []
+        with self._lock:
+            for k in keys:
+                e = self._entries.setdefault((name, k), _Entry())
+                e.last_access = now
+                if not e.has_value and e.checked_at == 0.0:
+                    missing.append(k)
+                elif now - e.checked_at >= spec.ttl:
+                    stale.append(k)
+        hits = len(keys) - len(missing) - len(stale)
+        if hits: metrics.inc("cache_requests", n=hits, cache=name, result="hit")
+        if stale: metrics.inc("cache_requests", n=len(stale), cache=name, result="stale")
+        if missing: metrics.inc("cache_requests", n=len(missing), cache=name, result="miss")
+        if missing:
+            self._wait(self._launch(name, missing, background=False))
+        if stale:
+            self._launch(name, stale, background=True)
+        with self._lock:
+            return {k: self._entries[(name, k)].value for k in keys
+                    if self._entries[(name, k)].has_value}
+
+    # ---------- 更新 ----------
+    def refresh(self, name, keys=None, wait=0.0):
+        """
+        立刻在背景更新指定資料集 (預設為已知的全部 key)，可選擇最多等 wait 秒。
+        已在更新中的 key 不會重複打上游。回傳是否在時限內全部完成。
+        """
+        if keys is None:
+            with self._lock:
+                keys = [k for (n, k) in self._entries if n == name] or [None]
+        events = self._launch(name, keys, background=True)
+        return self._wait(events, wait) if wait else False
+
+    def invalidate(self, name, keys=None, wait=0.0):
+        """標記過期並觸發背景更新；舊快照保留到新資料進來為止"""
+        with self._lock:
+            for (n, k), e in self._entries.items():
+                if n == name and (keys is None or k in keys):
+                    e.checked_at = 0.0
+        return self.refresh(name, keys, wait)
+
+    def wait(self, name, timeout):
+        """等指定資料集目前所有更新跑完，最多 timeout 秒"""
+        with self._lock:
+            events = [ev for (n, _), ev in self._inflight.items() if n == name]
+        return self._wait(events, timeout)
+
+    def clear(self, name=None):
+        """直接丟掉快照 (不觸發更新)，給 benchmark/測試重置用"""
+        with self._lock:
+            for nk in [nk for nk in self._entries if name is None or nk[0] == name]:
+                del self._entries[nk]
+
+    def peek_many(self, name, keys):
+        """只看目前已有的快照，不觸發載入、不更新存取時間"""
+        with self._lock:
+            entries = ((k, self._entries.get((name, k))) for k in keys)
+            return {k: e.value for k, e in entries if e is not None and e.has_value}
+
+    def status(self, name, key=None):
+        with self._lock:
+            e = self._entries.get((name, key))
+            inflight = (name, key) in self._inflight
+        if e is None:
+            return {'has_value': False, 'refreshing': inflight}
+        return {'has_value': e.has_value, 'updated_at': e.updated_at or None,
+                'error': e.error, 'refreshing': inflight}
+
+    def _launch(self, name, keys, background):
+        """登記 in-flight；自己負責的 key 馬上 (或背景) 載入，回傳所有相關 key 的 Event"""
+        own, events = [], []
+        with self._lock:
+            for k in keys:
+                ev = self._inflight.get((name, k))
+                if ev is None:
+                    ev = threading.Event()
+                    self._inflight[(name, k)] = ev
+                    own.append(k)
+                events.append(ev)
+        if own:
+            if background:
+                threading.Thread(target=self._run, args=(name, own), daemon=True,
+                                 name=f"snapshot-{name}").start()
+            else:
+                self._run(name, own)
+        return events
+
+    def _run(self, name, keys):
+        spec = self._specs[name]
+        result, error = {}, None
+        try:
+            if spec.batch:
+                result = spec.loader(list(keys)) or {}
+            else:
+                result = {None: spec.loader()}
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        now = time.time()
+        with self._lock:
+            for k in keys:
+                e = self._entries.setdefault((name, k), _Entry())
+                e.checked_at = now
+                if k in result:
+                    e.value, e.has_value, e.updated_at, e.error = result[k], True, now, None
+                else:
+                    e.error = error or "no data"
+                ev = self._inflight.pop((name, k), None)
+                if ev is not None: ev.set()
+
+    @staticmethod
+    def _wait(events, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        for ev in events:
+            left = None if deadline is None else max(0.0, deadline - time.time())
+            if not ev.wait(left):
+                return False
+        return True
+
+    # ---------- 背景排程 ----------
+    def start_scheduler(self, interval=5.0):
+        """每個 process 只會啟動一次"""
+        with self._lock:
+            if self._scheduler is not None and self._scheduler.is_alive():
+                return
+            self._scheduler = threading.Thread(target=self._loop, args=(interval,), daemon=True,
+                                               name="snapshot-scheduler")
+            self._scheduler.start()
+
+    def _loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self._tick()
+            except Exception:
+                pass
+
+    def _tick(self):
+        now = time.time()
+        due = {}
+        with self._lock:
+            for (name, k), e in list(self._entries.items()):
+                spec = self._specs.get(name)
+                if spec is None: continue
+                if spec.idle_ttl and now - e.last_access > spec.idle_ttl:
+                    if (name, k) not in self._inflight:
+                        del self._entries[(name, k)]
+                    continue
+                if now - e.checked_at >= spec.ttl:
+                    due.setdefault(name, []).append(k)
+        for name, keys in due.items():
+            self._launch(name, keys, background=True)
+
+
+STORE = SnapshotStore()
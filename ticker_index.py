@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+代號 → Yahoo 代碼 (.TW / .TWO) 索引
+- 第一次查代號時才從 twstock 建好 (codes 可給 callable 延後載入)，之後查詢只是 dict lookup
+- 處置股資料 (TWSE=上市 / TPEx=上櫃) 帶來的市場別會覆蓋 twstock 的判斷
+- 實際抓到資料的代碼會記下來 (持久化到 DATA_CACHE_DIR)，下次直接用對的後綴
+- 抓不到資料的代碼進入冷卻期，期間內不再問 Yahoo；連續失敗冷卻時間加倍
+"""
+import json
+import os
+import threading
+import time
+
+SUFFIX = {'上市': '.TW', '上櫃': '.TWO'}
+EMPTY_COOLDOWN_SEC = 6 * 3600
+EMPTY_COOLDOWN_MAX_SEC = 3 * 86400
+
+
+def split_symbol(symbol):
+    code, _, suffix = symbol.partition('.')
+    return code, f".{suffix}" if suffix else ""
+
+
+def alternate(symbol):
+    """.TW ↔ .TWO"""
+    code, suffix = split_symbol(symbol)
+    return f"{code}{'.TWO' if suffix == '.TW' else '.TW'}"
+
+
+class TickerIndex:
+    def __init__(self, path=None, codes=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._codes = codes
+        self._base = None     # twstock 推得的後綴 (第一次查詢才建)
+        self._learned = {}    # 處置資料 (TWSE/TPEx) 帶來的後綴，優先於 twstock
+        self._resolved = {}   # 實際抓到資料的後綴 (持久化)
+        self._empty = {}      # symbol -> [冷卻到期時間, 連續失敗次數] (持久化)
+        self._load()
+
+    def _base_suffix(self, code):
+        if self._base is None:
+            codes = self._codes() if callable(self._codes) else (self._codes or {})
+            self._base = {c: SUFFIX.get(getattr(v, 'market', ''), '.TW') for c, v in codes.items()}
+        return self._base.get(code, '.TW')
+
+    # ---------- 持久化 ----------
+    def _load(self):
+        if not self.path or not os.path.exists(self.path): return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._resolved.update(data.get('resolved', {}))
+            self._empty.update({k: list(v) for k, v in data.get('empty', {}).items()})
+        except (OSError, ValueError):
+            pass
+
+    def _save(self):
+        if not self.path: return
+        now = time.time()
+        data = {'resolved': dict(self._resolved),
+                'empty': {k: v for k, v in self._empty.items() if v[0] > now}}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    # ---------- 查詢 ----------
+    def symbol(self, stock_id):
+        code = str(stock_id).strip()
+        with self._lock:
+            suffix = self._resolved.get(code) or self._learned.get(code) or self._base_suffix(code)
+        return f"{code}{suffix}"
+
+    def is_blocked(self, symbol, now=None):
+        with self._lock:
+            hit = self._empty.get(symbol)
+        return bool(hit) and hit[0] > (now or time.time())
+
+    def candidates(self, stock_id):
+        """依序可以嘗試的代碼 (已在冷卻期的略過)"""
+        primary = self.symbol(stock_id)
+        return [s for s in (primary, alternate(primary)) if not self.is_blocked(s)]
+
+    # ---------- 學習 ----------
+    def learn_markets(self, pairs):
+        """(代號, 市場) 來自 TWSE/TPEx 處置資料，比 twstock 內建清單新"""
+        with self._lock:
+            for code, market in pairs:
+                if market in SUFFIX: self._learned[str(code).strip()] = SUFFIX[market]
+
+    def record_success(self, symbols):
+        with self._lock:
+            changed = False
+            for sym in symbols:
+                code, suffix = split_symbol(sym)
+                changed |= self._resolved.get(code) != suffix or sym in self._empty
+                self._resolved[code] = suffix
+                self._empty.pop(sym, None)
+            if changed: self._save()
+
+    def record_empty(self, symbols, now=None):
+        now = now or time.time()
+        with self._lock:
+            for sym in symbols:
+                strikes = (self._empty.get(sym) or [0, 0])[1] + 1
+                cooldown = min(EMPTY_COOLDOWN_SEC * 2 ** (strikes - 1), EMPTY_COOLDOWN_MAX_SEC)
+                self._empty[sym] = [now + cooldown, strikes]
+            if symbols: self._save()
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Yahoo (yfinance) 請求排程
+- token bucket 控制整個 process 的請求速率
+- 429 / 限流 / 整批空結果時指數退避 + jitter 重試，並讓所有人一起暫停
+- 同一檔、同一區間的請求同時只會有一個在下載，其他呼叫等同一份結果 (single-flight)
+- stats() 給側邊欄/metrics 看：排隊數、限流次數、重試、合併次數
+- yf.download 不會丟出個別代號的錯誤，只在結束時 log 到 "yfinance" logger；
+  下載期間掛一個 handler 收集這次呼叫的錯誤，用來分辨「查無資料」與限流/連線失敗
+"""
+import logging
+import random
+import re
+import threading
+import time
+
+import pandas as pd
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """拿到一個 token 為止 (阻塞)，回傳等了幾秒"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """被限流時全體暫停，順便把 token 清空避免一恢復就整批衝出去"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class _Flight:
+    __slots__ = ('event', 'result', 'failed')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class _ErrorCapture(logging.Handler):
+    """下載期間掛在 yfinance logger 上，只收本執行緒 log 的 "['2330.TW', ...]: 訊息"，整理成 {symbol: 訊息}"""
+    _LINE = re.compile(r"^\s*\[(.*?)\]:\s*(.*)$", re.S)
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.thread = threading.get_ident()
+        self.errors = {}
+
+    def emit(self, record):
+        if record.thread != self.thread: return
+        m = self._LINE.match(record.getMessage())
+        if not m: return
+        for sym in re.findall(r"'([^']+)'", m.group(1)):
+            self.errors[sym] = m.group(2)
+
+    def __enter__(self):
+        logging.getLogger("yfinance").addHandler(self)
+        return self
+
+    def __exit__(self, *exc):
+        logging.getLogger("yfinance").removeHandler(self)
+
+
+def _is_no_data(msg):
+    """yf 明確說這檔沒資料 (查無價格 / 可能已下市 / 沒有時區) 才算；沒訊息或其他錯誤都不算"""
+    if not msg: return False
+    msg = msg.lower()
+    return any(k in msg for k in ("no price data", "no data", "delisted", "no timezone", "doesn't exist"))
+
+
+def _is_rate_limited(err):
+    text = f"{type(err).__name__} {err}".lower()
+    return "ratelimit" in text or "rate limit" in text or "too many requests" in text or "429" in text
+
+
+def _split(raw, symbols):
+    """yf.download 多檔結果切成 {symbol: df}，全 NaN 的視為沒資料"""
+    out = {}
+    if raw is None or raw.empty: return out
+    for sym in symbols:
+        if isinstance(raw.columns, pd.MultiIndex):
+            if sym not in raw.columns.get_level_values(0): continue
+            sub = raw[sym].copy()
+        elif len(symbols) == 1:
+            sub = raw.copy()
+        else:
+            continue
+        sub.columns.name = None
+        sub.index.name = 'Date'
+        sub = sub.dropna(how='all')
+        if not sub.empty: out[sym] = sub
+    return out
+
+
+class YahooScheduler:
+    def __init__(self, downloader, rate=2.0, burst=4, max_retries=4, empty_retries=1,
+                 base_backoff=1.0, max_backoff=30.0):
+        self._downloader = downloader
+        self._bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.empty_retries = empty_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._waiting = 0
+        self._stats = {'requests': 0, 'downloads': 0, 'coalesced': 0, 'throttled': 0,
+                       'retries': 0, 'failures': 0}
+
+    def _bump(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'queue_depth': self._waiting, 'inflight': len(self._inflight)}
+
+    def _backoff(self, attempt):
+        delay = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.5)
+
+    def fetch(self, symbols, **span):
+        """
+        回傳 ({symbol: df}, failed)：沒資料的不會出現在 dict 裡；
+        failed 為因限流重試用完 / 下載出錯而沒拿到的代號 (不是 Yahoo 真的沒資料，呼叫端不要當空結果快取)。
+        全部失敗時直接 raise 原本的例外。
+        span 與 yf.download 相同 (period= 或 start=)；其他參數固定為整批、依代號分組。
+        """
+        symbols = list(dict.fromkeys(symbols))
+        span_key = tuple(sorted(span.items()))
+        own, joined = [], []
+        with self._lock:
+            self._stats['requests'] += len(symbols)
+            for sym in symbols:
+                flight = self._inflight.get((sym, span_key))
+                if flight is not None:
+                    joined.append((sym, flight))
+                    self._stats['coalesced'] += 1
+                else:
+                    flight = self._inflight[(sym, span_key)] = _Flight()
+                    own.append(sym)
+
+        out, error, own_failed = {}, None, set()
+        if own:
+            try:
+                out, own_failed = self._download(own, span)
+            except Exception as e:
+                error, own_failed = e, set(own)
+            finally:
+                with self._lock:
+                    for sym in own:
+                        flight = self._inflight.pop((sym, span_key))
+                        flight.result = out.get(sym)
+                        flight.failed = sym in own_failed
+                        flight.event.set()
+        failed = [sym for sym in own if sym in own_failed]
+        for sym, flight in joined:
+            flight.event.wait()
+            if flight.result is not None: out[sym] = flight.result
+            elif flight.failed: failed.append(sym)
+        if error is not None and not out:
+            raise error
+        return out, failed
+
+    def _download(self, symbols, span):
+        attempt = 0
+        while True:
+            with self._lock: self._waiting += 1
+            try:
+                self._bucket.acquire()
+            finally:
+                with self._lock: self._waiting -= 1
+            self._bump('downloads')
+            try:
+                with _ErrorCapture() as capture:
+                    raw = self._downloader(symbols, group_by='ticker', auto_adjust=True,
+                                           threads=True, progress=False, **span)
+                errors = capture.errors
+                throttled = any(_is_rate_limited(Exception(v)) for v in errors.values())
+            except Exception as e:
+                if not _is_rate_limited(e) or attempt >= self.max_retries:
+                    self._bump('failures')
+                    raise
+                throttled, raw, errors = True, None, {}
+            got = _split(raw, symbols)
+            # 整段抓卻整批空白多半是被限流；補抓 (start=) 沒新 K 棒是正常的
+            suspicious = not got and 'start' not in span and attempt < self.empty_retries
+            # 沒拿到又不是 yf 明說「查無資料」的 (被吞掉的限流/連線錯誤、沒有任何訊息) 都算失敗
+            failed = {sym for sym in symbols if sym not in got and not _is_no_data(errors.get(sym))}
+            if not throttled and not suspicious:
+                return got, failed
+            if throttled:
+                self._bump('throttled')
+                if attempt >= self.max_retries:
+                    self._bump('failures')
+                    return got, failed
+            delay = self._backoff(attempt)
+            if throttled: self._bucket.pause(delay)
+            self._bump('retries')
+            time.sleep(delay)
+            attempt += 1